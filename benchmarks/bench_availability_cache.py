@@ -0,0 +1,65 @@
+"""
+Benchmark do cache de disponibilidade do Calendly: latência de CalendlyService.get_available_slots
+sem cache (consulta completa), com cache quente, com entrada vencida (stale-while-revalidate) e
+logo após um agendamento, contra o stand-in local do Calendly. O SchedulingService consulta o
+índice de disponibilidade (ver bench_availability_index).
+
+Uso:
+    python -m benchmarks.bench_availability_cache [--latency-ms 80] [--calls 10000]
+"""
+import argparse
+import os
+import time
+from benchmarks.fake_servers import calendly_api
+
+def timed(func, calls=1):
+    started = time.perf_counter()
+    for _ in range(calls):
+        result = func()
+    return (time.perf_counter() - started) / calls, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--calls", type=int, default=10000)
+    args = parser.parse_args()
+
+    with calendly_api(latency=args.latency_ms / 1000) as server:
+        os.environ.update({
+            "CALENDLY_ACCESS_TOKEN": "bench",
+            "CALENDLY_USER_URI": "https://api.calendly.com/users/USER1",
+            "CALENDLY_BASE_URL": server.base_url,
+        })
+        from src.availability_cache import AvailabilityCache
+        import src.calendly_service as calendly
+        service = calendly.CalendlyService()
+        query = service.get_available_slots
+
+        calendly.availability_cache = AvailabilityCache(metadata_ttl=3600, slots_ttl=3600)
+        before = server.requests
+        cold, slots = timed(query)
+        print(f"sem cache:             {cold * 1000:9.3f} ms  ({server.requests - before} chamadas ao Calendly, {len(slots)} horários)")
+
+        before = server.requests
+        warm, _ = timed(query, args.calls)
+        print(f"cache quente:          {warm * 1000:9.3f} ms  ({server.requests - before} chamadas em {args.calls} consultas)")
+
+        # TTL de horários vencido, dentro da janela de stale: responde na hora e atualiza em segundo plano
+        calendly.availability_cache = cache = AvailabilityCache(metadata_ttl=3600, slots_ttl=0.05, stale_seconds=60)
+        query()
+        time.sleep(0.1)
+        before = server.requests
+        stale, _ = timed(query)
+        time.sleep(args.latency_ms / 1000 * 2)
+        print(f"entrada vencida (SWR): {stale * 1000:9.3f} ms  ({server.requests - before} atualização em segundo plano)")
+
+        server.booked.add(slots[0])
+        cache.invalidate_slots()
+        before = server.requests
+        after_booking, fresh = timed(query)
+        print(f"após agendamento:      {after_booking * 1000:9.3f} ms  ({server.requests - before} chamada; "
+              f"horário reservado {'fora' if slots[0] not in fresh else 'ainda'} na lista, metadados seguem em cache)")
+        print(cache.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark do índice de disponibilidade (src/availability_index.py): custo de uma consulta de
+horários livres conforme cresce o número de intervalos ocupados, comparado à varredura linear
+de todos os intervalos, mais a primeira carga de uma semana contra o stand-in local do Calendly
+e uma reserva incremental (sem nova chamada às agendas).
+
+Uso:
+    python -m benchmarks.bench_availability_index [--sizes 100,1000,10000,100000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from benchmarks.fake_servers import calendly_api
+from src.time_parser import TIMEZONE
+
+def busy_intervals(count, origin, rng):
+    # Compromissos de 15 a 90 minutos espalhados por um ano de expediente
+    intervals = []
+    for _ in range(count):
+        start = origin + timedelta(days=rng.randrange(365), hours=rng.randrange(8, 19), minutes=rng.choice((0, 15, 30, 45)))
+        intervals.append((start, start + timedelta(minutes=rng.choice((15, 30, 60, 90)))))
+    return intervals
+
+def linear_free_slots(intervals, business_hours, start, end, duration):
+    # Referência: para cada horário candidato, confere todos os intervalos ocupados
+    slots = []
+    for window_start, window_end in business_hours.windows(start, end):
+        slot_start = window_start
+        while slot_start + duration <= window_end:
+            slot_end = slot_start + duration
+            if not any(s < slot_end and e > slot_start for s, e in intervals):
+                slots.append((slot_start, slot_end))
+            slot_start += duration
+    return slots
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    args = parser.parse_args()
+
+    from src.availability_index import AvailabilityIndex, BusinessHours, CalendlyBusySource, StaticBusySource
+    rng = random.Random(42)
+    origin = datetime(2026, 1, 5, tzinfo=TIMEZONE)
+    duration = timedelta(minutes=60)
+    hours = BusinessHours()
+
+    print(f"{'ocupados':>9} {'índice (µs)':>12} {'linear (µs)':>12} {'horários':>9}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        intervals = busy_intervals(size, origin, rng)
+        index = AvailabilityIndex([StaticBusySource(intervals)], hours, refresh_seconds=3600)
+        index.free_slots(origin, origin + timedelta(days=365), duration)
+        days = [origin + timedelta(days=rng.randrange(358)) for _ in range(args.queries)]
+
+        started = time.perf_counter()
+        for day in days:
+            slots = index.free_slots(day, day + timedelta(days=7), duration)
+        indexed = (time.perf_counter() - started) / len(days)
+
+        linear_queries = days[:max(1, min(len(days), 200_000 // size))]
+        started = time.perf_counter()
+        for day in linear_queries:
+            expected = linear_free_slots(intervals, hours, day, day + timedelta(days=7), duration)
+        linear = (time.perf_counter() - started) / len(linear_queries)
+        assert index.free_slots(linear_queries[-1], linear_queries[-1] + timedelta(days=7), duration) == expected
+        print(f"{size:>9} {indexed * 1e6:>12.1f} {linear * 1e6:>12.1f} {len(slots):>9}")
+
+    with calendly_api(latency=args.latency_ms / 1000) as server:
+        os.environ.update({"CALENDLY_ACCESS_TOKEN": "bench", "CALENDLY_BASE_URL": server.base_url})
+        from src.calendly_client import CalendlyClient
+        client = CalendlyClient()
+        start = datetime.now(TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        server.booked.add((start + timedelta(days=1, hours=12)).astimezone(timezone.utc).strftime("%Y-%m-%dT%H:00:00Z"))
+        index = AvailabilityIndex([CalendlyBusySource(client, "https://api.calendly.com/users/USER1"),
+                                   StaticBusySource(busy_intervals(50, start, rng))], hours, refresh_seconds=3600)
+
+        before = server.requests
+        started = time.perf_counter()
+        slots = index.free_slots(start, start + timedelta(days=7), duration)
+        print(f"primeira carga (Calendly + agenda local): {(time.perf_counter() - started) * 1000:8.2f} ms "
+              f"({server.requests - before} chamadas ao Calendly, {len(slots)} horários)")
+
+        before = server.requests
+        index.add_busy(*slots[0])
+        started = time.perf_counter()
+        after = index.free_slots(start, start + timedelta(days=7), duration)
+        print(f"após reserva incremental:                 {(time.perf_counter() - started) * 1000:8.2f} ms "
+              f"({server.requests - before} chamadas, {len(slots) - len(after)} horário a menos)")
+        print(index.metrics())
+
+if __name__ == "__main__":
+    main()
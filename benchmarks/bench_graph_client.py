@@ -0,0 +1,61 @@
+"""
+Benchmark do cliente da Graph API: requests.request sem sessão (comportamento antigo)
+contra a sessão compartilhada com pool keep-alive do WhatsAppAPI.
+
+Uso:
+    python -m benchmarks.bench_graph_client [--requests 500] [--threads 8] [--latency-ms 2]
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmarks.fake_servers import graph_api
+
+def send_unpooled(base_url, i):
+    response = requests.request(
+        "POST", f"{base_url}/123/messages",
+        headers={"Authorization": "Bearer x", "Content-Type": "application/json"},
+        json={"messaging_product": "whatsapp", "to": "5511999999999", "type": "text", "text": {"body": str(i)}},
+    )
+    response.raise_for_status()
+    return response.json()
+
+def measure(label, func, total, threads, server):
+    connections_before = server.connections
+    latencies = []
+
+    def timed(i):
+        started = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(timed, range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{label:<12} {total / elapsed:>9.1f} req/s  p50={statistics.median(latencies) * 1000:.2f}ms  "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}ms  "
+          f"conexões={server.connections - connections_before}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with graph_api(latency=args.latency_ms / 1000) as server:
+        os.environ["WHATSAPP_ACCESS_TOKEN"] = "bench"
+        os.environ["WHATSAPP_GRAPH_URL"] = server.base_url
+        from src.whatsapp_api import WhatsAppAPI
+        api = WhatsAppAPI()
+        payload = {"messaging_product": "whatsapp", "to": "5511999999999", "type": "text", "text": {"body": "x"}}
+
+        measure("sem sessão", lambda i: send_unpooled(server.base_url, i), args.requests, args.threads, server)
+        measure("pool", lambda i: api.send_request("POST", "123/messages", payload), args.requests, args.threads, server)
+
+if __name__ == "__main__":
+    main()
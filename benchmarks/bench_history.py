@@ -0,0 +1,72 @@
+"""
+Benchmark da montagem do histórico por resposta: materializar conversation.messages
+(comportamento antigo) contra load_history (janela keyset sobre o índice composto).
+
+Uso:
+    python -m benchmarks.bench_history [--sizes 100,1000,10000,50000] [--repeat 50]
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import insert
+from src.database import db
+from src.history import load_history
+from src.models.conversation import Conversation, Message
+
+def build_app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+def seed(size, phone_number):
+    conversation = Conversation(phone_number=phone_number)
+    db.session.add(conversation)
+    db.session.commit()
+    start = datetime(2024, 1, 1)
+    db.session.execute(insert(Message), [
+        {"conversation_id": conversation.id, "message_type": "user" if i % 2 == 0 else "assistant",
+         "content": f"mensagem {i} " * 8, "timestamp": start + timedelta(seconds=i)}
+        for i in range(size)
+    ])
+    db.session.commit()
+    return conversation.id
+
+def time_per_call(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    app = build_app()
+    print(f"{'mensagens':>10} {'relationship (ms)':>18} {'load_history (ms)':>18}")
+    with app.app_context():
+        for size in (int(s) for s in args.sizes.split(",")):
+            conversation_id = seed(size, f"55{size}")
+
+            def materialize():
+                db.session.expire_all()
+                conversation = db.session.get(Conversation, conversation_id)
+                return [{"role": m.message_type, "content": m.content} for m in conversation.messages]
+
+            def windowed():
+                return load_history(conversation_id)
+
+            old = time_per_call(materialize, max(1, args.repeat // 10))
+            new = time_per_call(windowed, args.repeat)
+            print(f"{size:>10} {old:>18.2f} {new:>18.3f}")
+
+if __name__ == "__main__":
+    main()
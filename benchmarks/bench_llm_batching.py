@@ -0,0 +1,78 @@
+"""
+Benchmark do micro-batching de inferência: vazão e latência com várias conversas
+simultâneas, sem lote e com diferentes combinações de tamanho máximo e espera máxima.
+
+O stand-in do HuggingFace atende poucas requisições por vez (--server-concurrency) e cobra
+uma latência fixa por requisição (--overhead-ms), como uma réplica de modelo com fila.
+
+Uso:
+    python -m benchmarks.bench_llm_batching [--callers 50] [--messages 4] [--overhead-ms 150]
+"""
+import argparse
+import os
+import threading
+import time
+from benchmarks.fake_servers import huggingface_api
+
+CONFIGS = [(None, None), (4, 5), (8, 10), (16, 20), (32, 50), (64, 100)]
+
+def run(service, callers, messages):
+    latencies = []
+    lock = threading.Lock()
+    history = [{"role": "user", "content": "oi"}, {"role": "assistant", "content": "Olá!"}]
+
+    def caller(n):
+        for m in range(messages):
+            text = f"pergunta {n}-{m}-{time.perf_counter_ns()}"
+            started = time.perf_counter()
+            service.process_message(text, history + [{"role": "user", "content": text}])
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=caller, args=(n,)) for n in range(callers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95) - 1]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=4)
+    parser.add_argument("--overhead-ms", type=float, default=150.0)
+    parser.add_argument("--token-delay-ms", type=float, default=2.0)
+    parser.add_argument("--server-concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    server = huggingface_api(token_delay=args.token_delay_ms / 1000, latency=args.overhead_ms / 1000,
+                             concurrency=args.server_concurrency)
+    with server:
+        os.environ.update({
+            "LLM_BACKEND": "huggingface",
+            "HUGGINGFACE_API_KEY": "bench",
+            "HUGGINGFACE_API_URL": f"{server.base_url}/models/gpt2",
+            "LLM_CACHE_SIZE": "1",
+            "LLM_READ_TIMEOUT": "120",
+        })
+        from src.llm_batcher import InferenceBatcher
+        from src.llm_service import CognoxLLMService
+        service = CognoxLLMService()
+
+        print(f"{'lote':>6} {'espera':>8} {'msgs/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'lote médio':>11} {'requisições':>12}")
+        for size, wait_ms in CONFIGS:
+            service.batcher = InferenceBatcher(service.backend, size, wait_ms) if size else None
+            before = server.requests
+            throughput, p50, p95 = run(service, args.callers, args.messages)
+            avg = service.batcher.metrics()["avg_batch_size"] if service.batcher else 1.0
+            label, wait = (str(size), f"{wait_ms:.0f} ms") if size else ("-", "-")
+            print(f"{label:>6} {wait:>8} {throughput:8.1f} {p50 * 1000:9.1f} {p95 * 1000:9.1f} "
+                  f"{avg:11.1f} {server.requests - before:12d}")
+            if service.batcher:
+                service.batcher.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark de tempo até a primeira bolha: resposta completa (process_message) contra
+geração em streaming (stream_message), com o stand-in local do HuggingFace.
+
+Uso:
+    python -m benchmarks.bench_llm_streaming [--token-delay-ms 30] [--paragraphs 4] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import time
+from benchmarks.fake_servers import huggingface_api
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--token-delay-ms", type=float, default=30.0)
+    parser.add_argument("--paragraphs", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with huggingface_api(token_delay=args.token_delay_ms / 1000, paragraphs=args.paragraphs) as server:
+        os.environ.update({
+            "LLM_BACKEND": "huggingface",
+            "HUGGINGFACE_API_KEY": "bench",
+            "HUGGINGFACE_API_URL": f"{server.base_url}/models/gpt2",
+            "LLM_CACHE_SIZE": "1",
+        })
+        from src.llm_service import CognoxLLMService
+        service = CognoxLLMService()
+        history = [{"role": "user", "content": "oi"}, {"role": "assistant", "content": "Olá!"}]
+
+        full, first, total = [], [], []
+        for run in range(args.runs):
+            # Mensagens diferentes a cada rodada para não acertar o cache de respostas
+            turn = history + [{"role": "user", "content": f"pergunta {run}"}]
+            started = time.perf_counter()
+            service.process_message(f"pergunta {run}", turn)
+            full.append(time.perf_counter() - started)
+
+            turn = history + [{"role": "user", "content": f"outra pergunta {run}"}]
+            started = time.perf_counter()
+            for i, _ in enumerate(service.stream_message(f"outra pergunta {run}", turn)):
+                if i == 0:
+                    first.append(time.perf_counter() - started)
+            total.append(time.perf_counter() - started)
+
+    print(f"primeira bolha, resposta completa: {statistics.median(full) * 1000:8.1f} ms")
+    print(f"primeira bolha, streaming:         {statistics.median(first) * 1000:8.1f} ms")
+    print(f"geração completa, streaming:       {statistics.median(total) * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark de inicialização: quanto custa subir um worker.
+
+1. Processos novos importam src.main e chamam create_app(): mede a importação, a criação da
+   aplicação e o primeiro health check, e confere que nenhum serviço foi construído e que o
+   boot não precisa de nenhuma variável além de DATABASE_URL.
+2. Com gunicorn instalado, sobe --workers processos com e sem --preload e mede, por worker,
+   o tempo do fork até o worker estar pronto para atender (hooks post_fork/post_worker_init),
+   além do tempo total até todos os workers estarem prontos.
+
+O schema é criado antes, uma única vez, pelo passo de migração (python -m src.schema).
+
+Uso:
+    python -m benchmarks.bench_startup [--runs 5] [--workers 4]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+started = time.perf_counter()
+import src.main
+imported = time.perf_counter()
+app = src.main.create_app(start_workers=False)
+created = time.perf_counter()
+status = app.test_client().get("/api/whatsapp/health").status_code
+answered = time.perf_counter()
+from src.services import services
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (created - imported) * 1000,
+                  "first_request_ms": (answered - created) * 1000, "health": status, "services": services.status()}))
+"""
+
+GUNICORN_CONFIG = """
+import json, os, time
+bind = "127.0.0.1:{port}"
+loglevel = "warning"
+
+def post_fork(server, worker):
+    worker.bench_forked_at = time.perf_counter()
+
+def post_worker_init(worker):
+    from src.main import start_background_workers
+    start_background_workers(worker.wsgi)
+    with open({log!r}, "a") as f:
+        f.write(json.dumps({{"pid": os.getpid(), "boot_ms": (time.perf_counter() - worker.bench_forked_at) * 1000}}) + "\\n")
+"""
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def cold_boots(env, runs):
+    results = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["process_ms"] = (time.perf_counter() - started) * 1000
+        results.append(result)
+    return results
+
+def gunicorn_boot(env, workers, preload, timeout=60):
+    directory = tempfile.mkdtemp()
+    log = os.path.join(directory, "boot.jsonl")
+    port = free_port()
+    config = os.path.join(directory, "gunicorn_bench.py")
+    with open(config, "w") as f:
+        f.write(GUNICORN_CONFIG.format(port=port, log=log))
+    command = [sys.executable, "-m", "gunicorn", "-c", config, "--workers", str(workers)]
+    if preload:
+        command.append("--preload")
+    command.append("src.main:create_app(start_workers=False)")
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        boots = []
+        while time.perf_counter() - started < timeout:
+            if os.path.exists(log):
+                with open(log) as f:
+                    boots = [json.loads(line) for line in f if line.strip()]
+                if len(boots) >= workers:
+                    break
+            time.sleep(0.01)
+        all_ready = (time.perf_counter() - started) * 1000
+        first = time.perf_counter()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/whatsapp/health", timeout=10) as response:
+            response.read()
+        first_request = (time.perf_counter() - first) * 1000
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return [boot["boot_ms"] for boot in boots], all_ready, first_request
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    # Só o banco: sem tokens da Graph API, do LLM ou do Calendly o boot precisa funcionar igual
+    env = {key: value for key, value in os.environ.items()
+           if not key.startswith(("WHATSAPP_", "HUGGINGFACE_", "OPENAI_", "CALENDLY_", "GOOGLE_"))}
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    env.pop("AUTO_MIGRATE", None)
+
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "src.schema"], cwd=ROOT, env=env, check=True, capture_output=True)
+    print(f"migração (uma vez por deploy): {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    results = cold_boots(env, args.runs)
+    median = lambda key: statistics.median(result[key] for result in results)
+    print(f"\nboot a frio, mediana de {args.runs} processos:")
+    print(f"  import src.main:      {median('import_ms'):8.1f} ms")
+    print(f"  create_app():         {median('create_app_ms'):8.1f} ms")
+    print(f"  primeiro health:      {median('first_request_ms'):8.1f} ms (HTTP {results[-1]['health']})")
+    print(f"  processo inteiro:     {median('process_ms'):8.1f} ms")
+    built = [name for name, ms in results[-1]["services"].items() if ms is not None]
+    print(f"  serviços construídos: {', '.join(built) if built else 'nenhum'}")
+
+    if importlib.util.find_spec("gunicorn") is None:
+        print("\ngunicorn não instalado; medição por worker ignorada.")
+        return
+    print(f"\ngunicorn com {args.workers} workers:")
+    print(f"{'modo':>12} {'boot/worker p50':>16} {'máx':>9} {'todos prontos':>14} {'1º request':>11}")
+    for preload in (False, True):
+        boots, all_ready, first_request = gunicorn_boot(env, args.workers, preload)
+        label = "--preload" if preload else "sem preload"
+        if not boots:
+            print(f"{label:>12} {'-':>16} {'-':>9} {all_ready:11.0f} ms (nenhum worker ficou pronto)")
+            continue
+        print(f"{label:>12} {statistics.median(boots):13.1f} ms {max(boots):6.1f} ms {all_ready:11.0f} ms "
+              f"{first_request:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
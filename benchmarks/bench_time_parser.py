@@ -0,0 +1,122 @@
+"""
+Microbenchmark e corpus de referência do parser de horários (src/time_parser.py).
+
+Primeiro confere cada caso de benchmarks/time_parser_golden.json (relógio fixo) e encerra
+com código 1 se algum divergir; depois mede o custo por texto do parser compilado contra a
+implementação anterior de parse_time_preference (reproduzida abaixo), em textos curtos e em
+mensagens longas, e compara /parse-time chamado texto a texto com o modo em lote.
+
+Uso:
+    python -m benchmarks.bench_time_parser [--rounds 2000] [--check-only]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+from src.time_parser import parse_many, parse_time_expression
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "time_parser_golden.json")
+
+def legacy_parse(time_text):
+    # Implementação anterior: 13 buscas por substring, regex não compiladas e vários datetime.now()
+    time_text = time_text.lower()
+    weekdays = {
+        "segunda": 0, "segunda-feira": 0, "terça": 1, "terça-feira": 1, "quarta": 2, "quarta-feira": 2,
+        "quinta": 3, "quinta-feira": 3, "sexta": 4, "sexta-feira": 4, "sábado": 5, "sabado": 5, "domingo": 6,
+    }
+    time_patterns = [r"(\d{1,2}):(\d{2})", r"(\d{1,2})h(\d{2})", r"(\d{1,2})h", r"(\d{1,2})\s*horas"]
+    result = {}
+    for day_name, day_num in weekdays.items():
+        if day_name in time_text:
+            today = datetime.now()
+            days_ahead = day_num - today.weekday()
+            if days_ahead <= 0:
+                days_ahead += 7
+            result["date"] = (today + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
+            break
+    for pattern in time_patterns:
+        match = re.search(pattern, time_text)
+        if match:
+            hour = int(match.group(1))
+            minute = int(match.group(2)) if len(match.groups()) > 1 else 0
+            if "tarde" in time_text and hour < 12:
+                hour += 12
+            elif "manhã" in time_text and hour > 12:
+                hour -= 12
+            result["time"] = f"{hour:02d}:{minute:02d}"
+            break
+    if "amanhã" in time_text:
+        result["date"] = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    elif "hoje" in time_text:
+        result["date"] = datetime.now().strftime("%Y-%m-%d")
+    elif "próxima semana" in time_text:
+        result["date"] = (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d")
+    return result if result else None
+
+def check_golden(corpus):
+    now = datetime.fromisoformat(corpus["now"])
+    failures = 0
+    for case in corpus["cases"]:
+        got = parse_time_expression(case["text"], now)
+        if got != case["expected"]:
+            failures += 1
+            print(f"DIVERGÊNCIA {case['text']!r}: esperado {case['expected']}, obtido {got}")
+    print(f"corpus de referência: {len(corpus['cases']) - failures}/{len(corpus['cases'])} casos ok")
+    return failures == 0
+
+def bench(label, func, texts, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(texts)
+    per_text = (time.perf_counter() - started) / (rounds * len(texts))
+    print(f"{label:<28} {per_text * 1e6:8.2f} µs/texto")
+    return per_text
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--check-only", action="store_true")
+    args = parser.parse_args()
+
+    with open(GOLDEN, encoding="utf-8") as f:
+        corpus = json.load(f)
+    ok = check_golden(corpus)
+    if args.check_only or not ok:
+        sys.exit(0 if ok else 1)
+
+    texts = [case["text"] for case in corpus["cases"]]
+    messages = [f"Oi Sofia, tudo bem? Eu queria marcar a reunião com vocês, {t}, se for possível." for t in texts]
+    for label, corpus_texts in (("textos curtos", texts), ("mensagens longas", messages)):
+        print(f"-- {label}")
+        legacy = bench("implementação anterior", lambda batch: [legacy_parse(t) for t in batch], corpus_texts, args.rounds)
+        single = bench("parser compilado", lambda batch: [parse_time_expression(t) for t in batch], corpus_texts, args.rounds)
+        batch = bench("parser compilado em lote", parse_many, corpus_texts, args.rounds)
+        print(f"ganho: {legacy / single:.1f}x por texto, {legacy / batch:.1f}x em lote")
+
+    print("-- endpoint /parse-time")
+    bench_endpoint(texts, max(1, args.rounds // 100))
+
+def bench_endpoint(texts, rounds):
+    os.environ.setdefault("WHATSAPP_ACCESS_TOKEN", "bench")
+    from flask import Flask
+    from src.routes.scheduling import scheduling_bp
+    app = Flask(__name__)
+    app.register_blueprint(scheduling_bp, url_prefix="/api/scheduling")
+    client = app.test_client()
+
+    def one_by_one(batch):
+        for text in batch:
+            client.post("/api/scheduling/parse-time", json={"time_text": text or "-"})
+
+    def batched(batch):
+        client.post("/api/scheduling/parse-time", json={"time_texts": batch})
+
+    single = bench("uma requisição por texto", one_by_one, texts, rounds)
+    batch = bench("uma requisição por lote", batched, texts, rounds)
+    print(f"ganho: {single / batch:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Compara os modelos de worker suportados (sync, gthread) com a configuração de produção
+(gunicorn.conf.py + src.wsgi:app), servindo por HTTP de verdade e falando com os stand-ins
+locais da Graph API, do HuggingFace e do Calendly.
+
+Cada cliente mantém uma conexão keep-alive e conversa em turnos, como em
+benchmarks/load_test.py: manda a mensagem, espera a primeira bolha da resposta na Graph API
+falsa e confirma o envio com um callback de status. Parte dos turnos consulta horários livres.
+Relata vazão, latência do 200 do webhook e da resposta, erros e a memória somada do master e
+dos workers.
+
+Com vários processos gravando, prefira Postgres (--database-url); o SQLite padrão serializa
+as escritas.
+
+Uso:
+    python -m benchmarks.bench_worker_models [--clients 64] [--turns 5] [--models sync,gthread]
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from benchmarks.fake_servers import calendly_api, graph_api, huggingface_api
+from benchmarks.load_test import (Inbox, QUESTIONS, TAG_PREFIX, percentile, status_update,
+                                  text_message, webhook)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS = ["sync", "gthread"]
+
+class Client:
+    """
+    Conexão HTTP keep-alive com a aplicação; reconecta se o servidor fechar a conexão.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        try:
+            self.connection.request(method, path, body=data, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            return None
+
+def tree_rss_mb(pid):
+    # Soma o VmRSS do processo e dos descendentes (Linux)
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                stack += [int(child) for child in f.read().split()]
+        except (OSError, StopIteration):
+            continue
+    return total / 1024
+
+def wait_healthy(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn terminou com código {process.returncode}")
+        if Client(port).request("GET", "/api/whatsapp/health") == 200:
+            return
+        time.sleep(0.1)
+    raise RuntimeError("a aplicação não respondeu ao health check a tempo")
+
+def converse(n, model, port, inbox, args, run_id, results, lock):
+    rng = random.Random(args.seed * 100_003 + n)
+    # Telefones distintos por modelo: cada rodada começa com conversas novas
+    phone = f"5511{MODELS.index(model)}{n:07d}"
+    client = Client(port)
+    for turn in range(args.turns):
+        tag = f"{TAG_PREFIX}{model}.{n}.{turn}]"
+        message = text_message(phone, f"wamid.MODEL{run_id}.{n}.{turn}", f"{tag} {rng.choice(QUESTIONS)}")
+        since = time.perf_counter()
+        status = client.request("POST", "/api/whatsapp/webhook", webhook(phone, [message]))
+        ack = time.perf_counter() - since
+        if rng.random() < args.slots_rate:
+            client.request("GET", "/api/scheduling/available-slots?duration=60&limit=5")
+        reply = inbox.wait_reply(phone, tag, since, args.reply_timeout)
+        if reply is not None:
+            client.request("POST", "/api/whatsapp/webhook", webhook(phone, statuses=[status_update(reply[1], phone, "sent")]))
+        with lock:
+            results["acks"].append(ack)
+            if status != 200:
+                results["errors"] += 1
+            if reply is None:
+                results["timeouts"] += 1
+            else:
+                results["replies"].append(reply[0] - since)
+        if args.think_ms:
+            time.sleep(rng.expovariate(1000 / args.think_ms))
+
+def run_model(model, args, env, inbox):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(env, WEB_WORKER_CLASS=model, PORT=str(port), WEB_LOG_LEVEL="warning")
+    if args.workers:
+        env["WEB_CONCURRENCY"] = str(args.workers)
+    process = subprocess.Popen([sys.executable, "-m", "gunicorn", "src.wsgi:app"], cwd=ROOT, env=env)
+    try:
+        wait_healthy(port, process)
+        results = {"acks": [], "replies": [], "errors": 0, "timeouts": 0}
+        lock = threading.Lock()
+        run_id = uuid.uuid4().hex[:8]
+        peak_rss = [tree_rss_mb(process.pid)]
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(0.2):
+                peak_rss[0] = max(peak_rss[0], tree_rss_mb(process.pid))
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        clients = [threading.Thread(target=converse, args=(n, model, port, inbox, args, run_id, results, lock))
+                   for n in range(args.clients)]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+    ms = lambda values, q: percentile(values, q) * 1000 if values else float("nan")
+    return {
+        "model": model,
+        "replies_per_s": len(results["replies"]) / elapsed,
+        "ack_p50_ms": ms(results["acks"], 0.50),
+        "ack_p99_ms": ms(results["acks"], 0.99),
+        "reply_p50_ms": ms(results["replies"], 0.50),
+        "reply_p95_ms": ms(results["replies"], 0.95),
+        "reply_p99_ms": ms(results["replies"], 0.99),
+        "errors": results["errors"],
+        "timeouts": results["timeouts"],
+        "peak_rss_mb": peak_rss[0],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", default=",".join(MODELS))
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=100.0)
+    parser.add_argument("--slots-rate", type=float, default=0.1)
+    parser.add_argument("--reply-timeout", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=None, help="fixa WEB_CONCURRENCY em todos os modelos")
+    parser.add_argument("--graph-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-delay-ms", type=float, default=5.0)
+    parser.add_argument("--calendly-latency-ms", type=float, default=80.0)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", default=None, help="grava os resultados neste arquivo")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("gunicorn") is None:
+        sys.exit("gunicorn não instalado (pip install -r requirements.txt).")
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    unknown = set(models) - set(MODELS)
+    if unknown:
+        sys.exit(f"modelos desconhecidos: {', '.join(sorted(unknown))}")
+
+    inbox = Inbox()
+    servers = [
+        graph_api(on_message=inbox.record, latency=args.graph_latency_ms / 1000, seed=args.seed),
+        huggingface_api(token_delay=args.llm_token_delay_ms / 1000, paragraphs=1,
+                        latency=args.llm_latency_ms / 1000, seed=args.seed),
+        calendly_api(latency=args.calendly_latency_ms / 1000, seed=args.seed),
+    ]
+    for server in servers:
+        server.start()
+    graph, huggingface, calendly = servers
+    env = dict(os.environ, **{
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'models.db')}",
+        "WHATSAPP_ACCESS_TOKEN": "bench",
+        "WHATSAPP_GRAPH_URL": graph.base_url,
+        "WHATSAPP_HUMANIZED_DELAYS": "false",
+        "LLM_BACKEND": "huggingface",
+        "HUGGINGFACE_API_KEY": "bench",
+        "HUGGINGFACE_API_URL": f"{huggingface.base_url}/models/gpt2",
+        "CALENDLY_ACCESS_TOKEN": "bench",
+        "CALENDLY_BASE_URL": calendly.base_url,
+        "CALENDLY_USER_URI": "https://api.calendly.com/users/USER1",
+    })
+    env.pop("AUTO_MIGRATE", None)
+    subprocess.run([sys.executable, "-m", "src.schema"], cwd=ROOT, env=env, check=True, capture_output=True)
+
+    rows = []
+    try:
+        print(f"{'modelo':>8} {'resp/s':>8} {'200 p50':>9} {'200 p99':>9} {'resp p50':>9} {'resp p95':>9} "
+              f"{'resp p99':>9} {'erros':>6} {'sem resp':>9} {'RSS MB':>8}")
+        for model in models:
+            row = run_model(model, args, env, inbox)
+            rows.append(row)
+            print(f"{model:>8} {row['replies_per_s']:8.1f} {row['ack_p50_ms']:9.1f} {row['ack_p99_ms']:9.1f} "
+                  f"{row['reply_p50_ms']:9.1f} {row['reply_p95_ms']:9.1f} {row['reply_p99_ms']:9.1f} "
+                  f"{row['errors']:6d} {row['timeouts']:9d} {row['peak_rss_mb']:8.1f}")
+    finally:
+        for server in servers:
+            server.stop()
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"clients": args.clients, "turns": args.turns, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Servidores HTTP locais que fazem o papel das APIs externas nos benchmarks.
+
+Cada servidor roda numa thread própria, fala HTTP/1.1 com keep-alive e aceita latência
+artificial e injeção de erros, para que os benchmarks rodem offline e de forma reproduzível.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class FakeServer:
+    """
+    Servidor local genérico. route(method, path, query, body) retorna (status, corpo_dict, headers).
+    Com concurrency, no máximo essa quantidade de requisições é atendida ao mesmo tempo
+    (ex.: uma única réplica de modelo numa GPU).
+    """
+
+    def __init__(self, route, latency=0.0, error_rate=0.0, error_status=500, seed=42, concurrency=None):
+        self.route = route
+        self._slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                body = json.loads(raw) if raw else None
+                parsed = urlparse(self.path)
+                with server._lock:
+                    server.requests += 1
+                    fail = server._random.random() < server.error_rate
+                if server._slots:
+                    server._slots.acquire()
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    if fail:
+                        status, payload, headers = server.error_status, {"error": "injected"}, {}
+                    else:
+                        status, payload, headers = server.route(self.command, parsed.path, parse_qs(parsed.query), body)
+                    self._reply(status, payload, headers)
+                finally:
+                    if server._slots:
+                        server._slots.release()
+
+            def _reply(self, status, payload, headers):
+                if hasattr(payload, "__next__"):
+                    # Corpo em streaming (ex.: SSE): chunked transfer encoding
+                    self.send_response(status)
+                    self.send_header("Transfer-Encoding", "chunked")
+                    for key, value in headers.items():
+                        self.send_header(key, value)
+                    self.end_headers()
+                    for chunk in payload:
+                        data = chunk.encode("utf-8")
+                        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def graph_api(rate_limit=None, on_message=None, **kwargs):
+    """
+    Stand-in de graph.facebook.com: aceita envios e confirmações de leitura em /<phone_number_id>/messages.
+    Com rate_limit (msgs/s por phone_number_id), o excedente recebe 429 com Retry-After.
+    on_message(destinatário, texto, wamid) é chamado a cada mensagem de texto aceita.
+    """
+    counter = itertools.count(1)
+    windows = {}
+    lock = threading.Lock()
+
+    def throttled(phone_number_id):
+        now = time.monotonic()
+        with lock:
+            window = [t for t in windows.get(phone_number_id, []) if now - t < 1.0]
+            windows[phone_number_id] = window
+            if len(window) >= rate_limit:
+                return True
+            window.append(now)
+            return False
+
+    def route(method, path, query, body):
+        if method == "POST" and path.endswith("/messages"):
+            if rate_limit and throttled(path.strip("/").split("/")[-2]):
+                return 429, {"error": {"code": 130429, "message": "Rate limit hit"}}, {"Retry-After": "1"}
+            if body and body.get("status") == "read":
+                return 200, {"success": True}, {}
+            wamid = f"wamid.fake{next(counter)}"
+            if on_message:
+                on_message(body.get("to"), (body.get("text") or {}).get("body", ""), wamid)
+            return 200, {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+                "messages": [{"id": wamid}],
+            }, {}
+        return 404, {"error": {"message": "not found"}}, {}
+
+    return FakeServer(route, **kwargs)
+
+def huggingface_api(token_delay=0.0, paragraphs=3, **kwargs):
+    """
+    Stand-in de api-inference.huggingface.co. Responde no formato de text-generation e,
+    com "stream": true, emite um evento SSE por token (token_delay segundos entre eles).
+    """
+    def reply_for(inputs):
+        text = inputs.get("text", "") if isinstance(inputs, dict) else str(inputs).rsplit("Cliente:", 1)[-1]
+        topic = text.replace("Sofia:", "").strip().rstrip("?!.") or "isso"
+        lines = [f"Entendi, você perguntou sobre \"{topic}\"."]
+        lines += [f"Este é o ponto {i} da resposta da Sofia." for i in range(1, paragraphs)]
+        return "\n".join(lines)
+
+    def events(text):
+        for token in text.replace("\n", " \n ").split(" "):
+            if not token:
+                continue
+            if token_delay:
+                time.sleep(token_delay)
+            piece = "\n" if token == "\n" else token + " "
+            yield "data: " + json.dumps({"token": {"text": piece, "special": False}}) + "\n\n"
+        yield "data: " + json.dumps({"token": {"text": "", "special": True}, "generated_text": text}) + "\n\n"
+
+    def route(method, path, query, body):
+        if method != "POST" or not path.startswith("/models/"):
+            return 404, {"error": "not found"}, {}
+        inputs = body.get("inputs")
+        if body.get("stream"):
+            return 200, events(reply_for(inputs)), {"Content-Type": "text/event-stream"}
+        batch = inputs if isinstance(inputs, list) else [inputs]
+        if token_delay:
+            # Um lote custa o mesmo que sua resposta mais longa (decodificação em lote)
+            time.sleep(token_delay * max(len(reply_for(item).split()) for item in batch))
+        if isinstance(inputs, list):
+            return 200, [[{"generated_text": reply_for(item)}] for item in inputs], {}
+        return 200, [{"generated_text": reply_for(inputs)}], {}
+
+    return FakeServer(route, **kwargs)
+
+def calendly_api(slots_per_day=8, event_types=1, **kwargs):
+    """
+    Stand-in de api.calendly.com: usuário, event types (paginados por count/page_token),
+    horários livres (dias úteis, de hora em hora a partir das 9h) e horários ocupados
+    (/user_busy_times, até 7 dias por consulta). Horários adicionados a server.booked
+    (início ISO em UTC, reuniões de 1h) deixam de aparecer como livres e passam a ocupados.
+    """
+    booked = set()
+    user = {"uri": "https://api.calendly.com/users/USER1", "name": "Cognox.ai", "timezone": "America/Sao_Paulo"}
+    all_event_types = [{
+        "uri": f"https://api.calendly.com/event_types/EVENT{i}",
+        "name": "Reunião de diagnóstico" if i == 1 else f"Evento {i}",
+        "active": True,
+        "duration": 60,
+        "scheduling_url": "https://calendly.com/cognox-ai/reuniao" if i == 1 else f"https://calendly.com/cognox-ai/evento-{i}",
+    } for i in range(1, event_types + 1)]
+    event_type = all_event_types[0]
+
+    def event_types_page(query):
+        count = int((query.get("count") or ["20"])[0])
+        offset = int((query.get("page_token") or ["0"])[0])
+        page = all_event_types[offset:offset + count]
+        next_page = None
+        if offset + count < len(all_event_types):
+            next_page = (f"https://api.calendly.com/event_types?user={user['uri']}&active=true"
+                         f"&count={count}&page_token={offset + count}")
+        return {"collection": page, "pagination": {"count": len(page), "next_page": next_page}}
+
+    def available_times(start, end):
+        start = datetime.fromisoformat(start.replace("Z", "+00:00"))
+        end = datetime.fromisoformat(end.replace("Z", "+00:00"))
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        collection = []
+        while day <= end:
+            if day.weekday() < 5:
+                for hour in range(9, 9 + slots_per_day):
+                    slot = day.replace(hour=hour)
+                    iso = slot.strftime("%Y-%m-%dT%H:%M:%SZ")
+                    if start <= slot <= end and iso not in booked:
+                        collection.append({"status": "available", "start_time": iso,
+                                           "invitees_remaining": 1, "scheduling_url": event_type["scheduling_url"]})
+            day += timedelta(days=1)
+        return collection
+
+    def busy_times(start, end):
+        start = datetime.fromisoformat(start.replace("Z", "+00:00"))
+        end = datetime.fromisoformat(end.replace("Z", "+00:00"))
+        collection = []
+        for iso in sorted(booked):
+            busy_start = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+            busy_end = busy_start + timedelta(hours=1)
+            if busy_end > start and busy_start < end:
+                collection.append({"type": "calendly", "start_time": iso,
+                                   "end_time": busy_end.strftime("%Y-%m-%dT%H:%M:%SZ")})
+        return collection
+
+    def route(method, path, query, body):
+        if method != "GET":
+            return 405, {"message": "method not allowed"}, {}
+        if path == "/user_busy_times":
+            start, end = (query.get("start_time") or [None])[0], (query.get("end_time") or [None])[0]
+            if not start or not end:
+                return 400, {"message": "start_time e end_time são obrigatórios"}, {}
+            span = datetime.fromisoformat(end.replace("Z", "+00:00")) - datetime.fromisoformat(start.replace("Z", "+00:00"))
+            if span > timedelta(days=7):
+                return 400, {"message": "o intervalo máximo é de 7 dias"}, {}
+            busy = busy_times(start, end)
+            return 200, {"collection": busy, "pagination": {"count": len(busy), "next_page": None}}, {}
+        if path.startswith("/users/"):
+            return 200, {"resource": user}, {}
+        if path == "/event_types":
+            return 200, event_types_page(query), {}
+        if path == "/event_type_available_times":
+            if not query.get("start_time") or not query.get("end_time"):
+                return 400, {"message": "start_time e end_time são obrigatórios"}, {}
+            return 200, {"collection": available_times(query["start_time"][0], query["end_time"][0])}, {}
+        return 404, {"message": "not found"}, {}
+
+    server = FakeServer(route, **kwargs)
+    server.booked = booked
+    return server
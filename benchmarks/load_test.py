@@ -0,0 +1,373 @@
+"""
+Teste de carga ponta a ponta, offline: sobe create_app() contra SQLite temporário (ou o banco
+de --database-url, ex.: Postgres local) com stand-ins locais da Graph API, do HuggingFace e do
+Calendly, e reproduz o tráfego de webhooks de várias conversas simultâneas.
+
+Cada conversa manda --turns turnos e espera a resposta antes do próximo. Um turno pode ser
+uma mensagem, várias mensagens no mesmo webhook (--multi-rate) ou em webhooks seguidos
+(--split-rate). Parte dos webhooks é reentregue (--retry-rate), a resposta recebe callbacks de
+status sent/delivered/read (--status-rate) e parte dos turnos consulta horários livres
+(--slots-rate). Latência, erros e concorrência de cada stand-in são configuráveis.
+
+A latência de resposta vai do POST do webhook até a primeira bolha do turno chegar à Graph API
+falsa. Cada mensagem leva a marca do turno ("[ref conversa.turno]"), que o stand-in do
+HuggingFace ecoa; uma bolha sem marca é resposta de fallback e também conta.
+
+Relata vazão, p50/p95/p99 da resposta e do 200 do webhook, pico de threads da aplicação e
+memória máxima do processo (que também hospeda os stand-ins). Com uma referência gravada
+(--save-baseline), compara cada métrica e sai com código 1 se alguma piorar além de --tolerance.
+
+Uso:
+    python -m benchmarks.load_test [--conversations 50] [--turns 5] [--llm-latency-ms 300]
+    python -m benchmarks.load_test --save-baseline
+    python -m benchmarks.load_test --database-url postgresql://localhost/cognox_bench --graph-error-rate 0.05
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from benchmarks.fake_servers import calendly_api, graph_api, huggingface_api
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_test_baseline.json")
+PHONE_NUMBER_ID = "100"
+TAG_PREFIX = "[ref "
+
+# (métrica, maior é melhor) comparadas com a referência
+COMPARED = [
+    ("throughput_replies_per_s", True),
+    ("reply_p50_ms", False),
+    ("reply_p95_ms", False),
+    ("reply_p99_ms", False),
+    ("ack_p99_ms", False),
+    ("peak_app_threads", False),
+    ("max_rss_mb", False),
+]
+
+QUESTIONS = [
+    "Oi, tudo bem?",
+    "Quanto custa um projeto de automação?",
+    "Vocês atendem empresas pequenas?",
+    "Quero marcar uma reunião na próxima terça à tarde",
+    "Pode ser amanhã às 10h?",
+    "Como funciona a integração com o WhatsApp?",
+    "Qual o prazo médio de implantação?",
+    "Tenho interesse, o que preciso enviar?",
+    "Prefiro de manhã, qualquer dia da semana que vem",
+    "Obrigado!",
+]
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def text_message(phone, wamid, text):
+    return {"from": phone, "id": wamid, "timestamp": str(int(time.time())), "type": "text", "text": {"body": text}}
+
+def status_update(wamid, phone, state):
+    return {"id": wamid, "status": state, "timestamp": str(int(time.time())), "recipient_id": phone}
+
+def webhook(phone, messages=(), statuses=()):
+    value = {"messaging_product": "whatsapp", "metadata": {"phone_number_id": PHONE_NUMBER_ID}}
+    if messages:
+        value["contacts"] = [{"wa_id": phone, "profile": {"name": f"Cliente {phone[-4:]}"}}]
+        value["messages"] = list(messages)
+    if statuses:
+        value["statuses"] = list(statuses)
+    return {"object": "whatsapp_business_account", "entry": [{"id": "WABA1", "changes": [{"field": "messages", "value": value}]}]}
+
+class Inbox:
+    """
+    Bolhas aceitas pelo stand-in da Graph API, por destinatário.
+    """
+
+    def __init__(self):
+        self._bubbles = {}
+        self._condition = threading.Condition()
+
+    def record(self, to, text, wamid):
+        with self._condition:
+            self._bubbles.setdefault(to, []).append((time.perf_counter(), text, wamid))
+            self._condition.notify_all()
+
+    def texts(self, phone):
+        with self._condition:
+            return [text for _, text, _ in self._bubbles.get(phone, ())]
+
+    def wait_reply(self, phone, tag, since, timeout):
+        """
+        Primeira bolha após `since` com a marca do turno (ou sem marca: fallback). Bolhas com
+        a marca de outro turno são restos da resposta anterior. Retorna (instante, wamid) ou None.
+        """
+        deadline = time.perf_counter() + timeout
+        with self._condition:
+            while True:
+                for at, text, wamid in self._bubbles.get(phone, ()):
+                    if at >= since and (tag in text or TAG_PREFIX not in text):
+                        return at, wamid
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reply_latencies = []
+        self.ack_latencies = []
+        self.slot_latencies = []
+        self.counts = {"webhooks": 0, "messages": 0, "redeliveries": 0, "status_callbacks": 0,
+                       "http_errors": 0, "slot_queries": 0, "slot_errors": 0, "replies": 0, "timeouts": 0}
+
+    def add(self, key, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+    def sample(self, name, value):
+        with self.lock:
+            getattr(self, name).append(value)
+
+def post(client, payload, stats):
+    started = time.perf_counter()
+    response = client.post("/api/whatsapp/webhook", json=payload)
+    stats.sample("ack_latencies", time.perf_counter() - started)
+    stats.add("webhooks")
+    if response.status_code != 200:
+        stats.add("http_errors")
+
+def converse(n, app, inbox, stats, args, run_id, start):
+    rng = random.Random(args.seed * 100_003 + n)
+    phone = f"55119{n:08d}"
+    client = app.test_client()
+    start.wait()
+    if args.ramp_seconds:
+        time.sleep(rng.uniform(0, args.ramp_seconds))
+    for turn in range(args.turns):
+        tag = f"{TAG_PREFIX}{n}.{turn}]"
+        count = rng.randint(2, 3) if rng.random() < args.multi_rate else 1
+        messages = [text_message(phone, f"wamid.LOAD{run_id}.{n}.{turn}.{i}", f"{tag} {rng.choice(QUESTIONS)}")
+                    for i in range(count)]
+        # Mensagens digitadas em sequência chegam em webhooks separados; a Meta às vezes as agrupa
+        deliveries = [[msg] for msg in messages] if count > 1 and rng.random() < args.split_rate else [messages]
+
+        since = time.perf_counter()
+        for batch in deliveries:
+            post(client, webhook(phone, batch), stats)
+            stats.add("messages", len(batch))
+            if rng.random() < args.retry_rate:
+                post(client, webhook(phone, batch), stats)
+                stats.add("redeliveries")
+        if rng.random() < args.slots_rate:
+            started = time.perf_counter()
+            response = client.get("/api/scheduling/available-slots?duration=60&limit=5")
+            stats.sample("slot_latencies", time.perf_counter() - started)
+            stats.add("slot_queries")
+            if response.status_code != 200:
+                stats.add("slot_errors")
+
+        reply = inbox.wait_reply(phone, tag, since, args.reply_timeout)
+        if reply is None:
+            stats.add("timeouts")
+            continue
+        at, wamid = reply
+        stats.sample("reply_latencies", at - since)
+        stats.add("replies")
+        if rng.random() < args.status_rate:
+            for state in ("sent", "delivered", "read"):
+                post(client, webhook(phone, statuses=[status_update(wamid, phone, state)]), stats)
+                stats.add("status_callbacks")
+        if args.think_ms:
+            time.sleep(rng.expovariate(1000 / args.think_ms))
+
+def app_thread_count():
+    # Exclui as conversas simuladas e as threads de conexão dos stand-ins
+    return sum(1 for thread in threading.enumerate()
+               if not thread.name.startswith("load-") and "process_request_thread" not in thread.name)
+
+def sample_resources(stop, peak, interval=0.1):
+    while not stop.wait(interval):
+        peak["threads"] = max(peak["threads"], app_thread_count())
+
+def compare(results, baseline, tolerance):
+    """
+    Imprime a variação de cada métrica em relação à referência e retorna as que pioraram além da tolerância.
+    """
+    regressions = []
+    print(f"\ncomparação com a referência de {baseline.get('recorded_at', '?')} (tolerância {tolerance:.0%}):")
+    print(f"{'métrica':<26} {'referência':>11} {'atual':>11} {'variação':>9}")
+    for key, higher_is_better in COMPARED:
+        old, new = baseline["results"].get(key), results.get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSÃO" if worse > tolerance else ""
+        if flag:
+            regressions.append(key)
+        print(f"{key:<26} {old:>11.1f} {new:>11.1f} {change:>+9.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--ramp-seconds", type=float, default=0.0,
+                        help="0 = todas as conversas começam juntas (rajada)")
+    parser.add_argument("--think-ms", type=float, default=200.0)
+    parser.add_argument("--multi-rate", type=float, default=0.2)
+    parser.add_argument("--split-rate", type=float, default=0.5)
+    parser.add_argument("--retry-rate", type=float, default=0.1)
+    parser.add_argument("--status-rate", type=float, default=1.0)
+    parser.add_argument("--slots-rate", type=float, default=0.1)
+    parser.add_argument("--reply-timeout", type=float, default=60.0)
+    parser.add_argument("--graph-latency-ms", type=float, default=50.0)
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument("--graph-rate-limit", type=int, default=None)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-delay-ms", type=float, default=5.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-concurrency", type=int, default=None)
+    parser.add_argument("--calendly-latency-ms", type=float, default=80.0)
+    parser.add_argument("--calendly-error-rate", type=float, default=0.0)
+    parser.add_argument("--human-delays", action="store_true",
+                        help="mantém as pausas humanizadas entre bolhas (zeradas por padrão)")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--json", dest="json_path", default=None, help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    inbox = Inbox()
+    graph = graph_api(rate_limit=args.graph_rate_limit, on_message=inbox.record, latency=args.graph_latency_ms / 1000,
+                      error_rate=args.graph_error_rate, seed=args.seed).start()
+    huggingface = huggingface_api(token_delay=args.llm_token_delay_ms / 1000, paragraphs=1,
+                                  latency=args.llm_latency_ms / 1000, error_rate=args.llm_error_rate,
+                                  error_status=503, seed=args.seed, concurrency=args.llm_concurrency).start()
+    calendly = calendly_api(latency=args.calendly_latency_ms / 1000, error_rate=args.calendly_error_rate,
+                            seed=args.seed).start()
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load.db')}"
+    os.environ.update({
+        "AUTO_MIGRATE": "true",
+        "DATABASE_URL": database_url,
+        "WHATSAPP_ACCESS_TOKEN": "load",
+        "WHATSAPP_GRAPH_URL": graph.base_url,
+        "WHATSAPP_PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+        "LLM_BACKEND": "huggingface",
+        "HUGGINGFACE_API_KEY": "load",
+        "HUGGINGFACE_API_URL": f"{huggingface.base_url}/models/gpt2",
+        "CALENDLY_ACCESS_TOKEN": "load",
+        "CALENDLY_BASE_URL": calendly.base_url,
+        "CALENDLY_USER_URI": "https://api.calendly.com/users/USER1",
+    })
+
+    import src.whatsapp_api
+    if not args.human_delays:
+        src.whatsapp_api.random.uniform = lambda a, b: 0.0
+    from src.main import create_app
+    from src.metrics import metrics
+
+    threads_before = app_thread_count()
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stats = Stats()
+    start = threading.Barrier(args.conversations + 1)
+    run_id = uuid.uuid4().hex[:8]
+    conversations = [threading.Thread(target=converse, name=f"load-{n}",
+                                      args=(n, app, inbox, stats, args, run_id, start))
+                     for n in range(args.conversations)]
+    peak = {"threads": app_thread_count()}
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_resources, args=(stop, peak), name="load-sampler", daemon=True)
+    sampler.start()
+    for thread in conversations:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in conversations:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    sampler.join()
+
+    requests_made = {"graph_api": graph.requests, "huggingface": huggingface.requests, "calendly": calendly.requests}
+    for server in (graph, huggingface, calendly):
+        server.stop()
+
+    ms = lambda value: round(value * 1000, 1) if value is not None else None
+    results = {
+        "elapsed_s": round(elapsed, 2),
+        "throughput_replies_per_s": round(stats.counts["replies"] / elapsed, 2),
+        "throughput_webhooks_per_s": round(stats.counts["webhooks"] / elapsed, 2),
+        "reply_p50_ms": ms(percentile(stats.reply_latencies, 0.50)),
+        "reply_p95_ms": ms(percentile(stats.reply_latencies, 0.95)),
+        "reply_p99_ms": ms(percentile(stats.reply_latencies, 0.99)),
+        "ack_p50_ms": ms(percentile(stats.ack_latencies, 0.50)),
+        "ack_p99_ms": ms(percentile(stats.ack_latencies, 0.99)),
+        "slots_p95_ms": ms(percentile(stats.slot_latencies, 0.95)),
+        "peak_app_threads": peak["threads"] - threads_before,
+        # ru_maxrss vem em KB no Linux e em bytes no macOS
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        **stats.counts,
+        "upstream_requests": requests_made,
+        "app_events": metrics.snapshot()["events"],
+    }
+    scenario = {key: value for key, value in vars(args).items()
+                if key not in ("baseline", "save_baseline", "tolerance", "json_path", "database_url")}
+    scenario["database"] = database_url.split(":", 1)[0]
+    report = {"recorded_at": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "scenario": scenario, "results": results}
+
+    print(f"conversas: {args.conversations} x {args.turns} turnos em {results['elapsed_s']} s ({scenario['database']})")
+    print(f"webhooks: {stats.counts['webhooks']} (reentregas {stats.counts['redeliveries']}, "
+          f"status {stats.counts['status_callbacks']}, HTTP != 200: {stats.counts['http_errors']})")
+    print(f"respostas: {stats.counts['replies']} (sem resposta em {args.reply_timeout:.0f} s: {stats.counts['timeouts']})")
+    print(f"vazão: {results['throughput_replies_per_s']} respostas/s, {results['throughput_webhooks_per_s']} webhooks/s")
+    print(f"resposta (webhook -> 1ª bolha): p50 {results['reply_p50_ms']} ms, p95 {results['reply_p95_ms']} ms, "
+          f"p99 {results['reply_p99_ms']} ms")
+    print(f"200 do webhook: p50 {results['ack_p50_ms']} ms, p99 {results['ack_p99_ms']} ms")
+    if stats.slot_latencies:
+        print(f"horários livres: {stats.counts['slot_queries']} consultas, p95 {results['slots_p95_ms']} ms, "
+              f"erros {stats.counts['slot_errors']}")
+    print(f"pico de threads da aplicação: {results['peak_app_threads']}, memória máxima: {results['max_rss_mb']} MB")
+    print(f"chamadas aos stand-ins: {requests_made}")
+    if results["app_events"]:
+        print(f"eventos: {results['app_events']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nreferência gravada em {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("\nsem referência gravada; use --save-baseline para criar uma.")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    changed = {key: (value, scenario.get(key)) for key, value in baseline.get("scenario", {}).items()
+               if scenario.get(key) != value}
+    if changed:
+        print(f"\natenção: cenário diferente da referência (referência, atual): {changed}")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"FALHOU: {', '.join(regressions)} piorou além da tolerância")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
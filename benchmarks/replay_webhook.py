@@ -0,0 +1,92 @@
+"""
+Reentrega concorrente do mesmo webhook: dispara o mesmo payload N vezes em paralelo contra
+a aplicação (SQLite temporário, LLM local e Graph API falsa) e confere que só uma mensagem
+foi gravada e só uma resposta foi enviada.
+
+Com --workers > 1 cada rodada usa um filtro em memória novo, simulando reentregas que caem
+em processos gunicorn diferentes; nesse caso quem barra a duplicata é a constraint de wamid.
+
+Uso:
+    python -m benchmarks.replay_webhook [--replays 50] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.fake_servers import graph_api
+
+def payload(wamid):
+    message = {"from": "5511999990000", "id": wamid, "type": "text", "text": {"body": "Quanto custa o projeto?"}}
+    value = {
+        "metadata": {"phone_number_id": "100"},
+        "contacts": [{"wa_id": "5511999990000", "profile": {"name": "Ana"}}],
+        "messages": [message],
+    }
+    return {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": value}]}]}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replays", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "replay.db")
+    server = graph_api().start()
+    os.environ.update({
+        "AUTO_MIGRATE": "true",
+        "DATABASE_URL": f"sqlite:///{database}",
+        "WHATSAPP_ACCESS_TOKEN": "replay",
+        "WHATSAPP_GRAPH_URL": server.base_url,
+        "LLM_BACKEND": "local",
+    })
+    import src.whatsapp_api
+    src.whatsapp_api.random.uniform = lambda a, b: 0.0
+    from src.dedup import WamidFilter
+    from src.main import create_app
+    import src.routes.whatsapp as routes
+    from src.models.conversation import Message
+
+    app = create_app()
+    filters = [WamidFilter() for _ in range(args.workers)]
+    start = threading.Barrier(args.replays)
+    statuses = []
+
+    def deliver(n):
+        client = app.test_client()
+        start.wait()
+        if args.workers > 1:
+            routes.wamid_filter = filters[n % args.workers]
+        statuses.append(client.post("/api/whatsapp/webhook", json=payload("wamid.REPLAY1")).status_code)
+
+    threads = [threading.Thread(target=deliver, args=(n,)) for n in range(args.replays)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    deadline = time.monotonic() + 30
+    while routes.inbound_pool.queue_depth() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    time.sleep(1.0)
+
+    with app.app_context():
+        stored = Message.query.filter_by(wamid="wamid.REPLAY1").count()
+        replies = Message.query.filter_by(message_type="assistant").count()
+    active = filters if args.workers > 1 else [routes.wamid_filter]
+    suppressed = sum(f.stats()["duplicates_suppressed"] for f in active)
+    sends = server.requests
+    server.stop()
+
+    print(f"entregas: {len(statuses)} (HTTP 200: {statuses.count(200)})")
+    print(f"mensagens gravadas com o wamid: {stored}")
+    print(f"respostas geradas: {replies}")
+    print(f"requisições à Graph API (leitura + bolhas): {sends}")
+    print(f"duplicatas suprimidas: {suppressed}")
+    ok = stored == 1 and replies == 1
+    print("OK" if ok else "FALHOU: a mesma mensagem foi processada mais de uma vez")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Configuração do gunicorn para produção (lida automaticamente do diretório de trabalho):
+
+    gunicorn src.wsgi:app
+
+O modelo de worker vem de WEB_WORKER_CLASS:
+- sync (padrão): um request por processo. O webhook só grava e enfileira; LLM, Graph API e
+  Calendly rodam nas threads de fundo de cada processo, que com mais processos disputam
+  menos o GIL. Em benchmarks/bench_worker_models_results.md entregou 1,6x mais respostas por
+  segundo que o gthread, com metade da latência de resposta.
+- gthread: processos com um pool de threads. Confirma o webhook mais rápido e, com menos
+  processos, mantém menos cópias dos caches em memória, do filtro de duplicatas e das
+  conexões com o banco (metade da memória no mesmo benchmark).
+
+Workers assíncronos (gevent, eventlet) não são suportados: a aplicação usa threads de fundo,
+executores e filas do threading, que não foram validados com monkey-patching e --preload.
+
+As métricas de /api/whatsapp/metrics são por processo; com METRICS_SHARED_DIR cada worker
+grava as suas num diretório compartilhado e a coleta soma as de todos (o diretório é limpo
+no boot do master).
+
+Os tamanhos saem da quantidade de núcleos e podem ser fixados por WEB_CONCURRENCY (processos)
+e WEB_THREADS. benchmarks/bench_worker_models.py compara os dois modelos; os números
+dependem da máquina e da latência dos serviços externos, então repita a medição no ambiente
+de produção.
+"""
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger("gunicorn.error")
+
+cores = multiprocessing.cpu_count()
+
+worker_class = os.getenv("WEB_WORKER_CLASS", "sync").lower()
+if worker_class not in ("gthread", "sync"):
+    logger.warning(f"Worker {worker_class} não suportado; usando sync.")
+    worker_class = "sync"
+
+if worker_class == "sync":
+    default_workers, default_threads = 2 * cores + 1, 1
+else:
+    default_workers, default_threads = min(cores, 4), 8
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(default_workers)))
+threads = int(os.getenv("WEB_THREADS", str(default_threads)))
+
+# A aplicação é importada uma vez no master e herdada pelos workers (boot mais rápido,
+# memória compartilhada); create_app() não abre conexões nem inicia threads no master
+preload_app = os.getenv("WEB_PRELOAD", "true").lower() == "true"
+
+# As chamadas ao LLM rodam nas threads de fundo, não no request; o limite cobre as rotas
+# síncronas mais lentas (Calendly, /api/admin/profile até PROFILE_MAX_SECONDS)
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+# Maior que o idle timeout dos balanceadores (60s), para que eles fechem a conexão primeiro
+keepalive = int(os.getenv("WEB_KEEPALIVE", "75"))
+
+# Reciclar workers descartaria bolhas agendadas e caches em memória; por isso não há max_requests
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")
+
+def on_starting(server):
+    from src.metrics import clear_shared_dir
+    clear_shared_dir()
+    logger.info(f"Servindo com {workers} workers {worker_class}"
+                + (f" x {threads} threads" if worker_class == "gthread" else "")
+                + (" (preload)" if preload_app else ""))
+
+def post_worker_init(worker):
+    """
+    Depois do fork: descarta as conexões herdadas do master (um socket compartilhado entre
+    processos corrompe o protocolo do banco) e inicia as threads de fundo deste worker.
+    """
+    from src.database import db
+    from src.main import start_background_workers
+    app = worker.wsgi
+    with app.app_context():
+        # close=False: não encerra as conexões que ainda pertencem ao master, só as esquece
+        db.engine.dispose(close=False)
+    start_background_workers(app)
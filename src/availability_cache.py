@@ -0,0 +1,162 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+from src.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+METADATA = "metadata"
+SLOTS = "slots"
+
+class AvailabilityCache:
+    """
+    Cache compartilhado das consultas ao Calendly, com stale-while-revalidate.
+
+    Há dois níveis com TTLs próprios: metadados (usuário, event types), que quase nunca
+    mudam (CALENDLY_METADATA_TTL, em horas), e janelas de horários livres
+    (CALENDLY_SLOTS_TTL, em minutos). Depois do TTL a entrada ainda é servida por até
+    CALENDLY_STALE_SECONDS enquanto uma thread a atualiza em segundo plano; só uma entrada
+    ausente (ou velha demais) faz o chamador esperar o Calendly, e chamadas concorrentes
+    para a mesma chave esperam uma única consulta.
+
+    Um agendamento muda a disponibilidade: invalidate_slots() descarta as janelas de horários
+    e impede que uma atualização iniciada antes dele grave dados antigos.
+    """
+
+    def __init__(self, metadata_ttl: Optional[float] = None, slots_ttl: Optional[float] = None,
+                 stale_seconds: Optional[float] = None, maxsize: Optional[int] = None):
+        self.ttls = {
+            METADATA: metadata_ttl or float(os.getenv("CALENDLY_METADATA_TTL", str(6 * 3600))),
+            SLOTS: slots_ttl or float(os.getenv("CALENDLY_SLOTS_TTL", "300")),
+        }
+        self.stale_seconds = stale_seconds if stale_seconds is not None else float(os.getenv("CALENDLY_STALE_SECONDS", "600"))
+        maxsize = maxsize or int(os.getenv("CALENDLY_CACHE_SIZE", "1024"))
+        # Entradas: (valor, instante da consulta, geração); a expiração é controlada aqui, não pelo LRU
+        self._entries = {METADATA: LRUCache(maxsize), SLOTS: LRUCache(maxsize)}
+        self._generations = {METADATA: 0, SLOTS: 0}
+        self._in_flight: Dict[tuple, Future] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def get(self, kind: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Retorna o valor em cache para (kind, key) ou o obtém com loader(). Exceções do loader
+        não são armazenadas: propagam para o chamador, a menos que haja um valor antigo para servir.
+        """
+        entry = self._entries[kind].get(key)
+        if entry is not None:
+            value, fetched_at, _ = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttls[kind]:
+                with self._lock:
+                    self.hits += 1
+                return value
+            if age < self.ttls[kind] + self.stale_seconds:
+                with self._lock:
+                    self.stale_hits += 1
+                self._refresh_in_background(kind, key, loader)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        try:
+            return self._load(kind, key, loader)
+        except Exception:
+            if entry is not None:
+                logger.warning(f"Calendly indisponível; servindo {kind} antigo para {key}.")
+                return entry[0]
+            raise
+
+    def _load(self, kind: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        flight_key = (kind, key)
+        with self._lock:
+            future = self._in_flight.get(flight_key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[flight_key] = Future()
+                generation = self._generations[kind]
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self.errors += 1
+            future.set_exception(e)
+            raise
+        else:
+            self._store(kind, key, value, generation)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(flight_key, None)
+
+    def _store(self, kind: str, key: Hashable, value: Any, generation: int):
+        with self._lock:
+            # Invalidado durante a consulta: o valor pode ser anterior ao agendamento
+            if generation != self._generations[kind]:
+                return
+        self._entries[kind].set(key, (value, time.monotonic(), generation))
+
+    def _refresh_in_background(self, kind: str, key: Hashable, loader: Callable[[], Any]):
+        with self._lock:
+            if (kind, key) in self._refreshing:
+                return
+            self._refreshing.add((kind, key))
+            self.refreshes += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="calendly-refresh")
+                atexit.register(self._executor.shutdown, wait=False)
+        self._executor.submit(self._refresh, kind, key, loader)
+
+    def _refresh(self, kind: str, key: Hashable, loader: Callable[[], Any]):
+        try:
+            self._load(kind, key, loader)
+        except Exception as e:
+            logger.warning(f"Falha ao atualizar {kind} do Calendly em segundo plano: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard((kind, key))
+
+    def invalidate_slots(self):
+        """
+        Descarta todas as janelas de horários (chamado após agendar, confirmar ou cancelar).
+        """
+        with self._lock:
+            self._generations[SLOTS] += 1
+        self._entries[SLOTS].clear()
+
+    def clear(self):
+        with self._lock:
+            for kind in self._generations:
+                self._generations[kind] += 1
+        for entries in self._entries.values():
+            entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "metadata_entries": len(self._entries[METADATA]),
+                "slot_entries": len(self._entries[SLOTS]),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "background_refreshes": self.refreshes,
+                "errors": self.errors,
+                "hit_rate": ((self.hits + self.stale_hits) / lookups) if lookups else 0.0,
+            }
+
+availability_cache = AvailabilityCache()
@@ -0,0 +1,364 @@
+import os
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.calendly_client import calendly_client
+from src.time_parser import TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+Interval = Tuple[datetime, datetime]
+
+# Segunda a sexta, 9h-12h e 14h-18h (horário de Brasília)
+DEFAULT_BUSINESS_HOURS = "0-4=09:00-12:00,14:00-18:00"
+
+class IntervalSet:
+    """
+    Intervalos [início, fim) ordenados e sem sobreposição, em duas listas paralelas.
+    Inserções fundem intervalos que se tocam; a localização é por busca binária.
+    """
+
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.ends: List[datetime] = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start: datetime, end: datetime):
+        if end <= start:
+            return
+        # Primeiro intervalo que termina em start ou depois e primeiro que começa depois de end
+        lo = bisect_left(self.ends, start)
+        hi = bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def remove(self, start: datetime, end: datetime):
+        """
+        Subtrai [start, end), recortando os intervalos que o cruzam.
+        """
+        if end <= start:
+            return
+        lo = bisect_right(self.ends, start)
+        hi = bisect_left(self.starts, end)
+        if lo >= hi:
+            return
+        keep_starts, keep_ends = [], []
+        if self.starts[lo] < start:
+            keep_starts.append(self.starts[lo])
+            keep_ends.append(start)
+        if self.ends[hi - 1] > end:
+            keep_starts.append(end)
+            keep_ends.append(self.ends[hi - 1])
+        self.starts[lo:hi] = keep_starts
+        self.ends[lo:hi] = keep_ends
+
+    def gaps(self, start: datetime, end: datetime) -> Iterator[Interval]:
+        """
+        Trechos livres dentro de [start, end), em ordem. O(log n) para localizar + O(k) no resultado.
+        """
+        i = bisect_right(self.ends, start)
+        cursor = start
+        while cursor < end:
+            if i >= len(self.starts) or self.starts[i] >= end:
+                yield cursor, end
+                return
+            if self.starts[i] > cursor:
+                yield cursor, self.starts[i]
+            cursor = max(cursor, self.ends[i])
+            i += 1
+
+class BusinessHours:
+    """
+    Expediente por dia da semana (0 = segunda), em horário local. Template no formato
+    "0-4=09:00-12:00,14:00-18:00;5=09:00-12:00": dias (ou faixas de dias) e seus turnos.
+    """
+
+    def __init__(self, template: Optional[str] = None, tz=TIMEZONE):
+        self.tz = tz
+        self.shifts: Dict[int, List[Tuple[dtime, dtime]]] = {day: [] for day in range(7)}
+        for rule in filter(None, (template or DEFAULT_BUSINESS_HOURS).replace(" ", "").split(";")):
+            days, _, ranges = rule.partition("=")
+            first, _, last = days.partition("-")
+            shifts = []
+            for shift in ranges.split(","):
+                match = re.fullmatch(r"(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})", shift)
+                if not match:
+                    raise ValueError(f"Turno inválido no expediente: {shift!r}")
+                h1, m1, h2, m2 = (int(part) for part in match.groups())
+                shifts.append((dtime(h1, m1), dtime(h2, m2)))
+            for day in range(int(first), int(last or first) + 1):
+                self.shifts[day] = sorted(self.shifts[day] + shifts)
+
+    def windows(self, start: datetime, end: datetime) -> Iterator[Interval]:
+        """
+        Turnos de expediente (datetimes com fuso) que cruzam [start, end), recortados a ele.
+        """
+        day = start.astimezone(self.tz).date()
+        last_day = end.astimezone(self.tz).date()
+        while day <= last_day:
+            for shift_start, shift_end in self.shifts[day.weekday()]:
+                window_start = datetime.combine(day, shift_start, self.tz)
+                window_end = datetime.combine(day, shift_end, self.tz)
+                if window_end > start and window_start < end:
+                    yield max(window_start, start), min(window_end, end)
+            day += timedelta(days=1)
+
+class BusySource:
+    """
+    Origem de horários ocupados (uma agenda). fetch() retorna os intervalos que cruzam
+    [start, end), com datetimes com fuso.
+    """
+    name = "base"
+
+    def fetch(self, start: datetime, end: datetime) -> List[Interval]:
+        raise NotImplementedError
+
+class StaticBusySource(BusySource):
+    """
+    Agenda local em memória: stand-in das agendas reais em testes, benchmarks e no modo simulação.
+    """
+    name = "static"
+
+    def __init__(self, intervals: Optional[List[Interval]] = None):
+        self.intervals = list(intervals or [])
+        self.fetches = 0
+
+    def fetch(self, start: datetime, end: datetime) -> List[Interval]:
+        self.fetches += 1
+        return [(s, e) for s, e in self.intervals if e > start and s < end]
+
+class CalendlyBusySource(BusySource):
+    """
+    Horários ocupados do usuário no Calendly (/user_busy_times), de todos os event types e
+    das agendas conectadas a ele. A API aceita no máximo 7 dias por consulta.
+    """
+    name = "calendly"
+    max_range = timedelta(days=7)
+
+    def __init__(self, client=None, user_uri: Optional[str] = None):
+        self.client = client or calendly_client
+        self.user_uri = user_uri
+
+    def fetch(self, start: datetime, end: datetime) -> List[Interval]:
+        user_uri = self.user_uri or self.client.get_user()["uri"]
+        intervals = []
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + self.max_range, end)
+            for busy in self.client.paginate("user_busy_times", {
+                "user": user_uri, "start_time": _iso_utc(chunk_start), "end_time": _iso_utc(chunk_end),
+            }):
+                intervals.append((_parse_iso(busy.get("buffered_start_time") or busy["start_time"]),
+                                  _parse_iso(busy.get("buffered_end_time") or busy["end_time"])))
+            chunk_start = chunk_end
+        return intervals
+
+class GoogleCalendarBusySource(BusySource):
+    """
+    Horários ocupados de uma agenda do Google (API freeBusy) com uma service account.
+    Requer google-auth, que já vem como dependência do google-generativeai.
+    """
+    name = "google_calendar"
+    api_url = "https://www.googleapis.com/calendar/v3/freeBusy"
+
+    def __init__(self, calendar_id: str, service_account_file: str):
+        from google.oauth2 import service_account
+        from google.auth.transport.requests import AuthorizedSession
+        credentials = service_account.Credentials.from_service_account_file(
+            service_account_file, scopes=["https://www.googleapis.com/auth/calendar.readonly"])
+        self.calendar_id = calendar_id
+        self.session = AuthorizedSession(credentials)
+        self.timeout = (float(os.getenv("GOOGLE_CALENDAR_CONNECT_TIMEOUT", "3.05")),
+                        float(os.getenv("GOOGLE_CALENDAR_READ_TIMEOUT", "10")))
+
+    def fetch(self, start: datetime, end: datetime) -> List[Interval]:
+        response = self.session.post(self.api_url, json={
+            "timeMin": _iso_utc(start), "timeMax": _iso_utc(end), "items": [{"id": self.calendar_id}],
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        calendar = response.json().get("calendars", {}).get(self.calendar_id, {})
+        if calendar.get("errors"):
+            raise RuntimeError(f"Google Calendar {self.calendar_id}: {calendar['errors']}")
+        return [(_parse_iso(busy["start"]), _parse_iso(busy["end"])) for busy in calendar.get("busy", [])]
+
+class AvailabilityIndex:
+    """
+    Índice de disponibilidade que junta os horários ocupados de várias agendas num único
+    IntervalSet, descontado do expediente semanal.
+
+    As agendas são carregadas por semana (segunda a domingo, horário local) na primeira consulta
+    que a cobre e recarregadas depois de AVAILABILITY_REFRESH_SECONDS; entre recargas, cada
+    consulta de horários livres é uma busca binária mais a varredura do próprio resultado.
+    Reservas feitas por nós entram na hora com add_busy(), sem esperar a próxima recarga;
+    release() força a recarga das semanas de um horário liberado (ex.: cancelamento).
+    Se uma recarga falha, a semana segue com os dados anteriores; uma semana nunca carregada
+    propaga o erro, para não oferecer horários sem saber o que está ocupado.
+    """
+
+    def __init__(self, sources: List[BusySource], business_hours: Optional[BusinessHours] = None,
+                 refresh_seconds: Optional[float] = None, slot_step_minutes: Optional[int] = None):
+        self.sources = sources
+        self.business_hours = business_hours or BusinessHours(os.getenv("AVAILABILITY_BUSINESS_HOURS"))
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else float(
+            os.getenv("AVAILABILITY_REFRESH_SECONDS", "300"))
+        # Granularidade dos inícios de horário oferecidos (0 = a própria duração)
+        step_minutes = slot_step_minutes or int(os.getenv("AVAILABILITY_SLOT_STEP_MINUTES", "0"))
+        self.slot_step = timedelta(minutes=step_minutes) if step_minutes else None
+        # Antecedência mínima de um horário oferecido em relação a agora
+        self.lead_time = timedelta(minutes=int(os.getenv("AVAILABILITY_LEAD_MINUTES", "60")))
+        # Reservas feitas por nós: entram em toda recarga até as agendas as refletirem
+        self.bookings = StaticBusySource()
+        self.bookings.name = "bookings"
+        self._busy = IntervalSet()
+        # Semanas carregadas (segunda-feira local) -> instante da carga (monotonic)
+        self._loaded: Dict[date, float] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.errors = 0
+
+    def free_slots(self, start: datetime, end: datetime, duration: timedelta,
+                   limit: Optional[int] = None) -> List[Interval]:
+        """
+        Horários livres de `duration` dentro de [start, end), dentro do expediente e fora
+        de qualquer intervalo ocupado, em ordem. start/end devem ter fuso.
+        Nenhum horário começa antes de agora + AVAILABILITY_LEAD_MINUTES, mesmo que start
+        seja anterior (ex.: 00:00 do dia de hoje).
+        """
+        earliest = max(start, datetime.now(timezone.utc) + self.lead_time)
+        if earliest >= end:
+            return []
+        self._ensure_loaded(earliest, end)
+        step = self.slot_step or duration
+        slots = []
+        with self._lock:
+            # Turnos já passados são pulados; a grade de horários continua alinhada ao início do turno
+            for window_start, window_end in self.business_hours.windows(start, end):
+                if window_end <= earliest:
+                    continue
+                for gap_start, gap_end in self._busy.gaps(max(window_start, earliest), window_end):
+                    slot_start = _align(gap_start, window_start, step)
+                    while slot_start + duration <= gap_end:
+                        slots.append((slot_start, slot_start + duration))
+                        if limit is not None and len(slots) >= limit:
+                            return slots
+                        slot_start += step
+        return slots
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        self._ensure_loaded(start, end)
+        with self._lock:
+            return next(self._busy.gaps(start, end), None) == (start, end)
+
+    def add_busy(self, start: datetime, end: datetime):
+        """
+        Registra uma reserva na hora (incremental), sem recarregar as agendas.
+        """
+        with self._lock:
+            self.bookings.intervals.append((start, end))
+            self._busy.add(start, end)
+
+    def release(self, start: datetime, end: datetime):
+        """
+        Marca as semanas que cobrem [start, end) para recarga: o horário pode continuar ocupado
+        em outra agenda, então o índice não o libera por conta própria.
+        """
+        with self._lock:
+            self.bookings.intervals = [(s, e) for s, e in self.bookings.intervals if (s, e) != (start, end)]
+            for week in _weeks(start, end):
+                self._loaded.pop(week, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded.clear()
+
+    def _ensure_loaded(self, start: datetime, end: datetime):
+        now = time.monotonic()
+        with self._lock:
+            stale = [week for week in _weeks(start, end)
+                     if week not in self._loaded or now - self._loaded[week] >= self.refresh_seconds]
+        for week in stale:
+            try:
+                self._load_week(week)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    loaded_before = week in self._loaded
+                logger.error(f"Erro ao carregar horários ocupados da semana de {week}: {e}")
+                # Semana já carregada segue com os dados antigos; sem nenhum, não há como oferecer horários
+                if not loaded_before:
+                    raise
+
+    def _load_week(self, week: date):
+        week_start = datetime.combine(week, dtime(0, 0), TIMEZONE)
+        week_end = week_start + timedelta(days=7)
+        intervals = []
+        with self._lock:
+            # Reservas já encerradas não afetam consultas futuras
+            cutoff = datetime.now(timezone.utc)
+            self.bookings.intervals = [(s, e) for s, e in self.bookings.intervals if e > cutoff]
+        for source in self.sources + [self.bookings]:
+            intervals.extend(source.fetch(week_start, week_end))
+        with self._lock:
+            self._busy.remove(week_start, week_end)
+            for busy_start, busy_end in intervals:
+                self._busy.add(max(busy_start, week_start), min(busy_end, week_end))
+            self._loaded[week] = time.monotonic()
+            self.loads += 1
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "sources": [source.name for source in self.sources],
+                "busy_intervals": len(self._busy),
+                "weeks_loaded": len(self._loaded),
+                "loads": self.loads,
+                "errors": self.errors,
+            }
+
+def build_sources(calendly_user_uri: Optional[str] = None, google_calendar_id: Optional[str] = None,
+                  google_service_account_file: Optional[str] = None) -> List[BusySource]:
+    """
+    Agendas configuradas: Calendly (se houver token) e Google Calendar (se houver agenda e
+    service account). Sem nenhuma, o índice oferece todo o expediente (modo simulação).
+    """
+    sources: List[BusySource] = []
+    if calendly_client.configured:
+        sources.append(CalendlyBusySource(calendly_client, calendly_user_uri))
+    if google_calendar_id and google_service_account_file:
+        try:
+            sources.append(GoogleCalendarBusySource(google_calendar_id, google_service_account_file))
+        except ImportError:
+            logger.warning("google-auth não instalado; Google Calendar ignorado na disponibilidade.")
+        except Exception as e:
+            logger.error(f"Erro ao configurar o Google Calendar: {e}")
+    return sources
+
+def _weeks(start: datetime, end: datetime) -> List[date]:
+    day = start.astimezone(TIMEZONE).date()
+    week = day - timedelta(days=day.weekday())
+    last = end.astimezone(TIMEZONE).date()
+    weeks = []
+    while week <= last:
+        weeks.append(week)
+        week += timedelta(days=7)
+    return weeks
+
+def _align(moment: datetime, origin: datetime, step: timedelta) -> datetime:
+    # Primeiro início de horário >= moment na grade que parte do início do turno
+    steps = -((origin - moment) // step)
+    return origin + steps * step
+
+def _parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+def _iso_utc(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -0,0 +1,107 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Cache LRU thread-safe com TTL opcional e limite opcional de peso (ex.: bytes estimados).
+
+    Args:
+        maxsize: Número máximo de entradas
+        ttl: Validade de cada entrada em segundos (None = sem expiração)
+        max_weight: Soma máxima de weigher(value) entre as entradas (None = sem limite)
+        weigher: Função que estima o peso de um valor
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None, max_weight: Optional[int] = None,
+                 weigher: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weigher = weigher or (lambda value: 1)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at, weight = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Insere ou substitui a entrada (recalcula o peso e renova o TTL).
+        """
+        weight = self.weigher(value)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at, weight)
+            self._weight += weight
+            while self._data and (len(self._data) > self.maxsize or
+                                  (self.max_weight is not None and self._weight > self.max_weight)):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def values(self) -> List[Any]:
+        """
+        Cópia dos valores ainda válidos, sem alterar a ordem LRU nem as estatísticas.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [value for value, expires_at, _ in self._data.values() if expires_at is None or expires_at > now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def _remove(self, key: Hashable):
+        _, _, weight = self._data.pop(key)
+        self._weight -= weight
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "weight": self._weight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
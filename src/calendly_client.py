@@ -0,0 +1,114 @@
+import os
+import logging
+from typing import Dict, Iterator, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.availability_cache import availability_cache, METADATA
+from src.services import services
+
+logger = logging.getLogger(__name__)
+
+CALENDLY_API_URL = "https://api.calendly.com"
+
+class CalendlyClient:
+    """
+    Cliente único da API v2 do Calendly, compartilhado por SchedulingService e CalendlyService.
+
+    Usa uma sessão com pool de conexões keep-alive, timeouts em todas as chamadas, retry
+    para 429/5xx (todas as chamadas são GET) e paginação automática de collection/next_page.
+    Os event types de cada usuário ficam memorizados no nível de metadados do AvailabilityCache.
+    """
+
+    def __init__(self, token: Optional[str] = None, base_url: Optional[str] = None):
+        self.token = token or os.getenv("CALENDLY_ACCESS_TOKEN") or os.getenv("CALENDLY_API_KEY")
+        self.base_url = (base_url or os.getenv("CALENDLY_BASE_URL", CALENDLY_API_URL)).rstrip("/")
+        self.timeout = (float(os.getenv("CALENDLY_CONNECT_TIMEOUT", "3.05")),
+                        float(os.getenv("CALENDLY_READ_TIMEOUT", "10")))
+        self.page_size = int(os.getenv("CALENDLY_PAGE_SIZE", "100"))
+        self.session = self._build_session() if self.token else None
+
+    @property
+    def configured(self) -> bool:
+        return self.session is not None
+
+    def _build_session(self):
+        retries = Retry(
+            total=int(os.getenv("CALENDLY_MAX_RETRIES", "3")),
+            backoff_factor=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(os.getenv("CALENDLY_POOL_SIZE", "10")),
+                              max_retries=retries)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+        })
+        return session
+
+    def _url(self, path_or_uri: str) -> str:
+        # URIs de recursos (users, event_types, next_page) vêm absolutas, com o host público da API
+        if path_or_uri.startswith(CALENDLY_API_URL):
+            path_or_uri = path_or_uri[len(CALENDLY_API_URL):]
+        if path_or_uri.startswith("http"):
+            return path_or_uri
+        return f"{self.base_url}/{path_or_uri.lstrip('/')}"
+
+    def get(self, path_or_uri: str, params: Optional[Dict] = None) -> Dict:
+        """
+        GET com timeout. Levanta requests.exceptions.RequestException em falhas de rede ou HTTP.
+        """
+        if not self.configured:
+            raise RuntimeError("Calendly não configurado (CALENDLY_ACCESS_TOKEN ausente).")
+        response = self.session.get(self._url(path_or_uri), params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def paginate(self, path: str, params: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Itera todos os itens de 'collection', seguindo pagination.next_page até o fim.
+        """
+        params = dict(params or {}, count=self.page_size)
+        data = self.get(path, params)
+        while True:
+            yield from data.get("collection", [])
+            next_page = (data.get("pagination") or {}).get("next_page")
+            if not next_page:
+                return
+            # next_page já traz todos os parâmetros da consulta
+            data = self.get(next_page)
+
+    def get_user(self, user_uri: str = "users/me") -> Dict:
+        return availability_cache.get(METADATA, ("user", user_uri), lambda: self.get(user_uri)["resource"])
+
+    def get_event_types(self, user_uri: Optional[str] = None) -> List[Dict]:
+        """
+        Event types ativos do usuário (padrão: o dono do token), memorizados por CALENDLY_METADATA_TTL.
+        """
+        user_uri = user_uri or self.get_user()["uri"]
+        return availability_cache.get(
+            METADATA, ("event_types", user_uri),
+            lambda: list(self.paginate("event_types", {"user": user_uri, "active": "true"})),
+        )
+
+    def get_primary_event_type(self, user_uri: Optional[str] = None) -> Optional[Dict]:
+        """
+        Primeiro event type ativo do usuário (o usado para agendar), ou None.
+        """
+        return next((et for et in self.get_event_types(user_uri) if et.get("active", True)), None)
+
+    def get_available_times(self, event_type_uri: str, start_time: str, end_time: str) -> List[Dict]:
+        """
+        Horários livres de um event type entre start_time e end_time (ISO 8601, UTC). Sem cache.
+        """
+        data = self.get("event_type_available_times",
+                        {"event_type": event_type_uri, "start_time": start_time, "end_time": end_time})
+        return data.get("collection", [])
+
+calendly_client = services.register("calendly_client", CalendlyClient)
@@ -0,0 +1,250 @@
+import os
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterable, List
+from sqlalchemy import case, delete, exists, insert, update
+from sqlalchemy.orm import aliased
+from src.cache import LRUCache
+from src.database import db, insert_ignore
+from src.history import HISTORY_MAX_MESSAGES, load_history, trim_to_budget
+from src.models.conversation import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+# Custo fixo estimado (bytes) de um registro e de cada turno no buffer, além do texto
+_RECORD_OVERHEAD = 200
+_TURN_OVERHEAD = 64
+
+class ConversationRecord:
+    """
+    Entrada compacta do cache: identidade da conversa e buffer circular dos turnos recentes.
+    version espelha Conversation.version do momento em que o buffer foi montado; None
+    significa que o buffer ainda precisa ser carregado do banco.
+    """
+    __slots__ = ("conversation_id", "version", "turns")
+
+    def __init__(self, conversation_id: int, version=None, window: int = HISTORY_MAX_MESSAGES):
+        self.conversation_id = conversation_id
+        self.version = version
+        self.turns = deque(maxlen=window)
+
+    def weight(self) -> int:
+        return _RECORD_OVERHEAD + sum(_TURN_OVERHEAD + len(content) for _, content in self.turns)
+
+class ConversationCache:
+    """
+    Cache LRU/TTL de conversas por número de telefone, com write-through para as tabelas
+    conversations/messages.
+
+    A identidade (telefone -> id) nunca muda, então um hit dispensa a query. O buffer de
+    turnos é validado pela coluna Conversation.version, incrementada a cada gravação de
+    mensagens: se outro worker gunicorn escreveu na conversa, a versão diverge e o buffer
+    é recarregado. A validação de um lote inteiro é uma única query por chave primária.
+    """
+
+    def __init__(self, maxsize=None, ttl=None, max_bytes=None, window=None):
+        self.window = window or HISTORY_MAX_MESSAGES
+        self._records = LRUCache(
+            maxsize=maxsize or int(os.getenv("CONVERSATION_CACHE_SIZE", "100000")),
+            ttl=ttl or float(os.getenv("CONVERSATION_CACHE_TTL", "1800")),
+            max_weight=max_bytes or int(os.getenv("CONVERSATION_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            weigher=lambda record: record.weight(),
+        )
+        self._lock = threading.Lock()
+        self.history_hits = 0
+        self.history_misses = 0
+
+    def get_or_create_many(self, units: List[Dict]) -> Dict[str, int]:
+        """
+        Retorna {telefone: conversation_id} para os remetentes do lote, consultando o banco só para os ausentes do cache.
+        """
+        ids = {}
+        missing = []
+        for unit in units:
+            record = self._records.get(unit["from_number"])
+            if record is not None:
+                ids[unit["from_number"]] = record.conversation_id
+            else:
+                missing.append(unit)
+        if missing:
+            for phone_number, conversation in get_or_create_conversations(missing).items():
+                ids[phone_number] = conversation.id
+                # O buffer é carregado na primeira leitura do histórico
+                self._records.set(phone_number, ConversationRecord(conversation.id, None, self.window))
+        return ids
+
+    def add_messages(self, rows: List[Dict], phone_numbers: Dict[int, str]) -> List[Dict]:
+        """
+        Grava as mensagens (write-through) com um INSERT em lote, incrementa a versão das
+        conversas afetadas e faz commit. rows: {"conversation_id", "message_type", "content"}
+        e, nas mensagens recebidas, "wamid". Linhas com wamid já gravado são ignoradas.
+        phone_numbers: {conversation_id: telefone} para localizar as entradas do cache.
+
+        Returns:
+            As linhas de fato gravadas; as sem wamid recebem também o "id" gerado
+        """
+        if not rows:
+            return []
+        if any(row.get("wamid") for row in rows):
+            rows = [dict(row, wamid=row.get("wamid")) for row in rows]
+            inserted = {wamid for (wamid,) in insert_ignore(Message, rows, ["wamid"], returning=[Message.wamid])}
+            kept = []
+            for row in rows:
+                if row["wamid"] is None:
+                    kept.append(row)
+                elif row["wamid"] in inserted:
+                    # Uma única linha por wamid, mesmo que o lote repita a mensagem
+                    inserted.remove(row["wamid"])
+                    kept.append(row)
+            rows = kept
+            if not rows:
+                db.session.commit()
+                return []
+        else:
+            ids = db.session.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            rows = [dict(row, id=message_id) for row, message_id in zip(rows, ids)]
+        counts = {}
+        for row in rows:
+            counts[row["conversation_id"]] = counts.get(row["conversation_id"], 0) + 1
+        versions = dict(db.session.execute(
+            update(Conversation)
+            .where(Conversation.id.in_(list(counts)))
+            .values(version=Conversation.version + case(counts, value=Conversation.id, else_=0))
+            .returning(Conversation.id, Conversation.version)
+        ).all())
+        db.session.commit()
+
+        for conversation_id, count in counts.items():
+            phone_number = phone_numbers.get(conversation_id)
+            record = self._records.get(phone_number) if phone_number else None
+            if record is None:
+                continue
+            if record.version is not None and record.version + count == versions[conversation_id]:
+                for row in rows:
+                    if row["conversation_id"] == conversation_id:
+                        record.turns.append((row["message_type"], row["content"]))
+                record.version = versions[conversation_id]
+            else:
+                # Outro processo escreveu na conversa desde a última leitura: recarrega depois
+                record.version = None
+                record.turns.clear()
+            self._records.set(phone_number, record)
+        return rows
+
+    def histories(self, phone_numbers: Iterable[str], max_tokens=None) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Retorna a janela recente de cada conversa, validando todos os buffers com uma única query.
+        Telefones fora do cache (ex.: despejados pelo LRU desde get_or_create_many) são lidos
+        do banco com load_history(); sem conversa gravada, o histórico é vazio.
+        """
+        records = {}
+        result = {}
+        for phone_number in phone_numbers:
+            record = self._records.get(phone_number)
+            if record is not None:
+                records[phone_number] = record
+            else:
+                result[phone_number] = []
+        if result:
+            with self._lock:
+                self.history_misses += len(result)
+            for conversation_id, phone_number in db.session.query(Conversation.id, Conversation.phone_number).filter(
+                    Conversation.phone_number.in_(list(result))).all():
+                result[phone_number] = load_history(conversation_id, limit=self.window, max_tokens=max_tokens)
+        if not records:
+            return result
+        current = dict(db.session.query(Conversation.id, Conversation.version).filter(
+            Conversation.id.in_([record.conversation_id for record in records.values()])
+        ).all())
+
+        for phone_number, record in records.items():
+            version = current.get(record.conversation_id)
+            if record.version is not None and record.version == version:
+                with self._lock:
+                    self.history_hits += 1
+            else:
+                with self._lock:
+                    self.history_misses += 1
+                self._reload(record, version)
+                self._records.set(phone_number, record)
+            result[phone_number] = trim_to_budget(list(record.turns), max_tokens)
+        return result
+
+    def _reload(self, record: ConversationRecord, version):
+        rows = db.session.query(Message.message_type, Message.content).filter(
+            Message.conversation_id == record.conversation_id
+        ).order_by(Message.timestamp.desc(), Message.id.desc()).limit(self.window).all()
+        record.turns.clear()
+        record.turns.extend((role, content) for role, content in reversed(rows))
+        record.version = version
+
+    def truncate_message(self, message_id: int, content: str, phone_number: str):
+        """
+        Troca o texto de uma resposta já gravada pelo que de fato foi entregue (ou a apaga,
+        se nenhuma bolha saiu), incrementa a versão da conversa e descarta o buffer em cache.
+        Faz commit.
+        """
+        conversation_id = db.session.query(Message.conversation_id).filter(Message.id == message_id).scalar()
+        if conversation_id is None:
+            return
+        if content:
+            db.session.execute(update(Message).where(Message.id == message_id).values(content=content))
+        else:
+            db.session.execute(delete(Message).where(Message.id == message_id))
+        db.session.execute(update(Conversation).where(Conversation.id == conversation_id)
+                           .values(version=Conversation.version + 1))
+        db.session.commit()
+        record = self._records.get(phone_number)
+        if record is not None:
+            record.version = None
+            record.turns.clear()
+            self._records.set(phone_number, record)
+
+    def invalidate(self, phone_number: str):
+        self._records.pop(phone_number)
+
+    def stats(self) -> Dict:
+        stats = self._records.stats()
+        with self._lock:
+            lookups = self.history_hits + self.history_misses
+            stats.update({
+                "history_hits": self.history_hits,
+                "history_misses": self.history_misses,
+                "history_hit_rate": (self.history_hits / lookups) if lookups else 0.0,
+            })
+        return stats
+
+def get_or_create_conversations(units: List[Dict]) -> Dict[str, Conversation]:
+    """
+    Busca as conversas de todos os remetentes do lote com uma única query e cria as
+    que faltam com um único INSERT ... ON CONFLICT DO NOTHING.
+    """
+    phone_numbers = list({unit["from_number"] for unit in units})
+    conversations = {c.phone_number: c for c in
+                     Conversation.query.filter(Conversation.phone_number.in_(phone_numbers)).all()}
+    missing = [unit for unit in units if unit["from_number"] not in conversations]
+    if missing:
+        rows = {unit["from_number"]: {"phone_number": unit["from_number"], "user_name": unit.get("user_name")}
+                for unit in missing}
+        insert_ignore(Conversation, list(rows.values()), ["phone_number"])
+        db.session.commit()
+        conversations.update({c.phone_number: c for c in
+                              Conversation.query.filter(Conversation.phone_number.in_(list(rows))).all()})
+    return conversations
+
+def unanswered_wamids(wamids: List[str]) -> set:
+    """
+    Dos wamids informados, os já gravados que ainda não têm resposta do assistente depois
+    deles na conversa (ex.: o item falhou entre gravar a mensagem e responder).
+    """
+    if not wamids:
+        return set()
+    reply = aliased(Message)
+    answered = exists().where(reply.conversation_id == Message.conversation_id,
+                              reply.message_type == 'assistant', reply.id > Message.id)
+    return {wamid for (wamid,) in db.session.query(Message.wamid).filter(Message.wamid.in_(wamids), ~answered).all()}
+
+conversation_cache = ConversationCache()
@@ -1,4 +1,62 @@
+from typing import Dict, List
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
 
 # Cria uma instância única do SQLAlchemy que será importada por outros módulos
 db = SQLAlchemy()
+
+def insert_ignore(model, rows: List[Dict], conflict_columns: List[str], returning=None):
+    """
+    INSERT em lote que ignora linhas que violam a constraint única de conflict_columns
+    (ON CONFLICT DO NOTHING no PostgreSQL e no SQLite). Não faz commit.
+    Com returning (lista de colunas), o resultado traz apenas as linhas de fato inseridas.
+    """
+    if not rows:
+        return None
+    stmt = _dialect_insert(model, "insert_ignore").values(rows).on_conflict_do_nothing(index_elements=conflict_columns)
+    if returning:
+        stmt = stmt.returning(*returning)
+    return db.session.execute(stmt)
+
+def insert_or_fill(model, rows: List[Dict], conflict_columns: List[str], fill_columns: List[str]):
+    """
+    INSERT em lote que, havendo conflito em conflict_columns, apenas preenche as colunas de
+    fill_columns que ainda estão nulas (o primeiro valor gravado prevalece). Não faz commit.
+    As linhas devem ter as mesmas chaves e não podem repetir a chave de conflito.
+    """
+    if not rows:
+        return None
+    stmt = _dialect_insert(model, "insert_or_fill").values(rows)
+    table = model.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=conflict_columns,
+        set_={column: func.coalesce(table.c[column], stmt.excluded[column]) for column in fill_columns},
+    )
+    return db.session.execute(stmt)
+
+def insert_or_increment(model, rows: List[Dict], conflict_columns: List[str], increment_column: str,
+                        connection=None):
+    """
+    INSERT em lote que, havendo conflito em conflict_columns, soma o valor de increment_column
+    ao já gravado (contadores). Executa em connection, se informada (ex.: dentro de eventos de
+    flush), ou na sessão. Não faz commit.
+    """
+    if not rows:
+        return None
+    stmt = _dialect_insert(model, "insert_or_increment", connection).values(rows)
+    column = model.__table__.c[increment_column]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=conflict_columns,
+        set_={increment_column: column + stmt.excluded[increment_column]},
+    )
+    return (connection or db.session).execute(stmt)
+
+def _dialect_insert(model, operation: str, connection=None):
+    dialect = (connection or db.session.get_bind()).dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"{operation} não suportado para o dialeto {dialect}")
+    return insert(model)
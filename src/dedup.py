@@ -0,0 +1,65 @@
+import os
+import logging
+import threading
+from typing import Dict, Iterable, List
+from src.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+class WamidFilter:
+    """
+    Pré-filtro em memória de wamids já vistos (conjunto LRU limitado, com TTL), para
+    descartar reentregas do webhook da Meta antes de qualquer trabalho de banco, LLM ou rede.
+
+    É só uma primeira barreira: cada processo tem o seu e ele se perde num restart. A garantia
+    vem da constraint única em Message.wamid, checada pelo worker antes de chamar o LLM.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self._seen = LRUCache(
+            maxsize=maxsize or int(os.getenv("WAMID_DEDUP_SIZE", "200000")),
+            ttl=ttl or float(os.getenv("WAMID_DEDUP_TTL", "86400")),
+        )
+        self._lock = threading.Lock()
+        self.suppressed_memory = 0
+        self.suppressed_database = 0
+
+    def claim(self, wamids: Iterable[str]) -> List[str]:
+        """
+        Marca os wamids como vistos e retorna apenas os que ainda não tinham sido vistos,
+        na ordem recebida. Check-and-set atômico: entre chamadas concorrentes com o mesmo
+        wamid, só uma o recebe de volta.
+        """
+        fresh = []
+        with self._lock:
+            for wamid in wamids:
+                if wamid in self._seen:
+                    self.suppressed_memory += 1
+                    continue
+                self._seen.set(wamid, True)
+                fresh.append(wamid)
+        return fresh
+
+    def release(self, wamids: Iterable[str]):
+        """
+        Esquece wamids reivindicados cujo enfileiramento falhou, para que a reentrega seja aceita.
+        """
+        for wamid in wamids:
+            self._seen.pop(wamid)
+
+    def record_database_duplicates(self, count: int):
+        if count:
+            with self._lock:
+                self.suppressed_database += count
+            logger.info(f"{count} mensagens duplicadas descartadas pela constraint de wamid.")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "duplicates_suppressed": self.suppressed_memory + self.suppressed_database,
+                "suppressed_in_memory": self.suppressed_memory,
+                "suppressed_by_database": self.suppressed_database,
+                "tracked": len(self._seen),
+            }
+
+wamid_filter = WamidFilter()
@@ -0,0 +1,298 @@
+import heapq
+import atexit
+import logging
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+from src.metrics import metrics
+from src.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+class Reply:
+    """
+    Uma resposta a um destinatário, do início da geração até a última bolha.
+
+    Registra as bolhas de fato enviadas e se a resposta foi interrompida: por cancel()
+    (mensagem nova do usuário), por uma resposta mais nova (begin_reply) ou por falha de
+    envio. Depois de interrompida, schedule() recusa novas bolhas dela. Os campos são
+    alterados sob o lock do agendador.
+    """
+    __slots__ = ("recipient_id", "superseded", "truncated", "delivered", "outstanding", "finished", "_on_truncated")
+
+    def __init__(self, recipient_id: str):
+        self.recipient_id = recipient_id
+        self.superseded = False
+        self.truncated = False
+        self.delivered: List[str] = []
+        # Bolhas agendadas que ainda não foram enviadas nem descartadas
+        self.outstanding = 0
+        self.finished = False
+        self._on_truncated = None
+
+    def text(self) -> str:
+        return "\n".join(self.delivered)
+
+class _Recipient:
+    __slots__ = ("pending", "generation", "busy", "reply")
+
+    def __init__(self, generation: int):
+        # Bolhas ainda não enviadas: (phone_number_id, texto, pausa antes da próxima, ids de trace, Reply)
+        self.pending = deque()
+        self.generation = generation
+        self.busy = False
+        self.reply: Optional[Reply] = None
+
+class DeliveryScheduler:
+    """
+    Agendador de bolhas baseado em heap. Uma única thread de timer acorda na próxima bolha
+    vencida e submete o envio sem esperar a resposta; nenhuma thread fica parada durante
+    as pausas de "digitando..." nem durante a requisição HTTP.
+
+    Cada destinatário tem no máximo uma bolha no heap por vez: a próxima só é agendada
+    depois que a anterior foi enviada, o que garante a ordem. cancel() descarta as bolhas
+    pendentes de um destinatário (ex.: quando chega uma mensagem nova do usuário).
+
+    As gerações vêm de um contador global, e não por destinatário: a entrada de um
+    destinatário ocioso é apagada, e uma entrada recriada não pode reaproveitar a geração
+    de um item antigo ainda no heap.
+
+    Só alcança as bolhas deste processo: com vários workers gunicorn, a mensagem nova pode
+    chegar a outro processo. A resposta seguinte da conversa, quando gerada aqui, descarta o
+    que ainda restar da anterior (begin_reply).
+    """
+
+    def __init__(self, send_func: Callable[[str, str, str], Future]):
+        # send_func(recipient_id, texto, phone_number_id) -> Future cujo resultado é truthy se enviado
+        self.send_func = send_func
+        self._heap = []
+        self._seq = itertools.count()
+        self._recipients: Dict[str, _Recipient] = {}
+        self._generations = itertools.count(1)
+        # Resposta mais recente de cada destinatário (independe de haver bolhas pendentes)
+        self._replies: Dict[str, Reply] = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def _ensure_started(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._timer_loop, name="delivery-timer", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def begin_reply(self, recipient_id: str) -> Reply:
+        """
+        Inicia uma resposta ao destinatário. A anterior, se ainda tiver bolhas pendentes
+        ou estiver sendo gerada, é interrompida.
+        """
+        with self._cond:
+            self._supersede(recipient_id)
+            reply = self._replies[recipient_id] = Reply(recipient_id)
+            return reply
+
+    def schedule(self, recipient_id: str, bubbles: List[str], phone_number_id: str,
+                 initial_delay: float, pause_func: Callable[[], float], reply: Optional[Reply] = None) -> bool:
+        """
+        Agenda as bolhas para o destinatário. Se ele já tem bolhas em andamento, as novas
+        entram no fim da fila dele e seguem a mesma cadência.
+
+        Returns:
+            False se a resposta já foi interrompida; nesse caso nada é agendado
+        """
+        if not bubbles:
+            return True
+        with self._cond:
+            if reply is not None and reply.superseded:
+                reply.truncated = True
+                self._settle(reply)
+                return False
+            self._ensure_started()
+            recipient = self._recipients.get(recipient_id)
+            if recipient is None:
+                recipient = self._recipients[recipient_id] = _Recipient(next(self._generations))
+            trace_ids = tracer.current_ids()
+            for text in bubbles:
+                recipient.pending.append((phone_number_id, text, pause_func(), trace_ids, reply))
+            if reply is not None:
+                reply.outstanding += len(bubbles)
+            if not recipient.busy:
+                recipient.busy = True
+                self._push(time.monotonic() + initial_delay, recipient_id, recipient.generation)
+            return True
+
+    def finish_reply(self, reply: Reply, on_truncated: Callable[[str], None]) -> Optional[str]:
+        """
+        Encerra o agendamento da resposta (o gerador terminou ou foi interrompido).
+
+        Returns:
+            O texto entregue, se a resposta já foi interrompida e não tem mais bolhas por
+            enviar; o chamador grava esse texto no lugar da resposta completa. None se ainda
+            houver bolhas pendentes ou se a resposta saiu inteira; se ela for interrompida
+            depois, on_truncated(texto entregue) é chamado uma vez, na thread do agendador ou
+            do envio, e não deve bloquear.
+        """
+        with self._cond:
+            reply.finished = True
+            if reply.outstanding == 0:
+                self._forget(reply)
+                return reply.text() if reply.truncated else None
+            reply._on_truncated = on_truncated
+            return None
+
+    def cancel(self, recipient_id: str) -> int:
+        """
+        Descarta as bolhas ainda não enviadas do destinatário e interrompe a resposta em
+        andamento. Retorna quantas bolhas foram descartadas.
+        """
+        with self._cond:
+            dropped = self._supersede(recipient_id)
+        if dropped:
+            logger.info(f"{dropped} bolhas pendentes canceladas para {recipient_id}.")
+        return dropped
+
+    def _supersede(self, recipient_id: str) -> int:
+        # Chamado com o lock adquirido
+        reply = self._replies.pop(recipient_id, None)
+        if reply is not None:
+            reply.superseded = True
+        recipient = self._recipients.get(recipient_id)
+        if recipient is None:
+            return 0
+        dropped = len(recipient.pending)
+        self._drop_pending(recipient)
+        recipient.generation = next(self._generations)
+        if not recipient.busy:
+            del self._recipients[recipient_id]
+        return dropped
+
+    def _drop_pending(self, recipient: _Recipient):
+        # Chamado com o lock adquirido
+        replies = [entry[4] for entry in recipient.pending if entry[4] is not None]
+        recipient.pending.clear()
+        for reply in replies:
+            reply.outstanding -= 1
+            reply.truncated = True
+        for reply in set(replies):
+            self._settle(reply)
+
+    def _settle(self, reply: Reply):
+        # Chamado com o lock adquirido: avisa o dono de uma resposta já gravada que ela foi truncada
+        if not reply.finished or reply.outstanding or not reply.truncated or reply._on_truncated is None:
+            return
+        callback, reply._on_truncated = reply._on_truncated, None
+        self._forget(reply)
+        try:
+            callback(reply.text())
+        except Exception as e:
+            logger.error(f"Erro ao registrar resposta truncada para {reply.recipient_id}: {e}", exc_info=True)
+
+    def _forget(self, reply: Reply):
+        if self._replies.get(reply.recipient_id) is reply and reply.outstanding == 0 and reply.finished:
+            del self._replies[reply.recipient_id]
+
+    def pending_count(self, recipient_id: Optional[str] = None) -> int:
+        with self._cond:
+            if recipient_id is not None:
+                recipient = self._recipients.get(recipient_id)
+                return len(recipient.pending) if recipient else 0
+            return sum(len(r.pending) for r in self._recipients.values())
+
+    def _push(self, due: float, recipient_id: str, generation: int):
+        heapq.heappush(self._heap, (due, next(self._seq), recipient_id, generation))
+        self._cond.notify()
+
+    def _timer_loop(self):
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, recipient_id, generation = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                self._dispatch(recipient_id, generation)
+
+    def _dispatch(self, recipient_id: str, generation: int):
+        # Chamado com o lock adquirido
+        recipient = self._recipients.get(recipient_id)
+        if recipient is None:
+            return
+        if recipient.generation != generation or not recipient.pending:
+            self._release(recipient_id, recipient)
+            return
+        phone_number_id, text, pause, trace_ids, reply = recipient.pending.popleft()
+        started_wall, started = time.time(), time.perf_counter()
+        try:
+            future = tracer.run_with(trace_ids, self.send_func, recipient_id, text, phone_number_id)
+        except Exception as e:
+            logger.error(f"Erro ao enviar bolha para {recipient_id}: {e}", exc_info=True)
+            self._on_sent(recipient_id, generation, pause, False, text, reply)
+            return
+
+        def sent(f):
+            elapsed = time.perf_counter() - started
+            tracer.record("bubble_send", started_wall, elapsed, trace_ids=trace_ids)
+            self._on_sent(recipient_id, generation, pause, _succeeded(f), text, reply, elapsed)
+
+        future.add_done_callback(sent)
+
+    def _on_sent(self, recipient_id: str, generation: int, pause: float, sent: bool, text: str,
+                 reply: Optional[Reply], elapsed: Optional[float] = None):
+        if elapsed is not None:
+            # Da saída do timer à resposta da Graph API, incluindo a espera por token do rate limit
+            metrics.observe("bubble_send", elapsed)
+        if not sent:
+            metrics.count("bubble_send_failures")
+        # _on_sent pode rodar dentro de _dispatch (falha síncrona), que já tem o lock; Condition usa RLock
+        with self._cond:
+            if reply is not None:
+                reply.outstanding -= 1
+                if sent:
+                    reply.delivered.append(text)
+                else:
+                    reply.truncated = True
+            recipient = self._recipients.get(recipient_id)
+            if recipient is not None:
+                if not sent and recipient.generation == generation:
+                    # Mantém o comportamento anterior: uma falha interrompe o restante da resposta
+                    self._drop_pending(recipient)
+                if recipient.pending:
+                    self._push(time.monotonic() + pause, recipient_id, recipient.generation)
+                else:
+                    self._release(recipient_id, recipient)
+            if reply is not None:
+                self._settle(reply)
+                self._forget(reply)
+
+    def _release(self, recipient_id: str, recipient: _Recipient):
+        if recipient.pending:
+            self._push(time.monotonic(), recipient_id, recipient.generation)
+            return
+        recipient.busy = False
+        del self._recipients[recipient_id]
+
+    def shutdown(self, timeout: float = 10.0):
+        """
+        Para o timer. Bolhas ainda não vencidas são descartadas.
+        """
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            pending = sum(len(r.pending) for r in self._recipients.values())
+            self._cond.notify_all()
+        if pending:
+            logger.warning(f"Encerrando agendador com {pending} bolhas pendentes não enviadas.")
+        self._thread.join(timeout)
+
+def _succeeded(future: Future) -> bool:
+    return not future.cancelled() and future.exception() is None and bool(future.result())
@@ -0,0 +1,58 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from src.database import db
+from src.models.conversation import Message
+
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1024"))
+
+def estimate_tokens(text: str) -> int:
+    # Aproximação suficiente para orçamento de contexto: ~4 caracteres por token
+    return len(text) // 4 + 1
+
+def load_history(conversation_id: int, limit: Optional[int] = None, max_tokens: Optional[int] = None,
+                 before: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, str]]:
+    """
+    Carrega a janela mais recente do histórico de uma conversa, em ordem cronológica.
+
+    Usa o índice (conversation_id, timestamp, id) com uma query keyset: o custo depende
+    apenas do tamanho da janela, não do tamanho total da conversa.
+
+    Args:
+        conversation_id: ID da conversa
+        limit: Número máximo de mensagens (padrão HISTORY_MAX_MESSAGES)
+        max_tokens: Orçamento aproximado de tokens (padrão HISTORY_MAX_TOKENS); a mensagem mais recente é sempre incluída
+        before: Cursor (timestamp, id) para paginar para trás a partir de uma mensagem
+
+    Returns:
+        List[Dict]: Mensagens no formato {"role", "content"}
+    """
+    limit = limit or HISTORY_MAX_MESSAGES
+    max_tokens = max_tokens or HISTORY_MAX_TOKENS
+
+    query = db.session.query(Message.message_type, Message.content).filter(Message.conversation_id == conversation_id)
+    if before is not None:
+        before_timestamp, before_id = before
+        query = query.filter(db.or_(
+            Message.timestamp < before_timestamp,
+            db.and_(Message.timestamp == before_timestamp, Message.id < before_id),
+        ))
+    rows = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit).all()
+    return trim_to_budget(list(reversed(rows)), max_tokens)
+
+def trim_to_budget(turns: List[Tuple[str, str]], max_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    Mantém as mensagens mais recentes (role, content) que cabem no orçamento de tokens.
+    A mensagem mais recente é sempre incluída.
+    """
+    budget = max_tokens or HISTORY_MAX_TOKENS
+    window = []
+    for role, content in reversed(turns):
+        cost = estimate_tokens(content)
+        if window and cost > budget:
+            break
+        budget -= cost
+        window.append({"role": role, "content": content})
+    window.reverse()
+    return window
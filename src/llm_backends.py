@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import logging
+from typing import Dict, Iterator, List, Optional
+import requests
+from src.circuit_breaker import CircuitBreaker
+from src.metrics import metrics
+from src.tracing import tracer, TRACE_HEADER
+from src.worker_pool import RetryLater
+
+logger = logging.getLogger(__name__)
+
+# MUDANÇA PARA O MODELO QUE VOCÊ ESCOLHEU: GPT2
+MODEL_ID = "gpt2"
+API_URL = f"https://api-inference.huggingface.co/models/{MODEL_ID}"
+
+SYSTEM_PROMPT = ("Você é a Sofia, consultora de IA da Cognox.ai. Responda em português, "
+                 "de forma curta e cordial, em parágrafos separados por quebras de linha.")
+
+class LLMBackend:
+    """
+    Interface dos provedores de LLM. Um request é um dict com 'text' (mensagem atual)
+    e 'history' (lista de {"role", "content"} em ordem cronológica).
+    """
+    name = "base"
+    # Indica se generate_batch() resolve o lote numa única chamada ao provedor
+    supports_batching = False
+
+    def generate(self, request: Dict) -> Optional[str]:
+        """
+        Gera a resposta completa. Retorna None em caso de falha.
+        """
+        raise NotImplementedError
+
+    def generate_batch(self, requests: List[Dict]) -> List[Optional[str]]:
+        """
+        Gera as respostas de um lote, na mesma ordem. A implementação padrão faz uma chamada por item.
+        """
+        return [self.generate(request) for request in requests]
+
+    def stream(self, request: Dict) -> Iterator[str]:
+        """
+        Gera a resposta em fragmentos de texto, na ordem. A implementação padrão entrega tudo de uma vez.
+        """
+        text = self.generate(request)
+        if text is not None:
+            yield text
+
+    def metrics(self) -> Dict:
+        return {"backend": self.name}
+
+class UpstreamUnavailable(RetryLater):
+    """
+    Falha transitória do provedor (5xx, 429, timeout, falha de conexão ou circuit breaker
+    aberto). Propaga até o pool da fila, que devolve o item com available_at e tenta de
+    novo depois, sem segurar a thread do worker; delay é a espera sugerida pelo provedor.
+    """
+
+class HTTPBackend(LLMBackend):
+    """
+    Base dos provedores remotos: sessão com pool e circuit breaker.
+
+    Cada chamada faz uma única tentativa. Só 5xx, 429, timeouts e falhas de conexão contam
+    como falha no breaker; elas e o breaker aberto levantam UpstreamUnavailable, e a nova
+    tentativa fica com o backoff da fila (WEBHOOK_RETRY_BACKOFF_SECONDS), nunca com um sleep
+    na thread. Os demais 4xx são erros da própria requisição: retornam None (fallback).
+    """
+
+    def __init__(self, url: str, headers: Dict[str, str]):
+        self.url = url
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "3.05"))
+        self.read_timeout = float(os.getenv("LLM_READ_TIMEOUT", "15"))
+        self.breaker = CircuitBreaker(self.name)
+
+    def post(self, payload: Dict, stream: bool = False) -> Optional[requests.Response]:
+        """
+        Faz o POST. Retorna a resposta bem-sucedida, ou None se o provedor recusar a
+        requisição. Levanta UpstreamUnavailable em falhas transitórias.
+        """
+        if not self.breaker.allow():
+            metrics.count("llm_breaker_rejections")
+            raise UpstreamUnavailable(f"Circuit breaker do backend {self.name} aberto.", self.breaker.retry_after())
+
+        trace_id = tracer.current_id()
+        try:
+            # Em streaming, até os cabeçalhos; a geração em si entra em llm_total
+            with tracer.span("llm_upstream"):
+                response = self.session.post(self.url, json=payload, stream=stream,
+                                             headers={TRACE_HEADER: trace_id} if trace_id else None,
+                                             timeout=(self.connect_timeout, self.read_timeout))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            self.breaker.record_failure()
+            metrics.count("llm_upstream_failures")
+            raise UpstreamUnavailable(f"Falha ao contatar o backend {self.name}: {e}") from e
+        except requests.exceptions.RequestException as e:
+            self.breaker.release()
+            logger.error(f"Requisição ao backend {self.name} inválida: {e}.")
+            return None
+
+        if response.status_code == 429 or response.status_code >= 500:
+            self.breaker.record_failure()
+            metrics.count("llm_upstream_failures")
+            wait = _suggested_wait(response)
+            response.close()
+            raise UpstreamUnavailable(f"Backend {self.name} indisponível (HTTP {response.status_code}).", wait)
+        if response.status_code >= 400:
+            # Erro da requisição (payload, token, modelo): repetir não muda o resultado
+            self.breaker.release()
+            logger.error(f"Backend {self.name} recusou a requisição (HTTP {response.status_code}): "
+                         f"{response.text[:200]}")
+            response.close()
+            return None
+        self.breaker.record_success()
+        return response
+
+    def metrics(self) -> Dict:
+        return {"backend": self.name, "breaker": self.breaker.metrics()}
+
+class HuggingFaceBackend(HTTPBackend):
+    """
+    HuggingFace Inference API, na tarefa de text-generation com o prompt de build_prompt().
+    generate() envia um prompt; stream() o mesmo com "stream": true (eventos SSE com um
+    token por evento) e generate_batch() uma lista de prompts em "inputs" numa única
+    requisição. Os três usam o mesmo prompt e os mesmos parâmetros: a resposta vai para a
+    mesma chave do ResponseCache, qualquer que seja o caminho que a gerou.
+    """
+    name = "huggingface"
+    supports_batching = True
+
+    def __init__(self):
+        api_key = os.getenv("HUGGINGFACE_API_KEY")
+        if not api_key:
+            raise ValueError("HUGGINGFACE_API_KEY não definida.")
+        super().__init__(os.getenv("HUGGINGFACE_API_URL", API_URL), {"Authorization": f"Bearer {api_key}"})
+
+    def build_payload(self, inputs, stream: bool = False) -> Dict:
+        return {
+            "inputs": inputs,
+            "parameters": {"max_new_tokens": 120, "temperature": 0.85, "repetition_penalty": 1.3,
+                           "return_full_text": False},
+            "stream": stream,
+            # Não segura a conexão enquanto o modelo carrega: o 503 com estimated_time volta
+            # para a fila com essa espera
+            "options": {"wait_for_model": False},
+        }
+
+    def generate(self, request: Dict) -> Optional[str]:
+        response = self.post(self.build_payload(build_prompt(request)))
+        if response is None:
+            return None
+        try:
+            output = response.json()
+        except ValueError as e:
+            logger.error(f"Resposta inválida da API do Hugging Face: {e}")
+            return None
+        # Modelos de text-generation respondem com uma lista [{"generated_text": ...}]
+        if isinstance(output, list) and output:
+            output = output[0]
+        if isinstance(output, dict) and 'generated_text' in output:
+            return output['generated_text'].strip()
+        if isinstance(output, dict) and 'error' in output:
+            logger.error(f"Erro da API do Hugging Face: {output['error']}")
+        else:
+            logger.warning(f"Resposta inesperada da API: {output}")
+        return None
+
+    def generate_batch(self, requests: List[Dict]) -> List[Optional[str]]:
+        response = self.post(self.build_payload([build_prompt(r) for r in requests]))
+        if response is None:
+            return [None] * len(requests)
+        try:
+            output = response.json()
+        except ValueError as e:
+            logger.error(f"Resposta inválida da API do Hugging Face: {e}")
+            return [None] * len(requests)
+        if not isinstance(output, list) or len(output) != len(requests):
+            logger.warning(f"Resposta em lote inesperada da API: {output}")
+            return [None] * len(requests)
+        results = []
+        for item in output:
+            # Cada item pode vir como [{"generated_text": ...}] ou {"generated_text": ...}
+            if isinstance(item, list) and item:
+                item = item[0]
+            text = item.get("generated_text") if isinstance(item, dict) else None
+            results.append(text.strip() if text else None)
+        return results
+
+    def stream(self, request: Dict) -> Iterator[str]:
+        response = self.post(self.build_payload(build_prompt(request), stream=True), stream=True)
+        if response is None:
+            return
+        with response:
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                # Endpoint sem suporte a streaming: entrega a resposta inteira
+                output = response.json()
+                if isinstance(output, list) and output:
+                    output = output[0]
+                if isinstance(output, dict) and output.get("generated_text"):
+                    yield output["generated_text"]
+                return
+            for data in iter_sse(response):
+                event = json.loads(data)
+                token = (event.get("token") or {})
+                if not token.get("special") and token.get("text"):
+                    yield token["text"]
+
+class OpenAICompatibleBackend(HTTPBackend):
+    """
+    Qualquer endpoint compatível com /v1/chat/completions (OpenAI, vLLM, llama.cpp server, Ollama...).
+    """
+    name = "openai"
+
+    def __init__(self):
+        base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+        api_key = os.getenv("OPENAI_API_KEY", "")
+        self.model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        super().__init__(f"{base_url}/chat/completions", headers)
+
+    def build_payload(self, request: Dict, stream: bool) -> Dict:
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        messages += [{"role": h["role"], "content": h["content"]} for h in request["history"][:-1]]
+        messages.append({"role": "user", "content": request["text"]})
+        return {"model": self.model, "messages": messages, "temperature": 0.7, "max_tokens": 300, "stream": stream}
+
+    def generate(self, request: Dict) -> Optional[str]:
+        response = self.post(self.build_payload(request, stream=False))
+        if response is None:
+            return None
+        try:
+            return response.json()["choices"][0]["message"]["content"].strip()
+        except (ValueError, KeyError, IndexError) as e:
+            logger.error(f"Resposta inesperada do backend OpenAI: {e}")
+            return None
+
+    def stream(self, request: Dict) -> Iterator[str]:
+        response = self.post(self.build_payload(request, stream=True), stream=True)
+        if response is None:
+            return
+        with response:
+            for data in iter_sse(response):
+                if data == "[DONE]":
+                    break
+                delta = (json.loads(data).get("choices") or [{}])[0].get("delta") or {}
+                if delta.get("content"):
+                    yield delta["content"]
+
+class LocalBackend(LLMBackend):
+    """
+    Modelo local determinístico, sem rede, para testes e benchmarks. Gera uma resposta de
+    LOCAL_LLM_PARAGRAPHS parágrafos e emite um token a cada LOCAL_LLM_TOKEN_DELAY segundos,
+    simulando a cadência de um modelo real. Um lote custa o mesmo que sua resposta mais longa,
+    como na decodificação em lote de uma GPU.
+    """
+    name = "local"
+    supports_batching = True
+
+    def __init__(self, token_delay: Optional[float] = None, paragraphs: Optional[int] = None):
+        self.token_delay = token_delay if token_delay is not None else float(os.getenv("LOCAL_LLM_TOKEN_DELAY", "0"))
+        self.paragraphs = paragraphs or int(os.getenv("LOCAL_LLM_PARAGRAPHS", "3"))
+
+    def _tokens(self, request: Dict) -> List[str]:
+        topic = request["text"].strip().rstrip("?!.") or "isso"
+        lines = [f"Entendi, você perguntou sobre \"{topic}\"."]
+        lines += [f"Este é o ponto {i} da resposta da Sofia sobre o assunto." for i in range(1, self.paragraphs)]
+        text = "\n".join(lines)
+        return [token + " " for token in text.replace("\n", " \n ").split(" ") if token]
+
+    def generate(self, request: Dict) -> Optional[str]:
+        return "".join(self.stream(request)).strip()
+
+    def generate_batch(self, requests: List[Dict]) -> List[Optional[str]]:
+        batch = [self._tokens(request) for request in requests]
+        if self.token_delay:
+            time.sleep(self.token_delay * max(len(tokens) for tokens in batch))
+        return ["".join("\n" if t.strip() == "" else t for t in tokens).strip() for tokens in batch]
+
+    def stream(self, request: Dict) -> Iterator[str]:
+        for token in self._tokens(request):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield "\n" if token.strip() == "" else token
+
+BACKENDS = {
+    "huggingface": HuggingFaceBackend,
+    "openai": OpenAICompatibleBackend,
+    "local": LocalBackend,
+}
+
+def build_backend(name: Optional[str] = None) -> LLMBackend:
+    name = (name or os.getenv("LLM_BACKEND", "huggingface")).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"LLM_BACKEND desconhecido: {name}. Opções: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+def build_prompt(request: Dict) -> str:
+    """
+    Monta um prompt de texto corrido a partir do histórico, para modelos de text-generation.
+    """
+    speakers = {"user": "Cliente", "assistant": "Sofia"}
+    lines = [SYSTEM_PROMPT]
+    lines += [f"{speakers.get(h['role'], h['role'])}: {h['content']}" for h in request["history"][:-1]]
+    lines.append(f"Cliente: {request['text']}")
+    lines.append("Sofia:")
+    return "\n".join(lines)
+
+def iter_sse(response: requests.Response) -> Iterator[str]:
+    """
+    Itera o campo data dos eventos Server-Sent Events de uma resposta em streaming.
+    """
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            yield line[5:].strip()
+
+def _suggested_wait(response: requests.Response) -> Optional[float]:
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    try:
+        return response.json().get("estimated_time")
+    except (ValueError, AttributeError):
+        return None
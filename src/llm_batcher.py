@@ -0,0 +1,133 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+from src.metrics import metrics
+from src.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class InferenceBatcher:
+    """
+    Agrupa requisições de geração de várias conversas em lotes.
+
+    A thread coletora espera a primeira requisição, junta as que chegarem em até
+    max_wait_ms (ou até max_batch_size) e despacha o lote: backends com supports_batching
+    recebem uma única chamada generate_batch; os demais recebem as chamadas em paralelo.
+    Cada chamador recebe o próprio resultado pelo Future devolvido em submit().
+    """
+
+    def __init__(self, backend, max_batch_size: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                 dispatchers: Optional[int] = None):
+        self.backend = backend
+        self.max_batch_size = max_batch_size or int(os.getenv("LLM_BATCH_MAX_SIZE", "8"))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else float(os.getenv("LLM_BATCH_MAX_WAIT_MS", "10"))) / 1000
+        self.dispatchers = dispatchers or int(os.getenv("LLM_BATCH_DISPATCHERS", "4"))
+        self._queue = queue.Queue()
+        self._executor = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.max_observed_batch = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            # Os lotes são despachados em paralelo para que a coleta do próximo não espere o anterior
+            workers = self.dispatchers if self.backend.supports_batching else self.dispatchers * self.max_batch_size
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-batch")
+            self._thread = threading.Thread(target=self._collect_loop, name="llm-batcher", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def submit(self, request: Dict) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((request, future, (time.perf_counter(), tracer.current_ids())))
+        return future
+
+    def generate(self, request: Dict) -> Optional[str]:
+        return self.submit(request).result()
+
+    def _collect_loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._record(len(batch))
+            dispatched, now = time.perf_counter(), time.time()
+            for _, _, (enqueued, trace_ids) in batch:
+                metrics.observe("llm_queue", dispatched - enqueued)
+                tracer.record("llm_queue", now - (dispatched - enqueued), dispatched - enqueued, trace_ids=trace_ids)
+            if self.backend.supports_batching:
+                self._executor.submit(self._run_batch, batch)
+            else:
+                for item in batch:
+                    self._executor.submit(self._run_batch, [item])
+            if stop:
+                return
+
+    def _run_batch(self, batch: List):
+        # A chamada ao provedor roda com os ids de todas as conversas do lote
+        with tracer.activate(trace_id for _, _, (_, trace_ids) in batch for trace_id in trace_ids):
+            self._generate(batch)
+
+    def _generate(self, batch: List):
+        requests = [request for request, _, _ in batch]
+        try:
+            # Lotes de qualquer tamanho, inclusive 1, usam o mesmo caminho: a resposta não pode
+            # depender de quantas conversas caíram na mesma janela
+            results = self.backend.generate_batch(requests)
+        except Exception as e:
+            logger.error(f"Erro no lote de {len(batch)} requisições ao LLM: {e}", exc_info=True)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def _record(self, size: int):
+        with self._lock:
+            self.batches += 1
+            self.requests += size
+            self.max_observed_batch = max(self.max_observed_batch, size)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "avg_batch_size": (self.requests / self.batches) if self.batches else 0.0,
+                "max_batch_size": self.max_observed_batch,
+                "queue_depth": self._queue.qsize(),
+            }
+
+    def shutdown(self):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(5)
+        self._executor.shutdown(wait=True)
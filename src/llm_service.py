@@ -1,23 +1,29 @@
 import os
-import requests
 import logging
 import time
-from typing import List, Dict
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Iterator, List, Dict, Optional
 from datetime import datetime
 import pytz
+from src.response_cache import ResponseCache
+from src.llm_backends import UpstreamUnavailable, build_backend
+from src.llm_batcher import InferenceBatcher
+from src.metrics import metrics
+from src.services import services
 
 logger = logging.getLogger(__name__)
 
-# MUDANÇA PARA O MODELO QUE VOCÊ ESCOLHEU: GPT2
-MODEL_ID = "gpt2"
-API_URL = f"https://api-inference.huggingface.co/models/{MODEL_ID}"
+FALLBACK_MESSAGE = "Desculpe, estou com uma pequena instabilidade. Poderia repetir sua mensagem?"
+ERROR_MESSAGE = "Desculpe, estou com uma instabilidade no meu sistema. Poderia repetir, por favor?"
 
 class CognoxLLMService:
     def __init__(self ):
-        self.api_key = os.getenv("HUGGINGFACE_API_KEY")
-        if not self.api_key:
-            raise ValueError("HUGGINGFACE_API_KEY não definida.")
-        self.headers = {"Authorization": f"Bearer {self.api_key}"}
+        # Provedor escolhido por LLM_BACKEND: huggingface (padrão), openai ou local
+        self.backend = build_backend()
+        self.response_cache = ResponseCache()
+        # Com LLM_BATCHING=true, as requisições de várias conversas são agrupadas em lotes
+        # (LLM_BATCH_MAX_SIZE / LLM_BATCH_MAX_WAIT_MS) em vez de uma chamada por mensagem
+        self.batcher = InferenceBatcher(self.backend) if os.getenv("LLM_BATCHING", "false").lower() == "true" else None
 
     def get_greeting(self) -> str:
         try:
@@ -31,74 +37,147 @@ class CognoxLLMService:
             logger.error(f"Erro ao obter fuso horário: {e}")
             return "Olá"
 
-    def query_huggingface_with_retry(self, payload, retries=3, delay=15):
+    def _greeting_message(self) -> str:
+        return f"{self.get_greeting()}! Eu sou a Sofia, consultora de IA aqui na Cognox.ai.\nComo posso te ajudar hoje?"
+
+    def _generate(self, user_message: str, history: List[Dict[str, str]]) -> Optional[str]:
         """
-        Tenta fazer a requisição à API, com novas tentativas se o modelo estiver carregando.
+        Chama o modelo upstream. Retorna None em caso de erro, para que a falha não seja armazenada no cache.
         """
-        for i in range(retries):
-            try:
-                response = requests.post(API_URL, headers=self.headers, json=payload)
-                
-                if response.status_code == 503:
-                    estimated_time = response.json().get("estimated_time", delay)
-                    logger.info(f"Modelo BlenderBot está carregando. Tentando novamente em {estimated_time} segundos...")
-                    time.sleep(estimated_time)
-                    continue
-
-                response.raise_for_status()
-                return response.json()
-
-            except (requests.exceptions.RequestException, requests.exceptions.JSONDecodeError) as e:
-                logger.warning(f"Tentativa {i+1}/{retries} falhou: {e}. Tentando novamente em {delay} segundos...")
-                time.sleep(delay)
-        
-        logger.error("Todas as tentativas de contatar a API do Hugging Face falharam.")
-        return {"error": "Falha ao contatar a API após múltiplas tentativas."}
+        request = {"text": user_message, "history": history}
+        if self.batcher is not None:
+            return self.batcher.generate(request)
+        return self.backend.generate(request)
 
     def process_message(self, user_message: str, history: List[Dict[str, str]]) -> str:
         """
-        Processa a mensagem do usuário usando o BlenderBot.
+        Processa a mensagem do usuário e retorna a resposta completa.
+
+        Falhas transitórias do provedor (UpstreamUnavailable) propagam: o pool devolve o
+        item à fila e a mensagem é respondida numa próxima tentativa.
         """
         try:
             is_first_message = len(history) <= 1
             if is_first_message:
-                greeting = self.get_greeting()
-                return f"{greeting}! Eu sou a Sofia, consultora de IA aqui na Cognox.ai.\nComo posso te ajudar hoje?"
-
-            # Prepara o histórico para o BlenderBot
-            past_user_inputs = [h['content'] for h in history if h['role'] == 'user']
-            generated_responses = [h['content'] for h in history if h['role'] == 'assistant']
-
-            payload = {
-                "inputs": {
-                    "past_user_inputs": past_user_inputs,
-                    "generated_responses": generated_responses,
-                    "text": user_message,
-                },
-                "parameters": {
-                    "repetition_penalty": 1.3,
-                    "temperature": 0.85,
-                    "min_length": 8, 
-                    "max_length": 60,
-                },
-                "options": {
-                    "wait_for_model": True # Pede para a API esperar o modelo carregar
-                }
-            }
-            
-            output = self.query_huggingface_with_retry(payload)
-            
-            if 'generated_text' in output:
-                return output['generated_text'].strip()
-            elif 'error' in output:
-                logger.error(f"Erro da API do Hugging Face: {output['error']}")
-                return "Desculpe, estou com uma pequena instabilidade. Poderia repetir sua mensagem?"
-            else:
-                logger.warning(f"Resposta inesperada da API: {output}")
-                return "Compreendo. Poderia me dar mais detalhes?"
+                return self._greeting_message()
 
+            key = self.response_cache.key(user_message, history)
+            response = self.response_cache.get_or_compute(key, lambda: self._generate(user_message, history))
+            if response is None:
+                metrics.count("llm_fallbacks")
+                return FALLBACK_MESSAGE
+            return response
+
+        except UpstreamUnavailable:
+            # O item volta para a fila e a mensagem é respondida na próxima tentativa
+            raise
         except Exception as e:
-            logger.error(f"Erro ao processar mensagem com Hugging Face: {e}", exc_info=True)
-            return "Desculpe, estou com uma instabilidade no meu sistema. Poderia repetir, por favor?"
+            metrics.count("llm_errors")
+            logger.error(f"Erro ao processar mensagem com o LLM: {e}", exc_info=True)
+            return ERROR_MESSAGE
+
+    def stream_message(self, user_message: str, history: List[Dict[str, str]],
+                       cancelled: Optional[Callable[[], bool]] = None) -> Iterator[str]:
+        """
+        Processa a mensagem do usuário e entrega a resposta parágrafo a parágrafo, assim que
+        cada um fica completo, para que a primeira bolha saia antes do fim da geração.
+        Com o batching ativo a resposta chega inteira e é apenas dividida em parágrafos.
+
+        Como em process_message, chamadas concorrentes com a mesma chave de cache não
+        repetem a chamada upstream: a primeira transmite e as demais esperam a resposta dela.
+
+        cancelled() é consultado a cada fragmento: quando verdadeiro, a geração é abandonada
+        (a conexão com o provedor é fechada) e a resposta parcial não vai para o cache.
+
+        Como em process_message, UpstreamUnavailable propaga para o pool da fila.
+        """
+        if self.batcher is not None:
+            yield from _paragraphs([self.process_message(user_message, history)])
+            return
+
+        if len(history) <= 1:
+            yield from _paragraphs([self._greeting_message()])
+            return
+
+        key = self.response_cache.key(user_message, history)
+        cached, pending = self.response_cache.begin(key)
+        if pending is not None:
+            # Mesma pergunta já em geração: espera a resposta inteira e a divide em parágrafos
+            cached = _wait(pending, cancelled)
+            if cached is None and cancelled is not None and cancelled():
+                return
+        if cached is not None:
+            yield from _paragraphs([cached])
+            return
+        # Sem resposta do líder (falhou ou foi interrompido), quem esperava gera por conta própria
+        leader = pending is None
+
+        started = time.monotonic()
+        chunks = []
+        response = None
+        try:
+            stream = self.backend.stream({"text": user_message, "history": history})
+            try:
+                for paragraph in _paragraphs(_recording(stream, chunks, cancelled)):
+                    yield paragraph
+            finally:
+                stream.close()
+            if cancelled is None or not cancelled():
+                response = "".join(chunks).strip() or None
+        except UpstreamUnavailable:
+            # Levantada no POST, antes de qualquer fragmento: nada foi entregue ao usuário
+            raise
+        except Exception as e:
+            metrics.count("llm_errors")
+            logger.error(f"Erro ao processar mensagem com o LLM: {e}", exc_info=True)
+            if not chunks:
+                yield ERROR_MESSAGE
+            return
+        finally:
+            # Também em falhas e quando o consumidor fecha o gerador: quem espera não pode ficar preso
+            if leader:
+                self.response_cache.finish(key, response, time.monotonic() - started)
+
+        if cancelled is not None and cancelled():
+            metrics.count("llm_streams_cancelled")
+            return
+        if response is None:
+            metrics.count("llm_fallbacks")
+            yield FALLBACK_MESSAGE
+            return
+        if not leader:
+            self.response_cache.put(key, response, time.monotonic() - started)
+
+def _wait(future, cancelled: Optional[Callable[[], bool]]) -> Optional[str]:
+    # Espera a chamada líder, desistindo se a resposta deste chamador for interrompida
+    while True:
+        try:
+            return future.result(timeout=0.1)
+        except FutureTimeout:
+            if cancelled is not None and cancelled():
+                return None
+        except Exception:
+            return None
+
+def _recording(chunks, sink: List[str], cancelled: Optional[Callable[[], bool]] = None) -> Iterator[str]:
+    for chunk in chunks:
+        if cancelled is not None and cancelled():
+            return
+        sink.append(chunk)
+        yield chunk
+
+def _paragraphs(chunks) -> Iterator[str]:
+    """
+    Reagrupa fragmentos de texto em parágrafos não vazios, emitindo cada um assim que a quebra de linha chega.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        while "\n" in buffer:
+            paragraph, buffer = buffer.split("\n", 1)
+            if paragraph.strip():
+                yield paragraph.strip()
+    if buffer.strip():
+        yield buffer.strip()
 
-llm_service = CognoxLLMService()
+llm_service = services.register("llm_service", CognoxLLMService)
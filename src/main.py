@@ -2,12 +2,23 @@ import os
 from flask import Flask
 from flask_cors import CORS
 from src.database import db
-from src.routes.whatsapp import whatsapp_bp
+from src.routes.whatsapp import whatsapp_bp, inbound_pool
+from src.routes.scheduling import scheduling_bp
+from src.reminders import reminder_dispatcher
+from src.whatsapp_api import whatsapp_api
+from src.routes.admin import admin_bp
+from src.status_writer import status_writer
+from src.schema import migrate
+from src.services import services
+from src.metrics import metrics
+from src.tracing import install_log_record_factory
 import logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Toda linha de log traz o id de correlação da mensagem em processamento ('-' fora de um trace)
+install_log_record_factory()
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s')
 
-def create_app():
+def create_app(start_workers: bool = True):
     app = Flask(__name__)
     CORS(app)
 
@@ -22,10 +33,32 @@ def create_app():
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True}
     
     db.init_app(app)
+    services.init_app(app)
 
-    with app.app_context():
-        db.create_all()
+    # O schema é responsabilidade do passo de migração (python -m src.schema), não de cada worker
+    if os.getenv("AUTO_MIGRATE", "false").lower() == "true":
+        migrate(app)
 
     app.register_blueprint(whatsapp_bp, url_prefix="/api/whatsapp")
+    app.register_blueprint(scheduling_bp, url_prefix="/api/scheduling")
+    app.register_blueprint(admin_bp, url_prefix="/api/admin")
+    if start_workers:
+        start_background_workers(app)
     logging.info("Aplicação criada e configurada com sucesso.")
     return app
+
+def start_background_workers(app):
+    """
+    Inicia as threads do processo (pool do webhook, gravação de status, métricas
+    compartilhadas, jobs de lembretes abandonados). Com gunicorn --preload, create_app(start_workers=False) roda no master e
+    esta função roda em cada worker após o fork.
+    """
+    inbound_pool.start(app)
+    status_writer.start(app)
+    metrics.share()
+    # O cliente da Graph API só é construído se algum job abandonado precisar ser retomado
+    reminder_dispatcher.resume(app, lambda phone_number, text: whatsapp_api.submit_text_message(phone_number, text))
+
+if __name__ == "__main__":
+    # Servidor de desenvolvimento (python -m src.main); em produção use gunicorn src.wsgi:app
+    create_app().run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
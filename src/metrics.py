@@ -0,0 +1,224 @@
+import os
+import json
+import glob
+import time
+import atexit
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) dos buckets das etapas: de consultas ao banco (ms) a chamadas ao LLM (dezenas de s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_HELP = "Duração de cada etapa do caminho webhook -> resposta, em segundos."
+EVENT_HELP = "Ocorrências de erros, fallbacks e descartes no caminho webhook -> resposta."
+
+class MetricsRegistry:
+    """
+    Histogramas de duração por etapa e contadores de eventos, no formato de texto do Prometheus.
+
+    Cada thread grava no próprio dicionário (threading.local), sem lock: só a thread dona
+    escreve nele. O lock só é usado quando uma thread registra seu dicionário pela primeira
+    vez e na coleta, que soma os dicionários de todas as threads (inclusive as que já
+    terminaram, para que os totais nunca diminuam). Nenhum rótulo carrega dados de mensagens:
+    só nomes de etapa e de evento, de um conjunto fixo.
+
+    Os valores são do processo. Com vários workers gunicorn, METRICS_SHARED_DIR faz cada
+    worker gravar seu snapshot num arquivo do diretório a cada METRICS_FLUSH_SECONDS, e a
+    coleta soma os arquivos de todos os workers: contadores e histogramas incluem os workers
+    que já terminaram (os totais não diminuem), gauges só os vivos. Sem o diretório, cada
+    coleta reflete só o worker que atendeu o request.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = "cognox"):
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self._lock = threading.Lock()
+        self.shared_dir: Optional[str] = None
+
+    def _shard(self) -> Dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, stage: str, seconds: float):
+        shard = self._shard()
+        key = ("stage", stage)
+        entry = shard.get(key)
+        if entry is None:
+            # [contagem por bucket..., +Inf, soma]
+            entry = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, seconds)] += 1
+        entry[-1] += seconds
+
+    def count(self, event: str, amount: int = 1):
+        shard = self._shard()
+        key = ("event", event)
+        shard[key] = shard.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def register_gauge(self, name: str, help_text: str, func: Callable[[], float]):
+        """
+        Valor lido na hora da coleta (ex.: profundidade de uma fila).
+        """
+        self._gauges[name] = (help_text, func)
+
+    def snapshot(self) -> Dict:
+        """
+        Soma dos dicionários de todas as threads: {'stages': {etapa: {'buckets', 'count', 'sum'}},
+        'events': {evento: total}}. Os buckets são cumulativos (le), como no Prometheus.
+        """
+        with self._lock:
+            shards = list(self._shards)
+        stages: Dict[str, List] = {}
+        events: Dict[str, int] = {}
+        for shard in shards:
+            for (kind, name), value in list(shard.items()):
+                if kind == "event":
+                    events[name] = events.get(name, 0) + value
+                else:
+                    total = stages.setdefault(name, [0] * len(value[:-1]) + [0.0])
+                    for i, amount in enumerate(value):
+                        total[i] += amount
+        result = {}
+        for stage, entry in sorted(stages.items()):
+            cumulative, running = [], 0
+            for amount in entry[:-1]:
+                running += amount
+                cumulative.append(running)
+            result[stage] = {"buckets": cumulative, "count": running, "sum": entry[-1]}
+        return {"stages": result, "events": dict(sorted(events.items()))}
+
+    def share(self, directory: Optional[str] = None, interval: Optional[float] = None):
+        """
+        Passa a gravar o snapshot deste processo em METRICS_SHARED_DIR (ou directory) e a
+        somar os dos demais processos na coleta. Sem diretório configurado, não faz nada.
+        """
+        directory = directory or os.getenv("METRICS_SHARED_DIR")
+        if not directory or self.shared_dir:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.shared_dir = directory
+        interval = interval or float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+        def flush_loop():
+            while True:
+                time.sleep(interval)
+                self.flush()
+
+        threading.Thread(target=flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def flush(self):
+        if not self.shared_dir:
+            return
+        data = dict(self.snapshot(), pid=os.getpid(), gauges=self._gauge_values())
+        path = os.path.join(self.shared_dir, f"metrics-{os.getpid()}.json")
+        try:
+            # Escrita atômica: a coleta em outro processo nunca lê um arquivo pela metade
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Erro ao gravar métricas em {path}: {e}")
+
+    def _gauge_values(self) -> Dict[str, float]:
+        values = {}
+        for name, (_, func) in self._gauges.items():
+            try:
+                values[name] = func()
+            except Exception:
+                continue
+        return values
+
+    def _merged(self) -> Tuple[Dict, Dict[str, float]]:
+        # Snapshot deste processo somado aos arquivos dos demais
+        snapshot, gauges = self.snapshot(), self._gauge_values()
+        if not self.shared_dir:
+            return snapshot, gauges
+        for path in glob.glob(os.path.join(self.shared_dir, "metrics-*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if other.get("pid") == os.getpid():
+                continue
+            for stage, data in other["stages"].items():
+                total = snapshot["stages"].setdefault(
+                    stage, {"buckets": [0] * len(data["buckets"]), "count": 0, "sum": 0.0})
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], data["buckets"])]
+                total["count"] += data["count"]
+                total["sum"] += data["sum"]
+            for event, amount in other["events"].items():
+                snapshot["events"][event] = snapshot["events"].get(event, 0) + amount
+            if _alive(other.get("pid")):
+                for name, value in other.get("gauges", {}).items():
+                    gauges[name] = gauges.get(name, 0) + value
+        snapshot["stages"] = dict(sorted(snapshot["stages"].items()))
+        snapshot["events"] = dict(sorted(snapshot["events"].items()))
+        return snapshot, gauges
+
+    def render_prometheus(self) -> str:
+        snapshot, gauges = self._merged()
+        stage_metric = f"{self.prefix}_stage_duration_seconds"
+        event_metric = f"{self.prefix}_events_total"
+        lines = [f"# HELP {stage_metric} {STAGE_HELP}", f"# TYPE {stage_metric} histogram"]
+        for stage, data in snapshot["stages"].items():
+            for bound, amount in zip(self.buckets + (float("inf"),), data["buckets"]):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{stage_metric}_bucket{{stage="{stage}",le="{le}"}} {amount}')
+            lines.append(f'{stage_metric}_sum{{stage="{stage}"}} {data["sum"]}')
+            lines.append(f'{stage_metric}_count{{stage="{stage}"}} {data["count"]}')
+        lines += [f"# HELP {event_metric} {EVENT_HELP}", f"# TYPE {event_metric} counter"]
+        for event, amount in snapshot["events"].items():
+            lines.append(f'{event_metric}{{event="{event}"}} {amount}')
+        for name, (help_text, _) in sorted(self._gauges.items()):
+            if name not in gauges:
+                continue
+            metric = f"{self.prefix}_{name}"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge", f"{metric} {gauges[name]}"]
+        return "\n".join(lines) + "\n"
+
+def clear_shared_dir(directory: Optional[str] = None):
+    """
+    Apaga os snapshots de uma execução anterior (chamado pelo master do gunicorn no boot).
+    """
+    directory = directory or os.getenv("METRICS_SHARED_DIR")
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, "metrics-*.json*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+metrics = MetricsRegistry()
@@ -5,21 +5,29 @@ from datetime import datetime
 class Conversation(db.Model):
     __tablename__ = 'conversations'
     id = db.Column(db.Integer, primary_key=True)
-    phone_number = db.Column(db.String(20), nullable=False, index=True)
+    phone_number = db.Column(db.String(20), nullable=False, unique=True, index=True)
     user_name = db.Column(db.String(100), nullable=True)
     status = db.Column(db.String(20), default='active')
+    # Incrementado a cada mensagem gravada; permite validar caches de histórico entre processos
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan')
+    # Para montar o contexto do LLM use src.history.load_history, que carrega só a janela recente
+    messages = db.relationship('Message', backref='conversation', lazy=True, cascade='all, delete-orphan',
+                               order_by='(Message.timestamp, Message.id)')
     scheduling_info = db.relationship('SchedulingInfo', backref='conversation', uselist=False, cascade='all, delete-orphan')
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    # Índice composto para a busca por janela (keyset) do histórico de uma conversa
+    __table_args__ = (db.Index('ix_messages_conversation_timestamp', 'conversation_id', 'timestamp', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False)
     message_type = db.Column(db.String(10), nullable=False)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Id da mensagem no WhatsApp (só mensagens recebidas); a unicidade torna a ingestão idempotente
+    wamid = db.Column(db.String(128), nullable=True, unique=True)
 
 class SchedulingInfo(db.Model):
     __tablename__ = 'scheduling_info'
@@ -28,4 +36,13 @@ class SchedulingInfo(db.Model):
     name = db.Column(db.String(100))
     company = db.Column(db.String(100))
     preferred_time = db.Column(db.String(200))
-    status = db.Column(db.String(20), default='pending')
+    # Serviço de interesse informado no agendamento; vira o assunto do lembrete
+    service_interest = db.Column(db.String(200))
+    # Contadores em scheduling_status_counts são mantidos por src.scheduling_stats a cada mudança
+    status = db.Column(db.String(20), default='pending', index=True)
+    # Dia de criação do agendamento; base da série diária reconstruída por rebuild_status_counts
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Instante da reunião (UTC) resolvido de preferred_time; define a janela dos lembretes
+    scheduled_for = db.Column(db.DateTime, nullable=True, index=True)
+    # Preenchido ao reivindicar o envio do lembrete; impede lembrar a mesma reunião duas vezes
+    reminded_at = db.Column(db.DateTime, nullable=True)
@@ -0,0 +1,22 @@
+from src.database import db
+from datetime import datetime
+
+class InboundQueueItem(db.Model):
+    """
+    Fila persistente de mensagens recebidas. Cada linha é uma unidade de trabalho de uma
+    conversa aguardando o pool de workers; sobrevive a reinícios do processo.
+    """
+    __tablename__ = 'inbound_queue'
+    # Verificação de itens anteriores da mesma partição na reivindicação
+    __table_args__ = (db.Index('ix_inbound_queue_partition_key_id', 'partition_key', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    # Chave de particionamento (número do remetente): itens com a mesma chave são processados em ordem
+    partition_key = db.Column(db.String(20), nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    # Itens devolvidos à fila após uma falha só podem ser reivindicados a partir deste instante (backoff)
+    available_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
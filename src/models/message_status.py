@@ -0,0 +1,18 @@
+from src.database import db
+
+class MessageStatus(db.Model):
+    """
+    Ciclo de vida de cada bolha enviada, uma linha por wamid. Cada coluna *_at guarda o
+    primeiro instante em que o estado foi visto, então latências de entrega e de leitura
+    saem de uma subtração (ex.: delivered_at - dispatched_at).
+    """
+    __tablename__ = 'message_statuses'
+    wamid = db.Column(db.String(128), primary_key=True)
+    recipient_id = db.Column(db.String(20), nullable=True)
+    # Momento em que a Graph API aceitou o envio (registrado por nós)
+    dispatched_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    delivered_at = db.Column(db.DateTime, nullable=True)
+    read_at = db.Column(db.DateTime, nullable=True)
+    failed_at = db.Column(db.DateTime, nullable=True)
+    error_code = db.Column(db.Integer, nullable=True)
@@ -0,0 +1,43 @@
+from src.database import db
+from datetime import datetime
+
+class ReminderJob(db.Model):
+    """
+    Job de lembretes disparado por POST /api/scheduling/reminders. O progresso é gravado a
+    cada bloco: qualquer worker responde a consulta do job e um job interrompido (processo
+    reiniciado) é retomado a partir do cursor.
+    """
+    __tablename__ = 'reminder_jobs'
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='running', index=True)
+    window_start = db.Column(db.DateTime, nullable=False)
+    window_end = db.Column(db.DateTime, nullable=False)
+    # Último scheduling_info.id de um bloco concluído
+    cursor = db.Column(db.Integer, nullable=False, default=0)
+    # Ids reivindicados do bloco em andamento (JSON); liberados se o job for retomado
+    in_progress = db.Column(db.Text, nullable=True)
+    claimed = db.Column(db.Integer, nullable=False, default=0)
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    # Reuniões confirmadas sem scheduled_for (horário não reconhecido): ficam fora de qualquer janela
+    unscheduled = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Renovado durante a execução; um job 'running' parado além do lease é retomado por outro worker
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "window_start": self.window_start.isoformat(),
+            "window_end": self.window_end.isoformat(),
+            "claimed": self.claimed,
+            "sent": self.sent,
+            "failed": self.failed,
+            "unscheduled": self.unscheduled,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
@@ -0,0 +1,19 @@
+from src.database import db
+
+class SchedulingStatusCount(db.Model):
+    """
+    Total atual de agendamentos por status, mantido incrementalmente (uma linha por status).
+    """
+    __tablename__ = 'scheduling_status_counts'
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class SchedulingDailyCount(db.Model):
+    """
+    Transições por dia (UTC): quantos agendamentos foram criados ('created') ou entraram em
+    cada status naquele dia. Base das séries de conversão por dia e por semana.
+    """
+    __tablename__ = 'scheduling_daily_counts'
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
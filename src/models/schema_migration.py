@@ -0,0 +1,11 @@
+from src.database import db
+from datetime import datetime
+
+class SchemaMigration(db.Model):
+    """
+    Migrações de schema já aplicadas (uma linha por versão), mantidas por src.schema.migrate.
+    """
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
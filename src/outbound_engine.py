@@ -0,0 +1,210 @@
+import os
+import time
+import atexit
+import asyncio
+import functools
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+import requests
+from src.metrics import metrics
+from src.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Códigos de erro da Graph API para limite de throughput (além do HTTP 429)
+THROTTLE_ERROR_CODES = {4, 80007, 130429, 131056}
+
+class TokenBucket:
+    """
+    Token bucket por reserva: cada envio reserva um token e recebe quanto tempo deve esperar.
+    Só é usado dentro do event loop, então dispensa lock.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 0:
+            wait = max(wait, -self.tokens / self.rate)
+        return wait
+
+    def block(self, seconds: float):
+        # Após um 429 nenhum envio deste número sai antes do Retry-After
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class OutboundEngine:
+    """
+    Motor de envio assíncrono para a Graph API, rodando num event loop próprio em background.
+
+    Cada phone_number_id tem seu token bucket (WHATSAPP_RATE_PER_SECOND / WHATSAPP_RATE_BURST)
+    e a concorrência total de requisições é limitada (WHATSAPP_SEND_CONCURRENCY). Respostas
+    429 bloqueiam o bucket do número pelo Retry-After e o envio é repetido.
+
+    submit() pode ser chamado de qualquer thread síncrona e retorna um concurrent.futures.Future
+    com o JSON da resposta (ou None em caso de falha) sem bloquear o chamador.
+    """
+
+    def __init__(self, request_func: Callable, concurrency: Optional[int] = None,
+                 rate: Optional[float] = None, burst: Optional[float] = None,
+                 max_attempts: Optional[int] = None):
+        # request_func(method, endpoint, data) -> requests.Response (bloqueante)
+        self.request_func = request_func
+        self.concurrency = concurrency or int(os.getenv("WHATSAPP_SEND_CONCURRENCY", "16"))
+        self.rate = rate or float(os.getenv("WHATSAPP_RATE_PER_SECOND", "20"))
+        self.burst = burst or float(os.getenv("WHATSAPP_RATE_BURST", str(self.rate)))
+        self.max_attempts = max_attempts or int(os.getenv("WHATSAPP_SEND_MAX_ATTEMPTS", "5"))
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._rates: Dict[str, tuple] = {}
+        self._depths = defaultdict(int)
+        self._throttled = 0
+        self._failed = 0
+        self._sent = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._semaphore = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            # As chamadas HTTP continuam no cliente síncrono com pool; o executor tem o
+            # mesmo tamanho do semáforo, então nunca há threads ociosas esperando vaga
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="outbound-http")
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._thread = threading.Thread(target=self._loop.run_forever, name="outbound-loop", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def set_rate(self, phone_number_id: str, rate: float, burst: Optional[float] = None):
+        """
+        Ajusta o limite de um número específico (ex.: após subir de tier na Meta).
+        """
+        with self._lock:
+            self._rates[phone_number_id] = (rate, burst or rate)
+            self._buckets.pop(phone_number_id, None)
+
+    def _bucket(self, phone_number_id: str) -> TokenBucket:
+        bucket = self._buckets.get(phone_number_id)
+        if bucket is None:
+            rate, burst = self._rates.get(phone_number_id, (self.rate, self.burst))
+            bucket = self._buckets[phone_number_id] = TokenBucket(rate, burst)
+        return bucket
+
+    def submit(self, phone_number_id: str, endpoint: str, data: Dict) -> Future:
+        self._ensure_started()
+        with self._lock:
+            self._depths[phone_number_id] += 1
+        # A task roda no event loop, fora do contexto de quem submeteu: os ids de trace vão junto
+        return asyncio.run_coroutine_threadsafe(
+            self.send(phone_number_id, endpoint, data, tracer.current_ids()), self._loop)
+
+    async def send(self, phone_number_id: str, endpoint: str, data: Dict, trace_ids=()) -> Optional[Dict]:
+        # Cada task tem o próprio contexto, então ativar os ids aqui não afeta outros envios
+        with tracer.activate(trace_ids):
+            return await self._send(phone_number_id, endpoint, data)
+
+    async def _send(self, phone_number_id: str, endpoint: str, data: Dict) -> Optional[Dict]:
+        loop = asyncio.get_running_loop()
+        bucket = self._bucket(phone_number_id)
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                wait = bucket.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                async with self._semaphore:
+                    try:
+                        with tracer.span("graph_api_request", attempt=attempt):
+                            # run_in_executor não copia o contexto; run_with reativa os ids na thread do executor
+                            response = await loop.run_in_executor(self._executor, functools.partial(
+                                tracer.run_with, tracer.current_ids(), self.request_func, "POST", endpoint, data))
+                    except requests.exceptions.RequestException as e:
+                        logger.error(f"Erro na requisição para {endpoint}: {e}")
+                        break
+
+                if _is_throttled(response):
+                    retry_after = _retry_after(response, attempt)
+                    bucket.block(retry_after)
+                    metrics.count("graph_api_throttled")
+                    with self._lock:
+                        self._throttled += 1
+                    logger.warning(f"Limite da Graph API atingido para {phone_number_id}; "
+                                   f"nova tentativa em {retry_after:.1f}s ({attempt}/{self.max_attempts}).")
+                    continue
+
+                if response.ok:
+                    with self._lock:
+                        self._sent += 1
+                    return response.json()
+                logger.error(f"Erro na requisição para {endpoint}: HTTP {response.status_code}. Resposta: {response.text}")
+                break
+            with self._lock:
+                self._failed += 1
+            metrics.count("graph_api_failures")
+            return None
+        finally:
+            with self._lock:
+                self._depths[phone_number_id] -= 1
+
+    def queue_depths(self) -> Dict[str, int]:
+        """
+        Envios submetidos e ainda não concluídos (aguardando token, vaga ou resposta), por número.
+        """
+        with self._lock:
+            return {pnid: depth for pnid, depth in self._depths.items() if depth}
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "sent": self._sent,
+                "failed": self._failed,
+                "throttled": self._throttled,
+                "queue_depths": {pnid: depth for pnid, depth in self._depths.items() if depth},
+            }
+
+    def shutdown(self, timeout: float = 10.0):
+        """
+        Aguarda os envios pendentes (até o timeout) e encerra o event loop.
+        """
+        if self._loop is None or not self._loop.is_running():
+            return
+        deadline = time.monotonic() + timeout
+        while sum(self.queue_depths().values()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+def _is_throttled(response: requests.Response) -> bool:
+    if response.status_code == 429:
+        return True
+    if response.status_code == 400:
+        try:
+            return response.json().get("error", {}).get("code") in THROTTLE_ERROR_CODES
+        except ValueError:
+            return False
+    return False
+
+def _retry_after(response: requests.Response, attempt: int) -> float:
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            pass
+    # Sem Retry-After: backoff exponencial limitado
+    return min(30.0, 0.5 * (2 ** (attempt - 1)))
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem para o processo em execução, sem instrumentar o código.
+
+    Uma thread lê sys._current_frames() a cada PROFILE_INTERVAL_MS e conta as pilhas de
+    todas as outras threads. O resultado sai no formato "collapsed" (uma linha por pilha:
+    "thread;arquivo:função;... contagem"), aceito por flamegraph.pl, speedscope e inferno.
+    Só um perfil por vez; a duração é limitada por PROFILE_MAX_SECONDS.
+    """
+
+    def __init__(self, interval_ms: Optional[float] = None, max_seconds: Optional[float] = None):
+        self.interval = (interval_ms or float(os.getenv("PROFILE_INTERVAL_MS", "10"))) / 1000
+        self.max_seconds = max_seconds or float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+        self._running = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._running.locked()
+
+    def profile(self, seconds: float) -> Optional[str]:
+        """
+        Amostra por `seconds` (limitado a max_seconds) e retorna as pilhas colapsadas,
+        ou None se já há um perfil em andamento.
+        """
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            seconds = max(0.0, min(seconds, self.max_seconds))
+            logger.info(f"Profiler por amostragem iniciado por {seconds:.1f}s.")
+            stacks, samples = self._sample(seconds)
+            logger.info(f"Profiler por amostragem concluído: {samples} amostras, {len(stacks)} pilhas distintas.")
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._running.release()
+
+    def _sample(self, seconds: float):
+        stacks = Counter()
+        samples = 0
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                frames.append(names.get(ident, f"thread-{ident}").replace(";", "_").replace(" ", "_"))
+                stacks[";".join(reversed(frames))] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return stacks, samples
+
+profiler = SamplingProfiler()
@@ -0,0 +1,277 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, update
+from sqlalchemy.orm import joinedload
+from src.database import db
+from src.models.conversation import Conversation, SchedulingInfo
+from src.models.reminder_job import ReminderJob
+from src.time_parser import TIMEZONE, parse_time_expression
+
+logger = logging.getLogger(__name__)
+
+# Horário assumido quando a preferência traz só a data ou só o período
+PERIOD_HOURS = {"manhã": 9, "tarde": 14, "noite": 19}
+DEFAULT_HOUR = 9
+
+REMINDER_TEMPLATE = """🔔 Lembrete de Reunião
+
+Olá {name}! Este é um lembrete sobre nossa reunião agendada.
+
+📅 Horário preferido: {preferred_time}
+🎯 Assunto: {subject}
+
+Estamos ansiosos para nossa conversa! Se precisar reagendar, é só me avisar.
+
+Até breve! 🚀"""
+
+def resolve_meeting_time(preferred_time: Optional[str], now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Converte a preferência de horário em texto no instante da reunião (UTC, sem tzinfo, como os
+    demais timestamps do banco). Retorna None se o texto não traz uma data reconhecível.
+    """
+    parsed = parse_time_expression(preferred_time or "", now)
+    if not parsed or "date" not in parsed:
+        return None
+    if "time" in parsed:
+        hour, minute = (int(part) for part in parsed["time"].split(":"))
+    else:
+        hour, minute = PERIOD_HOURS.get(parsed.get("period"), DEFAULT_HOUR), 0
+    local = datetime.fromisoformat(parsed["date"]).replace(hour=hour, minute=minute, tzinfo=TIMEZONE)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+def backfill_scheduled_for(chunk_size: int = 500) -> Dict[str, int]:
+    """
+    Preenche scheduled_for das reuniões confirmadas gravadas antes da coluna existir,
+    resolvendo preferred_time a partir da criação da conversa (referência para "amanhã",
+    "quinta"...). As que não têm data reconhecível continuam sem scheduled_for e são
+    contadas como 'unresolved'; os jobs de lembretes as informam em 'unscheduled'.
+    Faz commit a cada bloco.
+    """
+    resolved = unresolved = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(SchedulingInfo.id, SchedulingInfo.preferred_time, Conversation.created_at).join(
+            Conversation, Conversation.id == SchedulingInfo.conversation_id
+        ).filter(
+            SchedulingInfo.id > last_id,
+            SchedulingInfo.status == 'confirmed',
+            SchedulingInfo.scheduled_for.is_(None),
+            SchedulingInfo.reminded_at.is_(None),
+        ).order_by(SchedulingInfo.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for row in rows:
+            reference = row.created_at.replace(tzinfo=timezone.utc).astimezone(TIMEZONE) if row.created_at else None
+            scheduled_for = resolve_meeting_time(row.preferred_time, reference)
+            if scheduled_for is None:
+                unresolved += 1
+            else:
+                updates.append({"id": row.id, "scheduled_for": scheduled_for})
+        if updates:
+            db.session.execute(update(SchedulingInfo), updates)
+        db.session.commit()
+        resolved += len(updates)
+    if unresolved:
+        logger.warning(f"{unresolved} reuniões confirmadas sem horário reconhecível não receberão lembrete.")
+    return {"resolved": resolved, "unresolved": unresolved}
+
+def unscheduled_count() -> int:
+    return db.session.query(func.count(SchedulingInfo.id)).filter(
+        SchedulingInfo.status == 'confirmed',
+        SchedulingInfo.scheduled_for.is_(None),
+        SchedulingInfo.reminded_at.is_(None),
+    ).scalar()
+
+class ReminderDispatcher:
+    """
+    Envia lembretes de reuniões confirmadas em background, como jobs acompanháveis por id.
+
+    Cada job percorre só as reuniões dentro da janela (scheduled_for entre agora e agora +
+    window) ainda sem reminded_at, em blocos por keyset de id com a conversa carregada no mesmo
+    SELECT. Cada bloco é reivindicado com um UPDATE condicional em reminded_at, então jobs
+    simultâneos (ou de outros processos) nunca lembram a mesma reunião duas vezes. Os envios
+    vão para o OutboundEngine com no máximo REMINDER_MAX_IN_FLIGHT pendentes; reuniões cujo
+    envio falhou têm reminded_at limpo e entram no próximo job.
+
+    O estado dos jobs fica na tabela reminder_jobs (contadores e cursor gravados a cada
+    bloco), então qualquer worker responde GET /reminders/<job_id>. Um job cujo processo
+    parou de renová-lo por REMINDER_JOB_LEASE_SECONDS é retomado por resume() no start de
+    outro worker: o bloco em andamento é liberado e reenviado (um lembrete pode sair duas
+    vezes, nenhum deixa de sair).
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None, max_in_flight: Optional[int] = None,
+                 window_hours: Optional[float] = None, lease_seconds: Optional[float] = None):
+        self.chunk_size = chunk_size or int(os.getenv("REMINDER_CHUNK_SIZE", "500"))
+        self.max_in_flight = max_in_flight or int(os.getenv("REMINDER_MAX_IN_FLIGHT", "50"))
+        self.window_hours = window_hours or float(os.getenv("REMINDER_WINDOW_HOURS", "24"))
+        self.lease_seconds = lease_seconds or float(os.getenv("REMINDER_JOB_LEASE_SECONDS", "300"))
+
+    def start_job(self, app, sender, window_hours: Optional[float] = None) -> Dict:
+        """
+        Grava o job, dispara sua execução em background e retorna seu estado inicial (com o
+        'job_id'). sender(phone_number, text) deve retornar um Future com a resposta da Graph API.
+        Deve ser chamado dentro de um app context.
+        """
+        now = datetime.utcnow()
+        job = ReminderJob(
+            id=uuid.uuid4().hex, status="running", window_start=now,
+            window_end=now + timedelta(hours=window_hours or self.window_hours),
+            unscheduled=unscheduled_count(), started_at=now, updated_at=now,
+        )
+        db.session.add(job)
+        db.session.commit()
+        state = job.to_dict()
+        self._spawn(app, sender, job.id)
+        return state
+
+    def resume(self, app, sender) -> int:
+        """
+        Retoma jobs 'running' abandonados (lease vencido). Retorna quantos foram retomados.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        resumed = 0
+        with app.app_context():
+            try:
+                stale = db.session.query(ReminderJob.id, ReminderJob.updated_at).filter(
+                    ReminderJob.status == 'running', ReminderJob.updated_at < cutoff
+                ).all()
+                for job_id, updated_at in stale:
+                    # Condicional: só um worker assume cada job
+                    taken = db.session.execute(
+                        update(ReminderJob)
+                        .where(ReminderJob.id == job_id, ReminderJob.updated_at == updated_at)
+                        .values(updated_at=datetime.utcnow())
+                    ).rowcount
+                    db.session.commit()
+                    if taken:
+                        self._spawn(app, sender, job_id)
+                        resumed += 1
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao retomar jobs de lembretes: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+        if resumed:
+            logger.info(f"{resumed} jobs de lembretes retomados.")
+        return resumed
+
+    def job(self, job_id: str) -> Optional[Dict]:
+        job = db.session.get(ReminderJob, job_id)
+        return job.to_dict() if job is not None else None
+
+    def _spawn(self, app, sender, job_id: str):
+        thread = threading.Thread(target=self._run, args=(app, sender, job_id),
+                                  name=f"reminders-{job_id[:8]}", daemon=True)
+        thread.start()
+
+    def _save(self, job_id: str, **values):
+        values["updated_at"] = datetime.utcnow()
+        db.session.execute(update(ReminderJob).where(ReminderJob.id == job_id).values(**values))
+        db.session.commit()
+
+    def _run(self, app, sender, job_id: str):
+        with app.app_context():
+            try:
+                job = db.session.get(ReminderJob, job_id)
+                window_start, window_end, last_id = job.window_start, job.window_end, job.cursor
+                if job.in_progress:
+                    # Bloco de uma execução interrompida: o envio pode não ter saído
+                    self._release(json.loads(job.in_progress))
+                    self._save(job_id, in_progress=None)
+                while True:
+                    rows = self._next_chunk(last_id, window_start, window_end)
+                    if not rows:
+                        break
+                    last_id = rows[-1]["id"]
+                    claimed = self._claim([row["id"] for row in rows])
+                    self._save(job_id, in_progress=json.dumps(sorted(claimed)),
+                               claimed=ReminderJob.claimed + len(claimed))
+                    sent, failed = self._send_chunk(sender, job_id, [row for row in rows if row["id"] in claimed])
+                    self._save(job_id, cursor=last_id, in_progress=None,
+                               sent=ReminderJob.sent + sent, failed=ReminderJob.failed + failed)
+                self._save(job_id, status="completed", finished_at=datetime.utcnow())
+                logger.info(f"Job de lembretes {job_id} concluído: {self.job(job_id)}")
+            except Exception as e:
+                db.session.rollback()
+                try:
+                    self._save(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+                except Exception:
+                    db.session.rollback()
+                logger.error(f"Erro no job de lembretes {job_id}: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+
+    def _next_chunk(self, last_id: int, window_start: datetime, window_end: datetime) -> List[Dict]:
+        # Índice em scheduled_for; o keyset em id evita OFFSET e mantém cada bloco barato
+        rows = SchedulingInfo.query.options(joinedload(SchedulingInfo.conversation)).filter(
+            SchedulingInfo.id > last_id,
+            SchedulingInfo.status == 'confirmed',
+            SchedulingInfo.reminded_at.is_(None),
+            SchedulingInfo.scheduled_for >= window_start,
+            SchedulingInfo.scheduled_for < window_end,
+        ).order_by(SchedulingInfo.id).limit(self.chunk_size).all()
+        # Copia os campos usados no envio: o commit do claim expiraria os objetos (um SELECT por linha)
+        return [{
+            "id": row.id,
+            "phone_number": row.conversation.phone_number if row.conversation else None,
+            "name": row.name,
+            "preferred_time": row.preferred_time,
+            "subject": row.service_interest or 'Soluções de IA',
+        } for row in rows]
+
+    def _claim(self, ids: List[int]) -> set:
+        claimed = db.session.execute(
+            update(SchedulingInfo)
+            .where(SchedulingInfo.id.in_(ids), SchedulingInfo.reminded_at.is_(None))
+            .values(reminded_at=datetime.utcnow())
+            .returning(SchedulingInfo.id)
+        ).scalars().all()
+        db.session.commit()
+        return set(claimed)
+
+    def _release(self, ids: List[int]):
+        # Libera para o próximo job
+        if ids:
+            db.session.execute(update(SchedulingInfo).where(SchedulingInfo.id.in_(ids)).values(reminded_at=None))
+            db.session.commit()
+
+    def _send_chunk(self, sender, job_id: str, rows: List[Dict]) -> Tuple[int, int]:
+        failed_ids = []
+        pending = {}
+        sent = 0
+        for row in rows:
+            if row["phone_number"] is None:
+                failed_ids.append(row["id"])
+                continue
+            if len(pending) >= self.max_in_flight:
+                sent += self._collect(pending, failed_ids, wait(pending, return_when=FIRST_COMPLETED).done)
+                # Renova o lease do job enquanto o bloco é enviado
+                self._save(job_id)
+            text = REMINDER_TEMPLATE.format(name=row["name"], preferred_time=row["preferred_time"],
+                                            subject=row["subject"])
+            pending[sender(row["phone_number"], text)] = row["id"]
+        if pending:
+            sent += self._collect(pending, failed_ids, wait(pending).done)
+        self._release(failed_ids)
+        return sent, len(failed_ids)
+
+    def _collect(self, pending: Dict, failed_ids: List[int], done) -> int:
+        sent = 0
+        for future in done:
+            scheduling_id = pending.pop(future)
+            if future.exception() is None and future.result() is not None:
+                sent += 1
+            else:
+                failed_ids.append(scheduling_id)
+        return sent
+
+reminder_dispatcher = ReminderDispatcher()
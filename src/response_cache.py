@@ -0,0 +1,150 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+from src.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza texto para a chave do cache: minúsculas, sem acentos, sem pontuação e com espaços colapsados.
+    "Quanto custa?" e "quanto  CUSTA" geram a mesma chave.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+class ResponseCache:
+    """
+    Cache de respostas do LLM (TTL + LRU) com coalescência de requisições em andamento:
+    chamadas concorrentes com a mesma chave esperam a primeira em vez de repetir a chamada upstream.
+
+    A chave combina o prompt normalizado com os últimos LLM_CACHE_HISTORY_TURNS turnos do histórico.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, ttl: Optional[float] = None,
+                 history_turns: Optional[int] = None):
+        self.history_turns = history_turns if history_turns is not None else int(os.getenv("LLM_CACHE_HISTORY_TURNS", "2"))
+        self._entries = LRUCache(
+            maxsize=maxsize or int(os.getenv("LLM_CACHE_SIZE", "2048")),
+            ttl=ttl or float(os.getenv("LLM_CACHE_TTL", "600")),
+        )
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_latency = 0.0
+
+    def key(self, user_message: str, history: List[Dict[str, str]]) -> str:
+        # O último turno do histórico é a própria mensagem atual
+        context = history[-self.history_turns - 1:-1] if self.history_turns else []
+        parts = [f"{turn['role']}:{normalize_text(turn['content'])}" for turn in context]
+        parts.append(normalize_text(user_message))
+        return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Consulta direta, sem coalescência.
+        """
+        entry = self._entries.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_latency += entry[1]
+        return entry[0]
+
+    def put(self, key: str, response: str, latency: float):
+        self._entries.set(key, (response, latency))
+
+    def begin(self, key: str) -> Tuple[Optional[str], Optional[Future]]:
+        """
+        Início de uma geração que não cabe em get_or_compute (ex.: streaming). Retorna:
+        - (resposta, None) se a chave está em cache;
+        - (None, future) se outra chamada já está gerando: future.result() é a resposta dela
+          (None se ela falhar ou for interrompida);
+        - (None, None) se o chamador virou o líder: ele gera e chama finish() ao terminar,
+          inclusive em caso de falha.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            response, latency = entry
+            with self._lock:
+                self.hits += 1
+                self.saved_latency += latency
+            return response, None
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future
+            # A chamada líder pode ter terminado entre o get acima e o lock
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self.saved_latency += entry[1]
+                return entry[0], None
+            self._in_flight[key] = Future()
+            self.misses += 1
+            return None, None
+
+    def finish(self, key: str, response: Optional[str], latency: float, error: Optional[BaseException] = None):
+        """
+        Encerra a geração do líder: guarda a resposta (se houver) e libera quem está esperando.
+        """
+        if response is not None and error is None:
+            self._entries.set(key, (response, latency))
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[str]]) -> Optional[str]:
+        """
+        Retorna a resposta em cache ou executa compute() uma única vez para todas as chamadas
+        concorrentes com a mesma chave. Resultados None (falhas) não são armazenados.
+        """
+        response, future = self.begin(key)
+        if response is not None:
+            return response
+        if future is not None:
+            return future.result()
+
+        started = time.monotonic()
+        try:
+            response = compute()
+        except BaseException as e:
+            self.finish(key, None, time.monotonic() - started, error=e)
+            raise
+        self.finish(key, response, time.monotonic() - started)
+        return response
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": ((self.hits + self.coalesced) / lookups) if lookups else 0.0,
+                "saved_upstream_calls": self.hits + self.coalesced,
+                "saved_latency_seconds": self.saved_latency,
+            }
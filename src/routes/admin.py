@@ -0,0 +1,57 @@
+import os
+import hmac
+import logging
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify
+from src.profiler import profiler
+from src.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+admin_bp = Blueprint('admin_bp', __name__)
+
+def admin_required(view):
+    """
+    Exige "Authorization: Bearer <ADMIN_TOKEN>". Sem ADMIN_TOKEN configurado, as rotas ficam desativadas.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = os.getenv("ADMIN_TOKEN")
+        if not token:
+            return jsonify({'error': 'Rotas administrativas desativadas (ADMIN_TOKEN não definido)'}), 404
+        provided = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(provided.encode(), f"Bearer {token}".encode()):
+            return jsonify({'error': 'Não autorizado'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route("/traces", methods=["GET"])
+@admin_required
+def list_traces():
+    """
+    Traces amostrados mais recentes, com seus spans, em JSON
+    """
+    limit = max(1, min(request.args.get('limit', 50, type=int), 1000))
+    return jsonify({'status': 'success', 'traces': tracer.recent(limit)}), 200
+
+@admin_bp.route("/traces/<trace_id>", methods=["GET"])
+@admin_required
+def get_trace(trace_id):
+    trace = tracer.get(trace_id)
+    if trace is None:
+        return jsonify({'error': 'Trace não encontrado (não amostrado ou já descartado)'}), 404
+    return jsonify({'status': 'success', 'trace': trace}), 200
+
+@admin_bp.route("/profile", methods=["POST"])
+@admin_required
+def profile():
+    """
+    Amostra as pilhas deste worker por ?seconds= (padrão 10, até PROFILE_MAX_SECONDS) e
+    devolve o arquivo de pilhas colapsadas para gerar um flamegraph.
+    """
+    seconds = request.args.get('seconds', 10, type=float)
+    collapsed = profiler.profile(seconds)
+    if collapsed is None:
+        return jsonify({'error': 'Já há um perfil em andamento neste worker'}), 409
+    return Response(collapsed, mimetype="text/plain",
+                    headers={"Content-Disposition": f"attachment; filename=profile-{os.getpid()}.collapsed"})
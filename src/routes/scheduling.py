@@ -1,7 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from src.models.conversation import db, Conversation, Message, SchedulingInfo
 from src.scheduling_service import scheduling_service
+from src.availability_cache import availability_cache
 from src.whatsapp_api import whatsapp_api
+from src import scheduling_stats
+from src.reminders import reminder_dispatcher, resolve_meeting_time
+import os
 import logging
 from datetime import datetime, timedelta
 
@@ -9,6 +13,10 @@ logger = logging.getLogger(__name__)
 
 scheduling_bp = Blueprint('scheduling', __name__)
 
+PARSE_TIME_MAX_BATCH = int(os.getenv("PARSE_TIME_MAX_BATCH", "1000"))
+STATS_MAX_DAYS = int(os.getenv("STATS_MAX_DAYS", "366"))
+DEFAULT_SLOTS_LIMIT = 10
+
 @scheduling_bp.route('/available-slots', methods=['GET'])
 def get_available_slots():
     """
@@ -18,6 +26,10 @@ def get_available_slots():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         duration = int(request.args.get('duration', 60))
+        # Até 10 horários por padrão, como antes do índice de disponibilidade; ?limit= muda o teto
+        limit = request.args.get('limit', DEFAULT_SLOTS_LIMIT, type=int)
+        if limit < 1:
+            return jsonify({'error': 'limit deve ser um número positivo'}), 400
         
         if not start_date or not end_date:
             # Define datas padrão (próximos 7 dias)
@@ -25,7 +37,7 @@ def get_available_slots():
             start_date = today.strftime('%Y-%m-%d')
             end_date = (today + timedelta(days=7)).strftime('%Y-%m-%d')
         
-        slots = scheduling_service.get_available_slots(start_date, end_date, duration)
+        slots = scheduling_service.get_available_slots(start_date, end_date, duration, limit)
         
         return jsonify({
             'status': 'success',
@@ -72,6 +84,7 @@ def schedule_meeting():
         scheduling_info.name = data['name']
         scheduling_info.company = data.get('company', '')
         scheduling_info.preferred_time = data.get('preferred_time', '')
+        scheduling_info.scheduled_for = resolve_meeting_time(scheduling_info.preferred_time)
         scheduling_info.service_interest = data.get('service_interest', '')
         scheduling_info.additional_info = data.get('additional_info', '')
         
@@ -100,9 +113,13 @@ Em breve você receberá uma confirmação por email com todos os detalhes da re
 
 Obrigado por escolher a Cognox.ai! 🚀"""
             
-            whatsapp_api.send_text_message(data['phone_number'], confirmation_message)
+            whatsapp_api.submit_text_message(data['phone_number'], confirmation_message)
             
             db.session.commit()
+            # Só depois do commit o horário reservado deixa de estar livre
+            availability_cache.invalidate_slots()
+            if scheduling_info.scheduled_for:
+                scheduling_service.record_booking(scheduling_info.scheduled_for)
             
             return jsonify({
                 'status': 'success',
@@ -127,10 +144,28 @@ Obrigado por escolher a Cognox.ai! 🚀"""
 @scheduling_bp.route('/parse-time', methods=['POST'])
 def parse_time_preference():
     """
-    Endpoint para analisar preferência de horário em texto natural
+    Endpoint para analisar preferência de horário em texto natural.
+    Aceita um texto ('time_text') ou um lote ('time_texts', até PARSE_TIME_MAX_BATCH itens).
     """
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
+        time_texts = data.get('time_texts')
+        
+        if time_texts is not None:
+            if not isinstance(time_texts, list) or not all(isinstance(text, str) for text in time_texts):
+                return jsonify({'error': 'time_texts deve ser uma lista de textos'}), 400
+            if len(time_texts) > PARSE_TIME_MAX_BATCH:
+                return jsonify({'error': f'time_texts aceita no máximo {PARSE_TIME_MAX_BATCH} itens'}), 400
+            
+            parsed = scheduling_service.parse_time_preferences(time_texts)
+            return jsonify({
+                'status': 'success',
+                'results': [
+                    {'original_text': text, 'parsed_time': parsed_time}
+                    for text, parsed_time in zip(time_texts, parsed)
+                ]
+            }), 200
+        
         time_text = data.get('time_text', '')
         
         if not time_text:
@@ -161,6 +196,9 @@ def confirm_scheduling(scheduling_id):
         
         scheduling_info.status = 'confirmed'
         db.session.commit()
+        availability_cache.invalidate_slots()
+        if scheduling_info.scheduled_for:
+            scheduling_service.record_booking(scheduling_info.scheduled_for)
         
         # Envia confirmação via WhatsApp
         conversation = scheduling_info.conversation
@@ -173,7 +211,7 @@ Olá {scheduling_info.name}! Sua reunião foi confirmada com sucesso.
 
 Estamos ansiosos para conversar com você sobre como a Cognox.ai pode transformar seu negócio! 🚀"""
             
-            whatsapp_api.send_text_message(conversation.phone_number, confirmation_message)
+            whatsapp_api.submit_text_message(conversation.phone_number, confirmation_message)
         
         return jsonify({
             'status': 'success',
@@ -198,6 +236,9 @@ def cancel_scheduling(scheduling_id):
         
         scheduling_info.status = 'cancelled'
         db.session.commit()
+        availability_cache.invalidate_slots()
+        if scheduling_info.scheduled_for:
+            scheduling_service.release_booking(scheduling_info.scheduled_for)
         
         # Envia notificação via WhatsApp
         conversation = scheduling_info.conversation
@@ -210,7 +251,7 @@ Se desejar reagendar, é só me enviar uma mensagem! Estou aqui para ajudar.
 
 Obrigado pela compreensão! 😊"""
             
-            whatsapp_api.send_text_message(conversation.phone_number, cancellation_message)
+            whatsapp_api.submit_text_message(conversation.phone_number, cancellation_message)
         
         return jsonify({
             'status': 'success',
@@ -225,69 +266,81 @@ Obrigado pela compreensão! 😊"""
 @scheduling_bp.route('/reminders', methods=['POST'])
 def send_reminders():
     """
-    Endpoint para enviar lembretes de reuniões
+    Endpoint para enviar lembretes de reuniões.
+    Dispara um job em background e retorna 202 com o job_id; o progresso sai de GET /reminders/<job_id>.
+    Aceita 'window_hours' (opcional): só reuniões que acontecem dentro dessa janela são lembradas.
     """
     try:
-        # Busca agendamentos confirmados para os próximos dias
-        from datetime import datetime, timedelta
+        data = request.get_json(silent=True) or {}
+        window_hours = data.get('window_hours')
+        if window_hours is not None and (not isinstance(window_hours, (int, float)) or window_hours <= 0):
+            return jsonify({'error': 'window_hours deve ser um número positivo'}), 400
         
-        tomorrow = datetime.now() + timedelta(days=1)
-        tomorrow_str = tomorrow.strftime('%Y-%m-%d')
-        
-        # Busca agendamentos que precisam de lembrete
-        # (implementação simplificada - em produção seria mais sofisticada)
-        confirmed_schedulings = SchedulingInfo.query.filter_by(status='confirmed').all()
-        
-        reminders_sent = 0
-        
-        for scheduling in confirmed_schedulings:
-            conversation = scheduling.conversation
-            if conversation and scheduling.preferred_time:
-                # Verifica se precisa enviar lembrete (lógica simplificada)
-                reminder_message = f"""🔔 Lembrete de Reunião
-
-Olá {scheduling.name}! Este é um lembrete sobre nossa reunião agendada.
-
-📅 Horário preferido: {scheduling.preferred_time}
-🎯 Assunto: {scheduling.service_interest or 'Soluções de IA'}
-
-Estamos ansiosos para nossa conversa! Se precisar reagendar, é só me avisar.
-
-Até breve! 🚀"""
-                
-                success = whatsapp_api.send_text_message(conversation.phone_number, reminder_message)
-                if success:
-                    reminders_sent += 1
+        job = reminder_dispatcher.start_job(current_app._get_current_object(),
+                                            whatsapp_api.submit_text_message, window_hours)
         
         return jsonify({
-            'status': 'success',
-            'reminders_sent': reminders_sent
-        }), 200
+            'status': 'accepted',
+            'job': job
+        }), 202
         
     except Exception as e:
         logger.error(f"Erro ao enviar lembretes: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@scheduling_bp.route('/reminders/<job_id>', methods=['GET'])
+def get_reminder_job(job_id):
+    """
+    Endpoint para acompanhar um job de lembretes
+    """
+    job = reminder_dispatcher.job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify({'status': 'success', 'job': job}), 200
+
 @scheduling_bp.route('/stats', methods=['GET'])
 def get_scheduling_stats():
     """
-    Endpoint para obter estatísticas de agendamento
+    Endpoint para obter estatísticas de agendamento.
+    Aceita 'bucket' ('day' ou 'week') para incluir a série de conversão e 'days' (inteiro
+    positivo, limitado a STATS_MAX_DAYS; padrão 30) para o tamanho da série.
     """
+    bucket = request.args.get('bucket')
+    days = request.args.get('days')
+    if bucket is None and days is not None:
+        bucket = 'day'
+    if bucket is not None and bucket not in ('day', 'week'):
+        return jsonify({'error': "bucket deve ser 'day' ou 'week'"}), 400
     try:
-        total_schedulings = SchedulingInfo.query.count()
-        confirmed_schedulings = SchedulingInfo.query.filter_by(status='confirmed').count()
-        pending_schedulings = SchedulingInfo.query.filter_by(status='pending').count()
-        cancelled_schedulings = SchedulingInfo.query.filter_by(status='cancelled').count()
-        
+        days = int(days) if days is not None else 30
+    except ValueError:
+        return jsonify({'error': 'days deve ser um número inteiro'}), 400
+    if days < 1:
+        return jsonify({'error': 'days deve ser um número positivo'}), 400
+    days = min(days, STATS_MAX_DAYS)
+
+    try:
+        # ?source=live recalcula num GROUP BY; o padrão lê os contadores mantidos a cada mudança
+        if request.args.get('source') == 'live':
+            counts = scheduling_stats.live_status_counts()
+        else:
+            counts = scheduling_stats.status_counts()
+        total_schedulings = sum(counts.values())
+        confirmed_schedulings = counts.get('confirmed', 0)
+
+        stats = {
+            'total': total_schedulings,
+            'confirmed': confirmed_schedulings,
+            'pending': counts.get('pending', 0),
+            'cancelled': counts.get('cancelled', 0),
+            'conversion_rate': (confirmed_schedulings / total_schedulings * 100) if total_schedulings > 0 else 0
+        }
+        if bucket is not None:
+            stats['series'] = scheduling_stats.conversion_series(bucket, days)
+
         return jsonify({
             'status': 'success',
-            'stats': {
-                'total': total_schedulings,
-                'confirmed': confirmed_schedulings,
-                'pending': pending_schedulings,
-                'cancelled': cancelled_schedulings,
-                'conversion_rate': (confirmed_schedulings / total_schedulings * 100) if total_schedulings > 0 else 0
-            }
+            'stats': stats
         }), 200
         
     except Exception as e:
@@ -1,63 +1,260 @@
+import os
+import time
 import logging
-import json
-from flask import Blueprint, request, jsonify, current_app
-from threading import Thread
-from src.database import db
-from src.models.conversation import Conversation, Message
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import Blueprint, Response, request, jsonify
+from typing import Dict, List, Tuple
 from src.whatsapp_api import whatsapp_api
-from src.llm_service import llm_service
+from src.llm_backends import UpstreamUnavailable
+from src.llm_service import FALLBACK_MESSAGE, llm_service
+from src.worker_pool import WorkerPool
+from src.conversation_cache import conversation_cache, unanswered_wamids
+from src.database import db
+from src.dedup import wamid_filter
+from src.status_writer import status_writer
+from src.webhook_payload import classify_webhook_payload, merge_work_units
+from src.metrics import metrics
+from src.tracing import tracer, TRACE_HEADER
+from src.services import services
 
 logger = logging.getLogger(__name__)
 whatsapp_bp = Blueprint('whatsapp_bp', __name__)
 
-def process_message_background(app, data):
-    with app.app_context():
+# Intervalo mínimo entre as consultas à fila, durante uma resposta, por mensagens novas do remetente
+SUPERSEDED_CHECK_SECONDS = float(os.getenv("REPLY_SUPERSEDED_CHECK_SECONDS", "2"))
+
+def process_message_background(app, units: List[Dict]):
+    """
+    Processa as unidades de trabalho de uma partição do pool. As unidades chegam na ordem
+    de recebimento e nenhuma outra thread deste processo atende as mesmas conversas.
+
+    Erros são registrados e propagados para o pool, que devolve os itens à fila com backoff.
+    As respostas já enviadas são gravadas antes; na nova tentativa, mensagens já gravadas
+    só são respondidas se ainda não houver resposta do assistente depois delas. Com o LLM
+    indisponível (UpstreamUnavailable) a unidade também volta para a fila, sem esperar na
+    thread; na última tentativa, a conversa recebe a mensagem de fallback.
+
+    O histórico guarda o que o usuário de fato recebeu: se a resposta for interrompida
+    (mensagem nova, falha de envio), grava só as bolhas entregues, inclusive quando a
+    interrupção acontece depois da gravação.
+    """
+    with app.app_context(), tracer.activate(_trace_ids(units)):
         try:
-            value = data["entry"][0]["changes"][0]["value"]
-            message_data = value["messages"][0]
-            phone_number_id = value["metadata"]["phone_number_id"]
-            from_number = message_data["from"]
-            msg_body = message_data["text"]["body"]
-            wamid = message_data["id"]
-
-            whatsapp_api.mark_message_as_read(wamid, phone_number_id)
-
-            conversation = Conversation.query.filter_by(phone_number=from_number).first()
-            if not conversation:
-                conversation = Conversation(phone_number=from_number)
-                db.session.add(conversation)
-                db.session.commit()
-            
-            user_message = Message(conversation_id=conversation.id, message_type="user", content=msg_body)
-            db.session.add(user_message)
-            db.session.commit()
-
-            history = [{"role": msg.message_type, "content": msg.content} for msg in conversation.messages]
-            
-            ai_response = llm_service.process_message(msg_body, history)
-            
-            ai_message = Message(conversation_id=conversation.id, message_type="assistant", content=ai_response)
-            db.session.add(ai_message)
-            db.session.commit()
-            
-            whatsapp_api.send_humanized_text_message(from_number, ai_response, phone_number_id)
+            units = merge_work_units(units)
+            if not units:
+                return
+            _record_queue_wait(units)
+
+            with tracer.span("db_write"):
+                conversation_ids = conversation_cache.get_or_create_many(units)
+                phone_numbers = {conversation_id: phone for phone, conversation_id in conversation_ids.items()}
+
+                rows = [
+                    {"conversation_id": conversation_ids[unit["from_number"]], "message_type": "user",
+                     "content": msg["body"], "wamid": msg["wamid"]}
+                    for unit in units for msg in unit["messages"]
+                ]
+                inserted = {row["wamid"] for row in conversation_cache.add_messages(rows, phone_numbers)}
+                retried = [msg["wamid"] for unit in units for msg in unit["messages"]
+                           if msg.get("attempt", 1) > 1 and msg["wamid"] not in inserted]
+                pending = inserted | unanswered_wamids(retried)
+            # Mensagens já gravadas (reentrega vista por outro processo ou item reprocessado) não geram nova resposta
+            wamid_filter.record_database_duplicates(len(rows) - len(pending))
+            metrics.count("duplicates_dropped", len(rows) - len(pending))
+            units = [dict(unit, messages=[msg for msg in unit["messages"] if msg["wamid"] in pending]) for unit in units]
+            units = [unit for unit in units if unit["messages"]]
+            if not units:
+                return
+
+            with tracer.span("history_build"):
+                histories = conversation_cache.histories(unit["from_number"] for unit in units)
+            replies = []
+            try:
+                for unit in units:
+                    with tracer.activate(_trace_ids([unit])):
+                        # Marcar a última mensagem como lida marca as anteriores da conversa também
+                        whatsapp_api.mark_message_as_read(unit["messages"][-1]["wamid"], unit["phone_number_id"])
+
+                        user_text = "\n".join(msg["body"] for msg in unit["messages"])
+                        reply = whatsapp_api.begin_reply(unit["from_number"])
+                        # Cada parágrafo vai para o agendador de bolhas assim que termina de ser gerado
+                        paragraphs = []
+                        # Inclui o agendamento das bolhas, que não bloqueia
+                        with tracer.span("llm_total"):
+                            # Uma mensagem nova interrompe a geração: nada mais é gerado nem enviado
+                            stream = llm_service.stream_message(user_text, histories[unit["from_number"]],
+                                                                cancelled=lambda: reply.superseded)
+                            checked_at = None
+                            try:
+                                for paragraph in stream:
+                                    # Mensagem nova recebida por outro processo, cujo cancel() não alcança
+                                    # este agendador; consultado no máximo a cada SUPERSEDED_CHECK_SECONDS
+                                    if checked_at is None or time.monotonic() - checked_at >= SUPERSEDED_CHECK_SECONDS:
+                                        checked_at = time.monotonic()
+                                        if inbound_pool.has_pending(unit["from_number"]):
+                                            whatsapp_api.cancel_pending_messages(unit["from_number"])
+                                    if not whatsapp_api.send_humanized_text_message(
+                                            unit["from_number"], paragraph, unit["phone_number_id"], reply=reply):
+                                        break
+                                    paragraphs.append(paragraph)
+                            except UpstreamUnavailable:
+                                if not _last_attempt(unit):
+                                    raise
+                                # A fila não vai tentar de novo: responde com o fallback em vez de silenciar
+                                metrics.count("llm_fallbacks")
+                                if whatsapp_api.send_humanized_text_message(
+                                        unit["from_number"], FALLBACK_MESSAGE, unit["phone_number_id"], reply=reply):
+                                    paragraphs.append(FALLBACK_MESSAGE)
+                            finally:
+                                stream.close()
+                        message_id = Future()
+                        delivered = whatsapp_api.finish_reply(reply, _on_truncated(app, unit["from_number"], message_id))
+                        if delivered is not None:
+                            metrics.count("replies_truncated")
+                        replies.append((unit, "\n".join(paragraphs) if delivered is None else delivered, message_id))
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                # Grava também quando uma unidade posterior falha: essas conversas não são respondidas de novo
+                _store_replies(replies, conversation_ids, phone_numbers)
 
         except Exception as e:
-            logger.critical(f"ERRO CRÍTICO NO PROCESSAMENTO EM BACKGROUND: {e}", exc_info=True)
+            metrics.count("pipeline_errors")
+            db.session.rollback()
+            # O traceback é registrado pelo pool, junto com a decisão de repetir ou desistir
+            logger.critical(f"ERRO CRÍTICO NO PROCESSAMENTO EM BACKGROUND: {e}")
+            raise
+
+def _store_replies(replies: List[Tuple[Dict, str, Future]], conversation_ids: Dict[str, int],
+                   phone_numbers: Dict[int, str]):
+    # Respostas sem nenhuma bolha entregue não entram no histórico
+    stored = [(unit, content, message_id) for unit, content, message_id in replies if content]
+    for unit, content, message_id in replies:
+        if not content:
+            message_id.set_result(None)
+    if not stored:
+        return
+    try:
+        with tracer.span("db_write"):
+            rows = conversation_cache.add_messages([
+                {"conversation_id": conversation_ids[unit["from_number"]], "message_type": "assistant", "content": content}
+                for unit, content, _ in stored
+            ], phone_numbers)
+    except Exception as e:
+        for _, _, message_id in stored:
+            message_id.set_exception(e)
+        raise
+    for (_, _, message_id), row in zip(stored, rows):
+        message_id.set_result(row["id"])
+
+def _on_truncated(app, phone_number: str, message_id: Future):
+    # Chamado pelo agendador quando uma resposta já gravada é interrompida depois; a
+    # correção vai para uma thread própria, fora do timer e das threads de envio
+    def truncated(content: str):
+        metrics.count("replies_truncated")
+        _truncations.submit(_store_truncation, app, phone_number, message_id, content)
+    return truncated
+
+def _store_truncation(app, phone_number: str, message_id: Future, content: str):
+    try:
+        stored_id = message_id.result(timeout=60)
+        if stored_id is None:
+            return
+        with app.app_context():
+            conversation_cache.truncate_message(stored_id, content, phone_number)
+    except Exception as e:
+        logger.error(f"Erro ao gravar resposta truncada para {phone_number}: {e}", exc_info=True)
+
+def _last_attempt(unit: Dict) -> bool:
+    # Numa unidade mesclada, o item mais tentado decide se a fila ainda vai repetir
+    return max(msg.get("attempt", 1) for msg in unit["messages"]) >= inbound_pool.max_attempts
+
+def _trace_ids(units: List[Dict]) -> List[str]:
+    # Cada mensagem carrega o id do webhook que a trouxe; uma unidade mesclada pode ter vários
+    return [msg.get("trace_id") for unit in units for msg in unit["messages"]]
+
+def _record_queue_wait(units: List[Dict]):
+    now = time.time()
+    for unit in units:
+        for msg in unit["messages"]:
+            if msg.get("trace_id") and msg.get("received_at"):
+                tracer.record("queue_wait", msg["received_at"], now - msg["received_at"], trace_ids=[msg["trace_id"]])
+
+# Correções de respostas interrompidas depois de gravadas, em série
+_truncations = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reply-truncation")
+
+# Pool fixo que consome a fila persistente de webhooks; iniciado em create_app()
+inbound_pool = WorkerPool(process_message_background)
 
 @whatsapp_bp.route("/webhook", methods=["POST"])
 def handle_webhook():
-    data = request.get_json()
-    try:
-        if (data and data.get("object") == "whatsapp_business_account" and
-                data["entry"][0]["changes"][0]["value"]["messages"][0].get("type") == "text"):
-            
-            app = current_app._get_current_object()
-            thread = Thread(target=process_message_background, args=(app, data))
-            thread.start()
-            
-            logger.info("Webhook válido recebido, processamento iniciado.")
-    except (KeyError, IndexError):
-        logger.info(f"Webhook recebido, mas não é uma mensagem de texto do usuário: {json.dumps(data)}")
-
-    return jsonify(status="ok"), 200
+    # O id de correlação nasce aqui (ou vem no header) e acompanha cada mensagem até o envio das bolhas
+    trace_id = tracer.new_trace_id(request.headers.get(TRACE_HEADER))
+    with tracer.activate([trace_id]), tracer.span("webhook_receive"):
+        _ingest_webhook(request.get_json(), trace_id)
+    response = jsonify(status="ok")
+    response.headers[TRACE_HEADER] = trace_id
+    return response, 200
+
+def _ingest_webhook(data, trace_id: str):
+    fresh = None
+    payload = classify_webhook_payload(data)
+    units = payload["units"]
+    if payload["statuses"]:
+        # Callbacks de status são a maior parte do tráfego: só acumulam em memória
+        status_writer.record_statuses(payload["statuses"])
+    metrics.count("webhook_errors_reported", len(payload["errors"]))
+    for error in payload["errors"]:
+        logger.warning(f"Erro reportado pelo webhook do WhatsApp: {error['code']} {error['title']}")
+    if units:
+        # Reentregas da Meta (mesmo wamid) são descartadas antes de qualquer outro trabalho
+        fresh = set(wamid_filter.claim(msg["wamid"] for unit in units for msg in unit["messages"]))
+        metrics.count("duplicates_dropped", sum(len(unit["messages"]) for unit in units) - len(fresh))
+        units = [dict(unit, messages=[msg for msg in unit["messages"] if msg["wamid"] in fresh]) for unit in units]
+        units = [unit for unit in units if unit["messages"]]
+    if units:
+        received_at = time.time()
+        for unit in units:
+            for msg in unit["messages"]:
+                msg.update(trace_id=trace_id, received_at=received_at)
+        # Uma mensagem nova torna obsoletas as bolhas ainda não enviadas da resposta anterior
+        for unit in units:
+            whatsapp_api.cancel_pending_messages(unit["from_number"])
+        try:
+            item_ids = inbound_pool.enqueue_many([(unit["from_number"], unit) for unit in units])
+        except Exception:
+            # Sem o 200 a Meta reenvia; a reentrega precisa passar pelo filtro
+            wamid_filter.release(fresh)
+            raise
+        logger.info(f"Webhook válido recebido, {len(item_ids)} conversas enfileiradas.")
+    elif fresh is not None:
+        logger.info("Webhook recebido com mensagens já processadas; reentrega ignorada.")
+    elif not payload["statuses"] and not payload["errors"]:
+        metrics.count("payloads_ignored")
+        logger.debug("Webhook recebido sem mensagens de texto, status ou erros.")
+
+@whatsapp_bp.route("/health", methods=["GET"])
+def health():
+    # O health check não constrói serviços: os que ainda não foram usados aparecem como null
+    llm_built = services.built("llm_service")
+    return jsonify(status="ok", inbound_queue=inbound_pool.metrics(),
+                   llm_cache=llm_service.response_cache.stats() if llm_built else None,
+                   deduplication=wamid_filter.stats(),
+                   message_statuses=status_writer.metrics(),
+                   llm_backend=llm_service.backend.metrics() if llm_built else None,
+                   llm_batcher=llm_service.batcher.metrics() if llm_built and llm_service.batcher else None,
+                   services=services.status()), 200
+
+metrics.register_gauge("inbound_queue_depth", "Itens do webhook aguardando um worker.", inbound_pool.queue_depth)
+metrics.register_gauge("outbound_in_flight", "Envios à Graph API submetidos e ainda não concluídos.",
+                       lambda: sum(whatsapp_api.outbound.queue_depths().values()) if services.built("whatsapp_api") else 0)
+metrics.register_gauge("bubbles_pending", "Bolhas agendadas ainda não enviadas.",
+                       lambda: whatsapp_api.delivery.pending_count() if services.built("whatsapp_api") else 0)
+
+@whatsapp_bp.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """
+    Histogramas por etapa e contadores de eventos no formato de texto do Prometheus.
+    """
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
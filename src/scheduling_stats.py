@@ -0,0 +1,154 @@
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from src.database import db, insert_or_increment
+from src.models.conversation import Conversation, SchedulingInfo
+from src.models.scheduling_stats import SchedulingStatusCount, SchedulingDailyCount
+
+logger = logging.getLogger(__name__)
+
+# Linha de SchedulingDailyCount que conta os agendamentos criados no dia
+CREATED = 'created'
+DEFAULT_STATUS = 'pending'
+
+@event.listens_for(SchedulingInfo.status, "set", active_history=True)
+def _load_previous_status(target, value, oldvalue, initiator):
+    # Sem efeito; active_history faz o ORM carregar o status anterior (mesmo expirado) para o delta do flush
+    pass
+
+@event.listens_for(Session, "after_flush")
+def _track_status_changes(session, flush_context):
+    """
+    Converte as mudanças de SchedulingInfo do flush em deltas de contadores e os grava na
+    mesma transação, então os totais nunca divergem do que foi de fato commitado.
+    Só enxerga alterações feitas pelo ORM; UPDATE/DELETE em massa exigem rebuild_status_counts().
+    """
+    totals = Counter()
+    daily = Counter()
+    today = datetime.utcnow().date()
+    for obj in session.new:
+        if isinstance(obj, SchedulingInfo):
+            status = obj.status or DEFAULT_STATUS
+            totals[status] += 1
+            daily[(today, CREATED)] += 1
+            daily[(today, status)] += 1
+    for obj in session.dirty:
+        if not isinstance(obj, SchedulingInfo) or obj in session.deleted:
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.added or not history.deleted or history.added[0] == history.deleted[0]:
+            continue
+        totals[history.deleted[0] or DEFAULT_STATUS] -= 1
+        totals[history.added[0]] += 1
+        daily[(today, history.added[0])] += 1
+    for obj in session.deleted:
+        if isinstance(obj, SchedulingInfo):
+            history = inspect(obj).attrs.status.history
+            status = (history.deleted or history.unchanged or [obj.status])[0] or DEFAULT_STATUS
+            totals[status] -= 1
+    if not totals and not daily:
+        return
+    connection = session.connection()
+    insert_or_increment(
+        SchedulingStatusCount,
+        [{"status": status, "count": delta} for status, delta in totals.items() if delta],
+        ["status"], "count", connection=connection,
+    )
+    insert_or_increment(
+        SchedulingDailyCount,
+        [{"day": day, "status": status, "count": delta} for (day, status), delta in daily.items()],
+        ["day", "status"], "count", connection=connection,
+    )
+
+def live_status_counts() -> Dict[str, int]:
+    """
+    Totais por status direto de scheduling_info, num único GROUP BY (usa o índice em status).
+    """
+    rows = db.session.query(SchedulingInfo.status, func.count()).group_by(SchedulingInfo.status).all()
+    return {status or DEFAULT_STATUS: count for status, count in rows}
+
+def status_counts() -> Dict[str, int]:
+    """
+    Totais por status lidos da tabela de contadores: uma linha por status, independente
+    do tamanho de scheduling_info.
+    """
+    return {row.status: row.count for row in SchedulingStatusCount.query.all()}
+
+def rebuild_status_counts() -> Dict[str, int]:
+    """
+    Recalcula a tabela de contadores e as séries diárias a partir de scheduling_info (bases já
+    existentes ou após alterações em massa). Faz commit.
+
+    scheduling_info não guarda quando cada status foi atingido: na série reconstruída o status
+    atual conta no dia da criação do agendamento (created_at, ou o da conversa nas linhas
+    anteriores à coluna). A partir daí os eventos do flush voltam a registrar o dia real.
+    """
+    counts = live_status_counts()
+    created_on = func.date(func.coalesce(SchedulingInfo.created_at, Conversation.created_at))
+    rows = (db.session.query(created_on, SchedulingInfo.status, func.count())
+            .outerjoin(Conversation, SchedulingInfo.conversation_id == Conversation.id)
+            .group_by(created_on, SchedulingInfo.status).all())
+    daily = Counter()
+    for day, status, count in rows:
+        if day is None:
+            continue
+        # func.date devolve texto no SQLite e date no PostgreSQL
+        day = date.fromisoformat(day) if isinstance(day, str) else day
+        daily[(day, CREATED)] += count
+        daily[(day, status or DEFAULT_STATUS)] += count
+
+    SchedulingStatusCount.query.delete()
+    SchedulingDailyCount.query.delete()
+    db.session.add_all(SchedulingStatusCount(status=status, count=count) for status, count in counts.items())
+    db.session.add_all(SchedulingDailyCount(day=day, status=status, count=count)
+                       for (day, status), count in daily.items())
+    db.session.commit()
+    logger.info(f"Contadores de agendamento reconstruídos: {counts} ({len(daily)} linhas de série diária)")
+    return counts
+
+def ensure_status_counts():
+    """
+    Popula os contadores na primeira subida com a tabela vazia e scheduling_info já preenchida.
+    """
+    if SchedulingStatusCount.query.first() is None and SchedulingInfo.query.first() is not None:
+        rebuild_status_counts()
+
+def conversion_series(bucket: str = 'day', days: int = 30, today: Optional[date] = None) -> List[Dict]:
+    """
+    Série de conversão (confirmados / criados) por dia ou por semana (iniciada na segunda-feira)
+    dos últimos `days` dias, lida de scheduling_daily_counts. Buckets sem movimento aparecem zerados.
+    """
+    if bucket not in ('day', 'week'):
+        raise ValueError("bucket deve ser 'day' ou 'week'")
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    if bucket == 'week':
+        start -= timedelta(days=start.weekday())
+    rows = SchedulingDailyCount.query.filter(SchedulingDailyCount.day >= start,
+                                             SchedulingDailyCount.day <= today).all()
+
+    def bucket_of(day: date) -> date:
+        return day - timedelta(days=day.weekday()) if bucket == 'week' else day
+
+    step = timedelta(days=7 if bucket == 'week' else 1)
+    buckets = {}
+    current = start
+    while current <= today:
+        buckets[current] = Counter()
+        current += step
+    for row in rows:
+        buckets[bucket_of(row.day)][row.status] += row.count
+
+    series = []
+    for start_day, counts in buckets.items():
+        created = counts.pop(CREATED, 0)
+        series.append({
+            'start': start_day.isoformat(),
+            'created': created,
+            **{status: counts.get(status, 0) for status in ('confirmed', 'cancelled', 'failed')},
+            'conversion_rate': (counts.get('confirmed', 0) / created * 100) if created > 0 else 0,
+        })
+    return series
@@ -0,0 +1,201 @@
+import logging
+from datetime import datetime
+from typing import Callable, List
+from sqlalchemy import delete, func, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+from src.database import db
+from src.models.conversation import Conversation, Message, SchedulingInfo
+from src.models.schema_migration import SchemaMigration
+from src.reminders import backfill_scheduled_for
+from src.scheduling_stats import ensure_status_counts, rebuild_status_counts
+
+logger = logging.getLogger(__name__)
+
+class Migration:
+    """
+    Passo versionado do schema. apply(engine) precisa ser idempotente: numa base nova o
+    create_all() já criou tudo no formato atual e o passo só é registrado.
+    """
+
+    def __init__(self, version: int, description: str, apply: Callable, rebuilds_counts: bool = False):
+        self.version = version
+        self.description = description
+        self.apply = apply
+        # Passos com UPDATE/DELETE em massa em scheduling_info, que não passam pelos
+        # eventos do ORM que mantêm os contadores de status
+        self.rebuilds_counts = rebuilds_counts
+
+def migrate(app):
+    """
+    Cria as tabelas que faltam, aplica as migrações pendentes em ordem e reconstrói os
+    contadores de status se estiverem vazios.
+
+    Roda uma vez por deploy (python -m src.schema, passo de release), e não a cada boot de
+    worker. create_all() só cria tabelas inexistentes; colunas, índices e constraints novos
+    de tabelas que já existem vêm das migrações abaixo. No PostgreSQL os índices são criados
+    com CONCURRENTLY, sem bloquear as escritas da versão que ainda está no ar. Em
+    desenvolvimento, AUTO_MIGRATE=true faz create_app() chamar esta função.
+    """
+    with app.app_context():
+        engine = db.engine
+        db.create_all()
+        applied = {version for (version,) in db.session.query(SchemaMigration.version).all()}
+        db.session.commit()
+        rebuild = False
+        for migration in MIGRATIONS:
+            if migration.version in applied:
+                continue
+            logger.info(f"Aplicando migração {migration.version}: {migration.description}")
+            migration.apply(engine)
+            db.session.add(SchemaMigration(version=migration.version, description=migration.description,
+                                           applied_at=datetime.utcnow()))
+            db.session.commit()
+            rebuild = rebuild or migration.rebuilds_counts
+        # Depois das migrações: as queries do ORM já enxergam todas as colunas
+        if rebuild:
+            rebuild_status_counts()
+        else:
+            ensure_status_counts()
+    logger.info("Schema do banco verificado e atualizado.")
+
+def _columns(engine, table: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+def _indexes(engine, table: str) -> dict:
+    return {index["name"]: index for index in inspect(engine).get_indexes(table)}
+
+def _has_unique(engine, table: str, columns: List[str]) -> bool:
+    inspector = inspect(engine)
+    return (any(constraint["column_names"] == columns for constraint in inspector.get_unique_constraints(table))
+            or any(index["unique"] and index["column_names"] == columns for index in inspector.get_indexes(table)))
+
+def _add_column(engine, table: str, column: str, ddl: str):
+    if column in _columns(engine, table):
+        return
+    with engine.begin() as connection:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {_quote(engine, column)} {ddl}"))
+
+def _create_index(engine, name: str, table: str, columns: List[str], unique: bool = False):
+    concurrently = " CONCURRENTLY" if engine.dialect.name == "postgresql" else ""
+    quoted = ", ".join(_quote(engine, column) for column in columns)
+    _autocommit(engine, f"CREATE {'UNIQUE ' if unique else ''}INDEX{concurrently} IF NOT EXISTS {name} ON {table} ({quoted})")
+
+def _drop_index(engine, name: str):
+    concurrently = " CONCURRENTLY" if engine.dialect.name == "postgresql" else ""
+    _autocommit(engine, f"DROP INDEX{concurrently} IF EXISTS {name}")
+
+def _autocommit(engine, statement: str):
+    # CREATE/DROP INDEX CONCURRENTLY não pode rodar dentro de uma transação
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(statement))
+
+def _quote(engine, name: str) -> str:
+    return engine.dialect.identifier_preparer.quote(name)
+
+def merge_duplicate_conversations(engine) -> int:
+    """
+    Junta as conversas repetidas de um mesmo telefone (criadas pela corrida do antigo
+    get-or-create) na mais antiga: mensagens passam para ela, o agendamento dela prevalece
+    (ou o mais recente das repetidas, se ela não tiver) e as repetidas são apagadas.
+    Retorna quantas conversas foram removidas.
+    """
+    conversations, messages, scheduling = Conversation.__table__, Message.__table__, SchedulingInfo.__table__
+    removed = 0
+    with engine.begin() as connection:
+        groups = connection.execute(
+            select(conversations.c.phone_number, func.min(conversations.c.id))
+            .group_by(conversations.c.phone_number).having(func.count() > 1)
+        ).all()
+        for phone_number, keeper in groups:
+            rows = connection.execute(
+                select(conversations.c.id, conversations.c.user_name)
+                .where(conversations.c.phone_number == phone_number, conversations.c.id != keeper)
+                .order_by(conversations.c.id.desc())
+            ).all()
+            duplicates = [row.id for row in rows]
+            connection.execute(update(messages).where(messages.c.conversation_id.in_(duplicates))
+                               .values(conversation_id=keeper))
+
+            infos = connection.execute(
+                select(scheduling.c.id, scheduling.c.conversation_id)
+                .where(scheduling.c.conversation_id.in_([keeper] + duplicates))
+                .order_by(scheduling.c.id.desc())
+            ).all()
+            if infos and not any(info.conversation_id == keeper for info in infos):
+                connection.execute(update(scheduling).where(scheduling.c.id == infos[0].id).values(conversation_id=keeper))
+                infos = infos[1:]
+            extra = [info.id for info in infos if info.conversation_id != keeper]
+            if extra:
+                connection.execute(delete(scheduling).where(scheduling.c.id.in_(extra)))
+
+            user_name = next((row.user_name for row in rows if row.user_name), None)
+            if user_name:
+                connection.execute(update(conversations)
+                                   .where(conversations.c.id == keeper, conversations.c.user_name.is_(None))
+                                   .values(user_name=user_name))
+            connection.execute(delete(conversations).where(conversations.c.id.in_(duplicates)))
+            removed += len(duplicates)
+    if removed:
+        logger.warning(f"{removed} conversas duplicadas mescladas em {len(groups)} telefones.")
+    return removed
+
+def _unique_phone_number(engine):
+    index = _indexes(engine, "conversations").get("ix_conversations_phone_number")
+    if index is not None and index["unique"]:
+        return
+    if engine.dialect.name != "postgresql":
+        merge_duplicate_conversations(engine)
+        _drop_index(engine, "ix_conversations_phone_number")
+        _create_index(engine, "ix_conversations_phone_number", "conversations", ["phone_number"], unique=True)
+        return
+    # A versão anterior continua no ar durante o release e pode criar uma nova duplicata
+    # entre a mesclagem e o índice; nesse caso o índice (inválido) é descartado e tenta de novo
+    for attempt in range(1, 4):
+        merge_duplicate_conversations(engine)
+        try:
+            _create_index(engine, "ix_conversations_phone_number_unique", "conversations", ["phone_number"], unique=True)
+            break
+        except IntegrityError:
+            _drop_index(engine, "ix_conversations_phone_number_unique")
+            if attempt == 3:
+                raise
+    _drop_index(engine, "ix_conversations_phone_number")
+    _autocommit(engine, "ALTER INDEX ix_conversations_phone_number_unique RENAME TO ix_conversations_phone_number")
+
+def _message_wamid(engine):
+    _add_column(engine, "messages", "wamid", "VARCHAR(128)")
+    if not _has_unique(engine, "messages", ["wamid"]):
+        _create_index(engine, "uq_messages_wamid", "messages", ["wamid"], unique=True)
+
+def _scheduling_status(engine):
+    _create_index(engine, "ix_scheduling_info_status", "scheduling_info", ["status"])
+    _add_column(engine, "scheduling_info", "created_at", "TIMESTAMP")
+
+def _scheduling_reminders(engine):
+    _add_column(engine, "scheduling_info", "service_interest", "VARCHAR(200)")
+    _add_column(engine, "scheduling_info", "scheduled_for", "TIMESTAMP")
+    _add_column(engine, "scheduling_info", "reminded_at", "TIMESTAMP")
+    _create_index(engine, "ix_scheduling_info_scheduled_for", "scheduling_info", ["scheduled_for"])
+
+MIGRATIONS = [
+    Migration(1, "conversations.phone_number único (mescla conversas duplicadas)", _unique_phone_number,
+              rebuilds_counts=True),
+    Migration(2, "conversations.version", lambda engine: _add_column(
+        engine, "conversations", "version", "INTEGER NOT NULL DEFAULT 0")),
+    Migration(3, "índice (conversation_id, timestamp, id) em messages", lambda engine: _create_index(
+        engine, "ix_messages_conversation_timestamp", "messages", ["conversation_id", "timestamp", "id"])),
+    Migration(4, "messages.wamid único", _message_wamid),
+    # Linhas antigas ficam com created_at nulo; a série diária usa o created_at da conversa
+    Migration(5, "índice em scheduling_info.status e scheduling_info.created_at", _scheduling_status,
+              rebuilds_counts=True),
+    Migration(6, "scheduling_info.service_interest, scheduled_for e reminded_at", _scheduling_reminders),
+    Migration(7, "inbound_queue.available_at", lambda engine: _add_column(
+        engine, "inbound_queue", "available_at", "TIMESTAMP")),
+    Migration(8, "índice (partition_key, id) em inbound_queue", lambda engine: _create_index(
+        engine, "ix_inbound_queue_partition_key_id", "inbound_queue", ["partition_key", "id"])),
+    Migration(9, "scheduled_for das reuniões confirmadas antes da coluna", lambda engine: backfill_scheduled_for()),
+]
+
+if __name__ == "__main__":
+    from src.main import create_app
+    migrate(create_app(start_workers=False))
@@ -0,0 +1,90 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ServiceRegistry:
+    """
+    Serviços construídos sob demanda, no primeiro uso, e não na importação dos módulos.
+
+    Cada módulo registra a fábrica do seu serviço e exporta um LazyService no lugar da
+    instância: `from src.whatsapp_api import whatsapp_api` continua funcionando, mas importar
+    a aplicação não lê variáveis de ambiente nem abre sessões HTTP. Um serviço sem
+    configuração só falha quando alguém realmente o usa, e um worker que não atende uma rota
+    não paga pela construção do serviço dela.
+
+    A instância é única por processo (threads do pool, timer das bolhas e requisições
+    compartilham o mesmo cliente); create_app() pendura o registro em app.extensions.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._build_seconds: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> "LazyService":
+        self._factories[name] = factory
+        return LazyService(self, name)
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            # RLock: a fábrica de um serviço pode pedir outro (ex.: SchedulingService -> Calendly)
+            instance = self._instances.get(name)
+            if instance is None:
+                started = time.perf_counter()
+                instance = self._factories[name]()
+                self._build_seconds[name] = time.perf_counter() - started
+                self._instances[name] = instance
+                logger.info(f"Serviço {name} construído em {self._build_seconds[name] * 1000:.1f} ms.")
+        return instance
+
+    def built(self, name: str) -> bool:
+        return name in self._instances
+
+    def override(self, name: str, instance: Any):
+        """
+        Substitui a instância de um serviço (benchmarks, depuração); None volta à fábrica.
+        """
+        with self._lock:
+            if instance is None:
+                self._instances.pop(name, None)
+            else:
+                self._instances[name] = instance
+
+    def status(self) -> Dict[str, Optional[float]]:
+        """
+        {serviço: ms gastos na construção, ou None se ainda não foi construído}
+        """
+        return {name: round(self._build_seconds[name] * 1000, 1) if name in self._build_seconds else None
+                for name in sorted(self._factories)}
+
+    def init_app(self, app):
+        app.extensions["cognox_services"] = self
+
+class LazyService:
+    """
+    Procurador de um serviço do registro: o primeiro acesso a um atributo constrói o serviço.
+    """
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: ServiceRegistry, name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attribute):
+        return getattr(self._registry.get(self._name), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._registry.get(self._name), attribute, value)
+
+    def __repr__(self):
+        state = "construído" if self._registry.built(self._name) else "não construído"
+        return f"<LazyService {self._name} ({state})>"
+
+services = ServiceRegistry()
@@ -0,0 +1,174 @@
+import os
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from src.database import db, insert_or_fill
+from src.models.message_status import MessageStatus
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Status do webhook -> coluna de MessageStatus
+STATUS_COLUMNS = {
+    "sent": "sent_at",
+    "delivered": "delivered_at",
+    "read": "read_at",
+    "failed": "failed_at",
+}
+_FILL_COLUMNS = ["recipient_id", "dispatched_at", "sent_at", "delivered_at", "read_at", "failed_at", "error_code"]
+
+class StatusWriter:
+    """
+    Grava os status das mensagens enviadas (tabela message_statuses) em lotes.
+
+    O webhook só acumula os eventos em memória, já consolidados por wamid; uma thread grava
+    o acumulado a cada STATUS_FLUSH_SECONDS (ou antes, ao atingir STATUS_BATCH_SIZE wamids)
+    com um único INSERT ... ON CONFLICT por lote. Se o banco falhar, os eventos voltam
+    para o buffer, limitado a STATUS_BUFFER_MAX wamids.
+    """
+
+    def __init__(self, flush_seconds: Optional[float] = None, batch_size: Optional[int] = None,
+                 max_buffer: Optional[int] = None):
+        self.flush_seconds = flush_seconds or float(os.getenv("STATUS_FLUSH_SECONDS", "1"))
+        self.batch_size = batch_size or int(os.getenv("STATUS_BATCH_SIZE", "500"))
+        self.max_buffer = max_buffer or int(os.getenv("STATUS_BUFFER_MAX", "50000"))
+        self.app = None
+        self._pending: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self.received = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self.app = app
+        self._thread = threading.Thread(target=self._flush_loop, name="status-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def record_statuses(self, statuses: List[Dict]):
+        """
+        Acumula callbacks de status do webhook ({'wamid', 'status', 'timestamp', 'recipient_id', 'error_code'}).
+        """
+        for status in statuses:
+            column = STATUS_COLUMNS.get(status["status"])
+            if column is None:
+                continue
+            self._add(status["wamid"], {
+                column: _parse_timestamp(status.get("timestamp")),
+                "recipient_id": status.get("recipient_id"),
+                "error_code": _parse_int(status.get("error_code")),
+            })
+
+    def record_dispatch(self, wamid: str, recipient_id: str, at: Optional[datetime] = None):
+        """
+        Registra o momento em que a Graph API aceitou o envio de uma bolha.
+        """
+        self._add(wamid, {"dispatched_at": at or datetime.utcnow(), "recipient_id": recipient_id})
+
+    def _add(self, wamid: str, values: Dict):
+        with self._lock:
+            self.received += 1
+            row = self._pending.get(wamid)
+            if row is None:
+                if len(self._pending) >= self.max_buffer:
+                    self.dropped += 1
+                    metrics.count("statuses_dropped")
+                    return
+                row = self._pending[wamid] = {"wamid": wamid}
+            _merge(row, values)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Grava tudo o que está acumulado. Retorna o número de wamids gravados.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [dict({column: None for column in _FILL_COLUMNS}, **row) for row in pending.values()]
+        written = 0
+        with self.app.app_context():
+            try:
+                for i in range(0, len(rows), self.batch_size):
+                    insert_or_fill(MessageStatus, rows[i:i + self.batch_size], ["wamid"], _FILL_COLUMNS)
+                    db.session.commit()
+                    written += len(rows[i:i + self.batch_size])
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao gravar status de mensagens: {e}", exc_info=True)
+                self._requeue(rows[written:])
+        with self._lock:
+            self.written += written
+            self.flushes += 1
+        return written
+
+    def _requeue(self, rows: List[Dict]):
+        with self._lock:
+            for row in rows:
+                current = self._pending.get(row["wamid"])
+                if current is None:
+                    if len(self._pending) >= self.max_buffer:
+                        self.dropped += 1
+                        metrics.count("statuses_dropped")
+                        continue
+                    current = self._pending[row["wamid"]] = {"wamid": row["wamid"]}
+                _merge(current, row)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "received": self.received,
+                "written": self.written,
+                "pending": len(self._pending),
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+            }
+
+    def shutdown(self):
+        if self._thread is None or self._stopping:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(5)
+        self.flush()
+
+def _merge(row: Dict, values: Dict):
+    # O primeiro instante visto de cada estado prevalece, mesmo com callbacks fora de ordem
+    for column, value in values.items():
+        if value is None:
+            continue
+        if column.endswith("_at") and row.get(column) is not None:
+            row[column] = min(row[column], value)
+        else:
+            row.setdefault(column, value)
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    try:
+        return datetime.utcfromtimestamp(int(value))
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+def _parse_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+status_writer = StatusWriter()
@@ -0,0 +1,150 @@
+import os
+import time
+import uuid
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+from src.cache import LRUCache
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Header usado para receber e repassar o id de correlação
+TRACE_HEADER = "X-Request-Id"
+
+class Trace:
+    """
+    Spans de uma mensagem, do webhook ao envio das bolhas. Os spans podem vir de várias
+    threads (worker, lotes do LLM, timer das bolhas), por isso a lista tem lock próprio.
+    """
+    __slots__ = ("trace_id", "started_at", "spans", "_lock")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {"trace_id": self.trace_id, "started_at": self.started_at, "spans": spans}
+
+class Tracer:
+    """
+    Ids de correlação e spans por etapa.
+
+    O contexto atual (ids ativos) fica numa ContextVar e aparece em toda linha de log como
+    %(trace_id)s. Quem passa trabalho para outra thread (fila do webhook, lotes do LLM, timer
+    das bolhas, OutboundEngine) leva os ids junto e os reativa com activate(). Um worker que
+    processa várias conversas de uma vez ativa todos os ids: os spans compartilhados entram
+    em cada trace. Todo span também alimenta o histograma da etapa em src.metrics.
+
+    Só uma fração TRACE_SAMPLE_RATE dos traces guarda spans (nos últimos TRACE_BUFFER_SIZE);
+    os ids existem sempre, para correlacionar logs.
+    """
+
+    def __init__(self, sample_rate: Optional[float] = None, buffer_size: Optional[int] = None):
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+        self._traces = LRUCache(maxsize=buffer_size or int(os.getenv("TRACE_BUFFER_SIZE", "1000")))
+        self._current: contextvars.ContextVar = contextvars.ContextVar("trace_ids", default=())
+
+    def new_trace_id(self, incoming: Optional[str] = None) -> str:
+        """
+        Gera um id (ou aceita o recebido no header, se curto e alfanumérico) e decide a amostragem.
+        """
+        trace_id = incoming if incoming and len(incoming) <= 64 and incoming.replace("-", "").isalnum() else uuid.uuid4().hex
+        if random.random() < self.sample_rate:
+            self._traces.set(trace_id, Trace(trace_id))
+        return trace_id
+
+    def current_ids(self) -> tuple:
+        return self._current.get()
+
+    def current_id(self) -> Optional[str]:
+        ids = self._current.get()
+        return ",".join(ids) if ids else None
+
+    @contextmanager
+    def activate(self, trace_ids: Iterable[Optional[str]]):
+        token = self._current.set(tuple(dict.fromkeys(trace_id for trace_id in trace_ids if trace_id)))
+        try:
+            yield
+        finally:
+            self._current.reset(token)
+
+    def run_with(self, trace_ids: Iterable[Optional[str]], func: Callable, *args, **kwargs):
+        """
+        Executa func com os ids ativos; útil ao submeter trabalho a executors e event loops.
+        """
+        with self.activate(trace_ids):
+            return func(*args, **kwargs)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Mede a etapa `name`: alimenta o histograma da etapa e, se o trace foi amostrado,
+        grava o span (início, duração, atributos, erro) em cada trace ativo.
+        """
+        started_wall, started = time.time(), time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            metrics.observe(name, duration)
+            self.record(name, started_wall, duration, error=error, **attributes)
+
+    def record(self, name: str, started_at: float, duration: float, trace_ids: Optional[Iterable[str]] = None,
+               error: Optional[str] = None, **attributes):
+        """
+        Grava um span já medido (ex.: espera na fila, medida por quem não tem o contexto ativo)
+        nos traces informados ou nos ativos. Não alimenta o histograma.
+        """
+        for trace_id in (self._current.get() if trace_ids is None else trace_ids):
+            trace = self._traces.get(trace_id)
+            if trace is not None:
+                span = {"name": name, "start": started_at, "duration_ms": round(duration * 1000, 3),
+                        "thread": threading.current_thread().name}
+                if attributes:
+                    span["attributes"] = attributes
+                if error:
+                    span["error"] = error
+                trace.add(span)
+
+    def get(self, trace_id: str) -> Optional[Dict]:
+        trace = self._traces.get(trace_id)
+        return trace.to_dict() if trace is not None else None
+
+    def recent(self, limit: int = 50) -> List[Dict]:
+        """
+        Traces mais recentes primeiro.
+        """
+        traces = self._traces.values()
+        traces.sort(key=lambda trace: trace.started_at, reverse=True)
+        return [trace.to_dict() for trace in traces[:limit]]
+
+tracer = Tracer()
+
+def install_log_record_factory():
+    """
+    Acrescenta trace_id a todo LogRecord ('-' fora de um trace), para uso no formato do logging.
+    """
+    previous = logging.getLogRecordFactory()
+
+    def factory(*args, **kwargs):
+        record = previous(*args, **kwargs)
+        record.trace_id = tracer.current_id() or "-"
+        return record
+
+    logging.setLogRecordFactory(factory)
@@ -0,0 +1,88 @@
+from typing import Dict, List
+
+def classify_webhook_payload(data: Dict) -> Dict[str, List[Dict]]:
+    """
+    Percorre uma entrega do webhook uma única vez e separa o que interessa, sem levantar
+    exceções para formatos inesperados (campos ausentes são simplesmente ignorados).
+
+    Returns:
+        Dict com as listas:
+        'units': mensagens de texto agrupadas por conversa (phone_number_id + remetente), na
+        ordem de chegada, cada uma com 'phone_number_id', 'from_number', 'user_name' e
+        'messages' ({'wamid', 'body', 'timestamp'});
+        'statuses': callbacks de status ({'wamid', 'status', 'timestamp', 'recipient_id', 'error_code'});
+        'errors': erros reportados pela plataforma ({'code', 'title'}).
+    """
+    result = {"units": [], "statuses": [], "errors": []}
+    if not isinstance(data, dict) or data.get("object") != "whatsapp_business_account":
+        return result
+
+    units = {}
+    for entry in data.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            for error in value.get("errors") or []:
+                result["errors"].append({"code": error.get("code"), "title": error.get("title")})
+            for status in value.get("statuses") or []:
+                if not status.get("id") or not status.get("status"):
+                    continue
+                errors = status.get("errors") or [{}]
+                result["statuses"].append({
+                    "wamid": status["id"],
+                    "status": status["status"],
+                    "timestamp": status.get("timestamp"),
+                    "recipient_id": status.get("recipient_id"),
+                    "error_code": errors[0].get("code"),
+                })
+            messages = value.get("messages")
+            if not messages:
+                continue
+            phone_number_id = (value.get("metadata") or {}).get("phone_number_id")
+            names = {
+                contact.get("wa_id"): (contact.get("profile") or {}).get("name")
+                for contact in value.get("contacts") or []
+            }
+            for message in messages:
+                if message.get("type") != "text":
+                    continue
+                from_number = message.get("from")
+                body = (message.get("text") or {}).get("body")
+                # Sem o wamid não há como deduplicar reentregas
+                if not from_number or not body or not phone_number_id or not message.get("id"):
+                    continue
+                key = (phone_number_id, from_number)
+                unit = units.get(key)
+                if unit is None:
+                    unit = units[key] = {
+                        "phone_number_id": phone_number_id,
+                        "from_number": from_number,
+                        "user_name": names.get(from_number),
+                        "messages": [],
+                    }
+                unit["messages"].append({
+                    "wamid": message.get("id"),
+                    "body": body,
+                    "timestamp": message.get("timestamp"),
+                })
+    result["units"] = list(units.values())
+    return result
+
+def split_webhook_payload(data: Dict) -> List[Dict]:
+    """
+    Retorna só as unidades de trabalho (mensagens de texto por conversa) de uma entrega do webhook.
+    """
+    return classify_webhook_payload(data)["units"]
+
+def merge_work_units(units: List[Dict]) -> List[Dict]:
+    """
+    Junta unidades da mesma conversa vindas de entregas diferentes, mantendo a ordem das mensagens.
+    """
+    merged = {}
+    for unit in units:
+        key = (unit["phone_number_id"], unit["from_number"])
+        if key not in merged:
+            merged[key] = dict(unit, messages=list(unit["messages"]))
+        else:
+            merged[key]["messages"].extend(unit["messages"])
+            merged[key]["user_name"] = merged[key].get("user_name") or unit.get("user_name")
+    return list(merged.values())
@@ -1,9 +1,14 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
-import time
 import random
-import re
+from src.delivery_scheduler import DeliveryScheduler
+from src.outbound_engine import OutboundEngine
+from src.status_writer import status_writer
+from src.tracing import tracer, TRACE_HEADER
+from src.services import services
 
 logger = logging.getLogger(__name__)
 
@@ -12,56 +17,144 @@ class WhatsAppAPI:
         self.access_token = os.getenv("WHATSAPP_ACCESS_TOKEN")
         if not self.access_token:
             raise ValueError("WHATSAPP_ACCESS_TOKEN não definida.")
-        self.base_url = "https://graph.facebook.com/v19.0"
+        self.base_url = os.getenv("WHATSAPP_GRAPH_URL", "https://graph.facebook.com/v19.0").rstrip("/")
+        # (connect, read) em segundos; sem timeout uma conexão travada prende o worker para sempre
+        self.timeout = (float(os.getenv("WHATSAPP_CONNECT_TIMEOUT", "3.05")),
+                        float(os.getenv("WHATSAPP_READ_TIMEOUT", "20")))
+        self.session = self._build_session()
+        self.default_phone_number_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
+        # Pausas de "digitando..." entre as bolhas; desligáveis para testes de carga
+        self.humanized_delays = os.getenv("WHATSAPP_HUMANIZED_DELAYS", "true").lower() == "true"
+        self.outbound = OutboundEngine(self.raw_request)
+        self.delivery = DeliveryScheduler(self.submit_text_message)
 
-    def send_request(self, method, endpoint, data=None ):
-        url = f"{self.base_url}/{endpoint}"
-        headers = {
+    def _build_session(self):
+        """
+        Sessão HTTP compartilhada com pool de conexões keep-alive para a Graph API.
+        Falhas de conexão são sempre repetidas (a requisição não chegou a sair);
+        falhas de leitura e 502/503/504 só são repetidas em métodos idempotentes.
+        """
+        pool_size = int(os.getenv("WHATSAPP_POOL_SIZE", "20"))
+        retries = Retry(
+            total=int(os.getenv("WHATSAPP_MAX_RETRIES", "3")),
+            connect=3,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json",
-        }
+        })
+        return session
+
+    def raw_request(self, method, endpoint, data=None):
+        """
+        Requisição sem tratamento de erro HTTP; usada pelo OutboundEngine, que precisa do status e dos headers.
+        """
+        trace_id = tracer.current_id()
+        return self.session.request(method, f"{self.base_url}/{endpoint}", json=data, timeout=self.timeout,
+                                    headers={TRACE_HEADER: trace_id} if trace_id else None)
+
+    def send_request(self, method, endpoint, data=None ):
+        url = f"{self.base_url}/{endpoint}"
         try:
-            response = requests.request(method, url, headers=headers, json=data)
+            response = self.raw_request(method, endpoint, data)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            logger.error(f"Erro na requisição para {url}: {e}. Resposta: {e.response.text if e.response else 'N/A'}")
+            response_text = e.response.text if e.response is not None else 'N/A'
+            logger.error(f"Erro na requisição para {url}: {e}. Resposta: {response_text}")
             return None
 
     def mark_message_as_read(self, wamid, phone_number_id):
+        """
+        Confirma a leitura de forma assíncrona; retorna o Future do envio.
+        """
         data = {"messaging_product": "whatsapp", "status": "read", "message_id": wamid}
-        return self.send_request("POST", f"{phone_number_id}/messages", data)
+        return self.outbound.submit(phone_number_id, f"{phone_number_id}/messages", data)
+
+    def submit_text_message(self, recipient_id, text, phone_number_id=None):
+        """
+        Enfileira uma mensagem de texto no OutboundEngine sem bloquear o chamador.
+        Retorna um Future com a resposta da Graph API (None em caso de falha).
+        """
+        phone_number_id = phone_number_id or self.default_phone_number_id
+        data = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": recipient_id,
+            "type": "text",
+            "text": {"preview_url": False, "body": text},
+        }
+        future = self.outbound.submit(phone_number_id, f"{phone_number_id}/messages", data)
+        future.add_done_callback(lambda f: _log_send_result(f, recipient_id))
+        return future
 
-    def send_humanized_text_message(self, recipient_id, text, phone_number_id):
+    def send_text_message(self, recipient_id, text, phone_number_id=None):
+        """
+        Versão síncrona de submit_text_message: aguarda o envio e retorna True em caso de sucesso.
+        """
+        return self.submit_text_message(recipient_id, text, phone_number_id).result() is not None
+
+    def send_humanized_text_message(self, recipient_id, text, phone_number_id, reply=None):
         """
         Envia uma mensagem de texto simulando o comportamento humano, com pausas e fragmentação.
         IMPLEMENTAÇÃO DA SUA VISÃO.
+
+        As bolhas são agendadas no DeliveryScheduler e o método retorna imediatamente;
+        as pausas acontecem no timer do agendador, sem segurar a thread do chamador.
+        reply (de begin_reply) acompanha quais bolhas saíram; retorna False, sem agendar,
+        se essa resposta já foi interrompida.
         """
         # Quebra o texto em bolhas lógicas (parágrafos)
         messages = [p.strip() for p in text.split('\n') if p.strip()]
         if not messages:
-            return
-
-        # Simula o "digitando..." por um tempo proporcional
-        time.sleep(random.uniform(1.0, 2.5))
-
-        for i, msg in enumerate(messages):
-            data = {
-                "messaging_product": "whatsapp",
-                "recipient_type": "individual",
-                "to": recipient_id,
-                "type": "text",
-                "text": {"preview_url": False, "body": msg},
-            }
-            if self.send_request("POST", f"{phone_number_id}/messages", data):
-                logger.info(f"Bolha de mensagem enviada com sucesso para {recipient_id}.")
-            else:
-                logger.error(f"Falha ao enviar bolha de mensagem para {recipient_id}.")
-                break 
-
-            # Pausa entre as bolhas
-            if i < len(messages) - 1:
-                pause_duration = random.uniform(1.5, 3.5)
-                time.sleep(pause_duration)
-
-whatsapp_api = WhatsAppAPI()
+            return True
+
+        # Simula o "digitando..." antes da primeira bolha e pausas entre as seguintes
+        if not self.humanized_delays:
+            return self.delivery.schedule(recipient_id, messages, phone_number_id, initial_delay=0.0,
+                                          pause_func=lambda: 0.0, reply=reply)
+        return self.delivery.schedule(
+            recipient_id, messages, phone_number_id,
+            initial_delay=random.uniform(1.0, 2.5),
+            pause_func=lambda: random.uniform(1.5, 3.5),
+            reply=reply,
+        )
+
+    def begin_reply(self, recipient_id):
+        """
+        Inicia uma resposta ao destinatário (ver DeliveryScheduler.begin_reply).
+        """
+        return self.delivery.begin_reply(recipient_id)
+
+    def finish_reply(self, reply, on_truncated):
+        """
+        Encerra o agendamento da resposta (ver DeliveryScheduler.finish_reply).
+        """
+        return self.delivery.finish_reply(reply, on_truncated)
+
+    def cancel_pending_messages(self, recipient_id):
+        """
+        Descarta bolhas ainda não enviadas para o destinatário (ex.: chegou uma mensagem nova dele).
+        """
+        return self.delivery.cancel(recipient_id)
+
+def _log_send_result(future, recipient_id):
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        logger.info(f"Bolha de mensagem enviada com sucesso para {recipient_id}.")
+        # O wamid da bolha liga o envio aos callbacks de status (entregue, lida...)
+        for message in future.result().get("messages") or []:
+            if message.get("id"):
+                status_writer.record_dispatch(message["id"], recipient_id)
+    else:
+        logger.error(f"Falha ao enviar bolha de mensagem para {recipient_id}.")
+
+# Construído no primeiro uso: importar o módulo não exige WHATSAPP_ACCESS_TOKEN
+whatsapp_api = services.register("whatsapp_api", WhatsAppAPI)
@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import queue
+import zlib
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import exists, insert, update
+from sqlalchemy.orm import aliased
+from src.database import db
+from src.metrics import metrics
+from src.models.inbound_queue import InboundQueueItem
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class RetryLater(Exception):
+    """
+    Falha transitória de um serviço externo. O handler a propaga para que o pool devolva os
+    itens à fila; delay (segundos, opcional) é a espera mínima sugerida pelo serviço.
+    """
+
+    def __init__(self, message: str, delay: Optional[float] = None):
+        super().__init__(message)
+        self.delay = delay
+
+class WorkerPool:
+    """
+    Pool de tamanho fixo que consome a fila persistente de mensagens (tabela inbound_queue).
+
+    Cada worker tem sua própria fila em memória e os itens são distribuídos por hash da
+    chave de partição (o número do remetente): mensagens da mesma conversa são processadas
+    em série e na ordem de chegada, enquanto conversas diferentes rodam em paralelo.
+
+    O webhook apenas grava os itens e avisa o pool; os workers reivindicam os itens de
+    forma atômica no banco, então itens pendentes de um processo que caiu são retomados
+    sem processamento duplicado. A ordem por partição também vale entre processos (vários
+    workers gunicorn): um item só é reivindicado se não houver item anterior da mesma
+    partição pendente ou em processamento. Itens bloqueados saem da fila em memória e
+    voltam quando a partição termina neste processo, ou na varredura periódica
+    (WEBHOOK_SWEEP_SECONDS) quando quem a segura é outro processo.
+
+    Se o handler levantar uma exceção, os itens voltam a 'pending' com backoff exponencial
+    (available_at) e são reenfileirados quando o prazo vence; após max_attempts ficam 'failed'.
+    Com RetryLater, a espera é pelo menos a sugerida pelo serviço que falhou.
+    """
+
+    def __init__(self, handler: Callable, size: Optional[int] = None,
+                 lease_seconds: Optional[int] = None, max_attempts: int = 3,
+                 batch_size: Optional[int] = None):
+        # handler(app, payloads): recebe os payloads reivindicados de uma partição, em ordem
+        self.handler = handler
+        self.size = size or int(os.getenv("WEBHOOK_WORKERS", "4"))
+        # Itens em 'processing' há mais tempo que o lease são considerados órfãos
+        self.lease_seconds = lease_seconds or int(os.getenv("WEBHOOK_LEASE_SECONDS", "300"))
+        # Máximo de itens já enfileirados que um worker processa de uma vez
+        self.batch_size = batch_size or int(os.getenv("WEBHOOK_BATCH_SIZE", "16"))
+        self.max_attempts = max_attempts
+        self.retry_backoff = float(os.getenv("WEBHOOK_RETRY_BACKOFF_SECONDS", "5"))
+        self.max_retry_backoff = float(os.getenv("WEBHOOK_RETRY_MAX_BACKOFF_SECONDS", "300"))
+        self.sweep_seconds = float(os.getenv("WEBHOOK_SWEEP_SECONDS", "15"))
+        self.app = None
+        self._lanes = [queue.Queue() for _ in range(self.size)]
+        self._threads = []
+        self._accepting = False
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # Ids já entregues a uma fila em memória (ou aguardando o backoff), para não duplicar entradas
+        self._queued = set()
+        self._in_flight = 0
+        self._processed = 0
+        self._failed = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def start(self, app):
+        """
+        Inicia os workers e reenfileira itens não processados de execuções anteriores.
+        """
+        if self._threads:
+            return
+        self.app = app
+        self._accepting = True
+        for i, lane in enumerate(self._lanes):
+            thread = threading.Thread(target=self._worker_loop, args=(lane,), name=f"inbound-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._stopping.clear()
+        self._resume()
+        threading.Thread(target=self._sweep_loop, name="inbound-sweeper", daemon=True).start()
+        atexit.register(self.shutdown)
+        logger.info(f"Pool de workers iniciado com {self.size} threads.")
+
+    def lane_for(self, partition_key: Optional[str]) -> int:
+        # crc32 é estável entre processos, ao contrário de hash()
+        return zlib.crc32((partition_key or "").encode("utf-8")) % self.size
+
+    def enqueue(self, partition_key: Optional[str], payload: Dict) -> int:
+        return self.enqueue_many([(partition_key, payload)])[0]
+
+    def enqueue_many(self, items: List[Tuple[Optional[str], Dict]]) -> List[int]:
+        """
+        Persiste os itens (chave de partição, payload) com um único INSERT e os entrega
+        às filas dos workers. Deve ser chamado dentro de um app context.
+        """
+        received_at = datetime.utcnow()
+        ids = db.session.execute(
+            insert(InboundQueueItem).returning(InboundQueueItem.id, sort_by_parameter_order=True),
+            [{"partition_key": key, "payload": json.dumps(payload), "received_at": received_at}
+             for key, payload in items],
+        ).scalars().all()
+        db.session.commit()
+        if self._accepting:
+            now = time.time()
+            for item_id, (key, _) in zip(ids, items):
+                self._put(item_id, key, now)
+        return ids
+
+    def has_pending(self, partition_key: Optional[str]) -> bool:
+        """
+        Indica se há item pendente da partição. Como os itens de uma partição são
+        reivindicados em ordem, um pendente é mais novo que os em processamento (ex.: o
+        remetente mandou outra mensagem, recebida por este ou por outro processo).
+        Deve ser chamado dentro de um app context.
+        """
+        return db.session.query(exists().where(
+            InboundQueueItem.partition_key == partition_key, InboundQueueItem.status == 'pending'
+        )).scalar()
+
+    def _put(self, item_id: int, partition_key: Optional[str], enqueued_at: float):
+        with self._lock:
+            if item_id in self._queued:
+                return
+            self._queued.add(item_id)
+        self._lanes[self.lane_for(partition_key)].put((item_id, enqueued_at))
+
+    def _claimable(self, table=InboundQueueItem):
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.lease_seconds)
+        return db.or_(
+            db.and_(table.status == 'pending', db.or_(table.available_at.is_(None), table.available_at <= now)),
+            db.and_(table.status == 'processing', table.started_at < cutoff),
+        )
+
+    def _resume(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        with self.app.app_context():
+            rows = db.session.query(
+                InboundQueueItem.id, InboundQueueItem.partition_key, InboundQueueItem.received_at,
+                InboundQueueItem.available_at,
+            ).filter(db.or_(
+                InboundQueueItem.status == 'pending',
+                db.and_(InboundQueueItem.status == 'processing', InboundQueueItem.started_at < cutoff),
+            )).order_by(InboundQueueItem.id).all()
+        with self._lock:
+            rows = [row for row in rows if row[0] not in self._queued]
+        now = datetime.utcnow()
+        for item_id, key, received_at, available_at in rows:
+            if available_at is not None and available_at > now:
+                self._requeue_later(item_id, key, (available_at - now).total_seconds())
+            else:
+                self._put(item_id, key, _to_epoch(received_at))
+        if rows:
+            logger.info(f"{len(rows)} itens pendentes da fila foram retomados.")
+
+    def _sweep_loop(self):
+        # Recolhe itens liberados por outros processos (partição bloqueada, lease vencido)
+        while not self._stopping.wait(self.sweep_seconds):
+            try:
+                self._resume()
+            except Exception as e:
+                logger.error(f"Erro na varredura da fila: {e}", exc_info=True)
+
+    def _requeue_later(self, item_id: int, partition_key: Optional[str], delay: float):
+        with self._lock:
+            if item_id in self._queued:
+                return
+            self._queued.add(item_id)
+
+        def requeue():
+            if self._accepting:
+                self._lanes[self.lane_for(partition_key)].put((item_id, time.time()))
+            else:
+                with self._lock:
+                    self._queued.discard(item_id)
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    def _requeue_partitions(self, partition_keys: set):
+        # Itens que chegaram (ou foram bloqueados) enquanto a partição estava em processamento
+        rows = db.session.query(
+            InboundQueueItem.id, InboundQueueItem.partition_key, InboundQueueItem.received_at
+        ).filter(InboundQueueItem.partition_key.in_(list(partition_keys)), self._claimable()
+                 ).order_by(InboundQueueItem.id).all()
+        db.session.commit()
+        for item_id, key, received_at in rows:
+            self._put(item_id, key, _to_epoch(received_at))
+
+    def _backoff(self, attempts: int, suggested: Optional[float] = None) -> float:
+        delay = self.retry_backoff * 2 ** max(0, attempts - 1)
+        return min(self.max_retry_backoff, max(delay, suggested or 0.0))
+
+    def _claim(self, item_ids: List[int]) -> List[InboundQueueItem]:
+        """
+        Reivindica os itens com um único UPDATE condicional: só um worker (de qualquer
+        processo) consegue cada item, e só se nenhum item anterior da mesma partição, fora
+        deste lote, estiver pendente ou em processamento.
+        """
+        earlier = aliased(InboundQueueItem)
+        blocked = exists().where(
+            earlier.partition_key == InboundQueueItem.partition_key,
+            earlier.id < InboundQueueItem.id,
+            earlier.status.in_(['pending', 'processing']),
+            # Anteriores do próprio lote não bloqueiam se também forem reivindicados agora
+            db.not_(db.and_(earlier.id.in_(item_ids), self._claimable(earlier))),
+        )
+        claimed = db.session.execute(
+            update(InboundQueueItem)
+            .where(InboundQueueItem.id.in_(item_ids), self._claimable(), ~blocked)
+            .values(status="processing", started_at=datetime.utcnow(), attempts=InboundQueueItem.attempts + 1)
+            .returning(InboundQueueItem.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.session.commit()
+        if not claimed:
+            return []
+        return InboundQueueItem.query.filter(InboundQueueItem.id.in_(claimed)).order_by(InboundQueueItem.id).all()
+
+    def _worker_loop(self, lane: queue.Queue):
+        while True:
+            entry = lane.get()
+            if entry is _STOP:
+                return
+            batch = [entry]
+            stop = False
+            # Aproveita o que já está enfileirado nesta partição para processar em lote
+            while len(batch) < self.batch_size:
+                try:
+                    entry = lane.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            with self._lock:
+                self._queued.difference_update(item_id for item_id, _ in batch)
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List[Tuple[int, float]]):
+        with self.app.app_context():
+            items = []
+            try:
+                items = self._claim([item_id for item_id, _ in batch])
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao reivindicar itens da fila: {e}", exc_info=True)
+            if not items:
+                return
+            enqueued = dict(batch)
+            now = time.time()
+            for item in items:
+                self._record_wait(now - enqueued[item.id])
+
+            item_ids = [item.id for item in items]
+            partition_keys = {item.partition_key for item in items}
+            with self._lock:
+                self._in_flight += len(items)
+            payloads = []
+            for item in items:
+                payload = json.loads(item.payload)
+                # Por mensagem, porque o handler pode mesclar itens da mesma conversa
+                for message in payload.get("messages", []):
+                    message["attempt"] = item.attempts
+                payloads.append(payload)
+            try:
+                self.handler(self.app, payloads)
+                InboundQueueItem.query.filter(InboundQueueItem.id.in_(item_ids)).delete(synchronize_session=False)
+                db.session.commit()
+                with self._lock:
+                    self._processed += len(items)
+            except Exception as e:
+                db.session.rollback()
+                retries = []
+                now = datetime.utcnow()
+                for item in InboundQueueItem.query.filter(InboundQueueItem.id.in_(item_ids)).all():
+                    item.last_error = str(e)
+                    if item.attempts >= self.max_attempts:
+                        item.status = 'failed'
+                    else:
+                        delay = self._backoff(item.attempts, getattr(e, "delay", None))
+                        item.status = 'pending'
+                        item.available_at = now + timedelta(seconds=delay)
+                        retries.append((item.id, item.partition_key, delay))
+                db.session.commit()
+                for item_id, key, delay in retries:
+                    self._requeue_later(item_id, key, delay)
+                with self._lock:
+                    self._failed += len(items)
+                metrics.count("queue_items_failed", len(items))
+                # Indisponibilidade passageira de um serviço externo não precisa do traceback
+                logger.log(logging.WARNING if isinstance(e, RetryLater) and retries else logging.ERROR,
+                           f"Falha ao processar itens {item_ids} da fila ({len(retries)} serão tentados "
+                           f"de novo): {e}", exc_info=not isinstance(e, RetryLater))
+            finally:
+                with self._lock:
+                    self._in_flight -= len(items)
+            try:
+                self._requeue_partitions(partition_keys)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Erro ao reenfileirar partições {list(partition_keys)}: {e}", exc_info=True)
+
+    def _record_wait(self, wait: float):
+        # Recebimento do webhook -> início do processamento pelo worker
+        metrics.observe("queue_wait", wait)
+        with self._lock:
+            self._wait_count += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    def shutdown(self, timeout: float = 30.0):
+        """
+        Para de aceitar novos itens e aguarda os workers esvaziarem as filas em memória.
+        O que não terminar dentro do timeout continua 'pending' no banco e é retomado no próximo start.
+        """
+        if not self._accepting:
+            return
+        self._accepting = False
+        self._stopping.set()
+        logger.info(f"Drenando pool de workers ({self.queue_depth()} itens na fila)...")
+        for lane in self._lanes:
+            lane.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        alive = sum(1 for t in self._threads if t.is_alive())
+        if alive:
+            logger.warning(f"{alive} workers ainda ocupados ao fim do drain; itens restantes serão retomados.")
+        self._threads = []
+
+    def queue_depth(self) -> int:
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.size,
+                "queue_depth": self.queue_depth(),
+                "lane_depths": [lane.qsize() for lane in self._lanes],
+                "in_flight": self._in_flight,
+                "processed": self._processed,
+                "failed": self._failed,
+                "wait_avg_seconds": (self._wait_total / self._wait_count) if self._wait_count else 0.0,
+                "wait_max_seconds": self._wait_max,
+            }
+
+def _to_epoch(value: Optional[datetime]) -> float:
+    if value is None:
+        return time.time()
+    return (value - datetime(1970, 1, 1)).total_seconds()
@@ -0,0 +1,9 @@
+"""
+Ponto de entrada WSGI para o gunicorn (gunicorn src.wsgi:app, com gunicorn.conf.py).
+
+As threads de fundo não são iniciadas aqui: com preload este módulo é importado no master,
+e o hook post_worker_init as inicia em cada worker depois do fork.
+"""
+from src.main import create_app
+
+app = create_app(start_workers=False)
@@ -0,0 +1,72 @@
+"""
+Fixtures compartilhadas. A aplicação roda contra um SQLite temporário, o modelo local
+(LLM_BACKEND=local) e o stand-in da Graph API de benchmarks/fake_servers.py; nenhum teste
+sai para a rede.
+
+Requer as dependências de requirements.txt e o pytest:
+
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+import time
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Antes de importar src: os serviços leem a configuração do ambiente ao serem construídos
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tests.db')}",
+    "AUTO_MIGRATE": "true",
+    "LLM_BACKEND": "local",
+    "LOCAL_LLM_PARAGRAPHS": "4",
+    "LOCAL_LLM_TOKEN_DELAY": "0.02",
+    "WHATSAPP_ACCESS_TOKEN": "test",
+    "WHATSAPP_HUMANIZED_DELAYS": "false",
+    "WEBHOOK_RETRY_BACKOFF_SECONDS": "0.2",
+    "WEBHOOK_SWEEP_SECONDS": "0.2",
+})
+
+from benchmarks.fake_servers import graph_api  # noqa: E402
+from benchmarks.load_test import Inbox  # noqa: E402
+
+@pytest.fixture(scope="session")
+def inbox():
+    """
+    Bolhas recebidas pela Graph API falsa, por destinatário.
+    """
+    inbox = Inbox()
+    server = graph_api(on_message=inbox.record)
+    server.start()
+    os.environ["WHATSAPP_GRAPH_URL"] = server.base_url
+    yield inbox
+    server.stop()
+
+@pytest.fixture(scope="session")
+def app(inbox):
+    from src.main import create_app
+    return create_app(start_workers=False)
+
+@pytest.fixture
+def empty_queue(app):
+    """
+    Fila do webhook vazia no início do teste: os pools de um teste não enxergam itens de outro.
+    """
+    from src.database import db
+    from src.models.inbound_queue import InboundQueueItem
+    with app.app_context():
+        InboundQueueItem.query.delete()
+        db.session.commit()
+
+@pytest.fixture
+def wait_until():
+    def wait(predicate, timeout=10.0, interval=0.02):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return True
+            time.sleep(interval)
+        return predicate()
+    return wait
@@ -0,0 +1,85 @@
+import threading
+import time
+import pytest
+from src.availability_cache import AvailabilityCache, METADATA, SLOTS
+
+class Loader:
+    """
+    Consulta ao Calendly de mentira: conta as chamadas e devolve valores numerados.
+    """
+
+    def __init__(self, delay=0.0, fail=False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("Calendly fora do ar")
+        return f"valor {call}"
+
+def test_fresh_entry_is_served_from_cache():
+    cache = AvailabilityCache(slots_ttl=60)
+    loader = Loader()
+    assert cache.get(SLOTS, "semana", loader) == "valor 1"
+    assert cache.get(SLOTS, "semana", loader) == "valor 1"
+    assert loader.calls == 1
+    assert cache.stats()["hits"] == 1
+
+def test_stale_entry_is_served_while_refreshing(wait_until):
+    cache = AvailabilityCache(slots_ttl=0.05, stale_seconds=60)
+    loader = Loader(delay=0.2)
+    assert cache.get(SLOTS, "semana", loader) == "valor 1"
+    time.sleep(0.06)
+    started = time.monotonic()
+    # Vencida mas dentro da janela: volta na hora, e uma única atualização sai em segundo plano
+    assert cache.get(SLOTS, "semana", loader) == "valor 1"
+    assert cache.get(SLOTS, "semana", loader) == "valor 1"
+    assert time.monotonic() - started < 0.1
+    assert wait_until(lambda: cache.get(SLOTS, "semana", loader) == "valor 2")
+    assert cache.stats()["background_refreshes"] == 1
+
+def test_too_old_entry_is_reloaded_in_the_request():
+    cache = AvailabilityCache(slots_ttl=0.05, stale_seconds=0.01)
+    loader = Loader()
+    cache.get(SLOTS, "semana", loader)
+    time.sleep(0.07)
+    assert cache.get(SLOTS, "semana", loader) == "valor 2"
+    assert cache.stats()["background_refreshes"] == 0
+
+def test_concurrent_misses_share_one_query():
+    cache = AvailabilityCache()
+    loader = Loader(delay=0.2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(METADATA, "event_types", loader)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["valor 1"] * 5
+    assert loader.calls == 1
+
+def test_invalidation_discards_a_query_in_flight():
+    cache = AvailabilityCache()
+    loader = Loader(delay=0.2)
+    thread = threading.Thread(target=cache.get, args=(SLOTS, "semana", loader))
+    thread.start()
+    time.sleep(0.05)
+    # Agendamento durante a consulta: o resultado dela pode não incluir a reserva
+    cache.invalidate_slots()
+    thread.join()
+    assert cache.get(SLOTS, "semana", loader) == "valor 2"
+
+def test_stale_value_survives_a_failed_reload():
+    cache = AvailabilityCache(slots_ttl=0.05, stale_seconds=0.01)
+    cache.get(SLOTS, "semana", Loader())
+    time.sleep(0.07)
+    assert cache.get(SLOTS, "semana", Loader(fail=True)) == "valor 1"
+    with pytest.raises(ConnectionError):
+        cache.get(SLOTS, "outra semana", Loader(fail=True))
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from src.availability_index import AvailabilityIndex, BusinessHours, IntervalSet, StaticBusySource
+from src.time_parser import TIMEZONE
+
+MONDAY = datetime(2030, 1, 7, tzinfo=TIMEZONE)
+HOUR = timedelta(hours=1)
+
+def at(day, hour, minute=0):
+    return MONDAY + timedelta(days=day, hours=hour, minutes=minute)
+
+def hours(slots):
+    return [(start.astimezone(TIMEZONE).strftime("%a %H:%M")) for start, _ in slots]
+
+def test_interval_set_merges_and_splits():
+    busy = IntervalSet()
+    busy.add(at(0, 9), at(0, 10))
+    busy.add(at(0, 11), at(0, 12))
+    busy.add(at(0, 10), at(0, 11))
+    assert list(zip(busy.starts, busy.ends)) == [(at(0, 9), at(0, 12))]
+    busy.remove(at(0, 10), at(0, 10, 30))
+    assert list(zip(busy.starts, busy.ends)) == [(at(0, 9), at(0, 10)), (at(0, 10, 30), at(0, 12))]
+    assert list(busy.gaps(at(0, 8), at(0, 13))) == [(at(0, 8), at(0, 9)), (at(0, 10), at(0, 10, 30)),
+                                                    (at(0, 12), at(0, 13))]
+
+def test_business_hours_template():
+    business = BusinessHours("0-4=09:00-12:00,14:00-18:00;5=09:00-12:00")
+    assert list(business.windows(at(5, 0), at(7, 0))) == [(at(5, 9), at(5, 12))]
+    assert [(start.hour, end.hour) for start, end in business.windows(at(0, 10), at(0, 15))] == [(10, 12), (14, 15)]
+    with pytest.raises(ValueError):
+        BusinessHours("0-4=9h-18h")
+
+def test_free_slots_merge_every_calendar():
+    calendly = StaticBusySource([(at(0, 9), at(0, 10))])
+    google = StaticBusySource([(at(0, 10, 30), at(0, 11, 30)), (at(0, 14), at(0, 18))])
+    index = AvailabilityIndex([calendly, google], BusinessHours())
+    assert hours(index.free_slots(at(0, 0), at(1, 0), HOUR)) == []
+    assert hours(index.free_slots(at(0, 0), at(1, 0), timedelta(minutes=30))) == ["Mon 10:00", "Mon 11:30"]
+    assert len(index.free_slots(at(0, 0), at(5, 0), HOUR)) == 4 * 7
+    assert hours(index.free_slots(at(1, 0), at(5, 0), HOUR, limit=4)) == [
+        "Tue 09:00", "Tue 10:00", "Tue 11:00", "Tue 14:00"]
+    # Uma carga por semana, compartilhada pelas consultas seguintes
+    assert (calendly.fetches, google.fetches) == (1, 1)
+
+def test_bookings_are_applied_at_once_and_released_on_reload():
+    source = StaticBusySource()
+    index = AvailabilityIndex([source], BusinessHours("0-4=09:00-11:00"))
+    index.add_busy(at(0, 9), at(0, 10))
+    assert hours(index.free_slots(at(0, 0), at(1, 0), HOUR)) == ["Mon 10:00"]
+    assert not index.is_free(at(0, 9), at(0, 10))
+    index.release(at(0, 9), at(0, 10))
+    assert hours(index.free_slots(at(0, 0), at(1, 0), HOUR)) == ["Mon 09:00", "Mon 10:00"]
+    assert source.fetches == 2
+
+def test_no_slot_starts_before_the_lead_time(monkeypatch):
+    monkeypatch.setenv("AVAILABILITY_LEAD_MINUTES", "90")
+    index = AvailabilityIndex([], BusinessHours("0-6=00:00-23:59"), slot_step_minutes=30)
+    now = datetime.now(timezone.utc)
+    today = datetime.combine(now.astimezone(TIMEZONE).date(), datetime.min.time(), TIMEZONE)
+    slots = index.free_slots(today, today + timedelta(days=2), HOUR, limit=5)
+    assert len(slots) == 5
+    assert slots[0][0] >= now + timedelta(minutes=90)
+    assert slots[0][0] < now + timedelta(minutes=120)
+    # A grade segue alinhada ao início do turno
+    assert slots[0][0].astimezone(TIMEZONE).minute in (0, 30)
+
+def test_route_returns_ten_slots_unless_asked(app):
+    client = app.test_client()
+    url = "/api/scheduling/available-slots?start_date=2030-01-07&end_date=2030-01-11"
+    assert client.get(url).get_json()["total_slots"] == 10
+    assert client.get(url + "&limit=20").get_json()["total_slots"] == 20
+    assert client.get(url + "&limit=0").status_code == 400
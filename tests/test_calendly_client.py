@@ -0,0 +1,37 @@
+import pytest
+from benchmarks.fake_servers import calendly_api
+from src.availability_cache import availability_cache
+from src.calendly_client import CalendlyClient
+
+@pytest.fixture
+def calendly(monkeypatch):
+    server = calendly_api(event_types=5).start()
+    monkeypatch.setenv("CALENDLY_PAGE_SIZE", "2")
+    availability_cache.clear()
+    yield server
+    availability_cache.clear()
+    server.stop()
+
+def test_event_types_follow_every_page(calendly):
+    client = CalendlyClient(token="test", base_url=calendly.base_url)
+    event_types = client.get_event_types()
+    assert [event_type["name"] for event_type in event_types] == ["Reunião de diagnóstico"] + [
+        f"Evento {n}" for n in range(2, 6)]
+    # Usuário + três páginas de dois, numa única conexão keep-alive
+    assert calendly.requests == 4
+    assert calendly.connections == 1
+
+def test_event_types_are_looked_up_once(calendly):
+    client = CalendlyClient(token="test", base_url=calendly.base_url)
+    assert client.get_primary_event_type()["name"] == "Reunião de diagnóstico"
+    requests = calendly.requests
+    # Outro cliente no mesmo processo aproveita os metadados em cache
+    other = CalendlyClient(token="test", base_url=calendly.base_url)
+    assert other.get_primary_event_type()["uri"] == client.get_primary_event_type()["uri"]
+    assert calendly.requests == requests
+
+def test_unconfigured_client_refuses_to_call():
+    client = CalendlyClient(token="", base_url="http://127.0.0.1:9")
+    assert not client.configured
+    with pytest.raises(RuntimeError):
+        client.get("users/me")
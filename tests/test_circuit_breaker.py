@@ -0,0 +1,93 @@
+import time
+import pytest
+from benchmarks.fake_servers import FakeServer
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from src.llm_backends import HuggingFaceBackend, UpstreamUnavailable
+
+def test_opens_after_consecutive_failures_and_closes_after_a_test_call():
+    breaker = CircuitBreaker("teste", failure_threshold=3, reset_timeout=0.1)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert 0 < breaker.retry_after() <= 0.1
+
+    time.sleep(0.12)
+    assert breaker.state == HALF_OPEN
+    assert breaker.retry_after() == 0
+    # Uma única chamada de teste por vez
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.metrics()["trips"] == 1
+    assert breaker.metrics()["rejected"] == 2
+
+def test_failed_test_call_reopens():
+    breaker = CircuitBreaker("teste", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.metrics()["trips"] == 2
+
+def test_release_returns_the_test_slot():
+    breaker = CircuitBreaker("teste", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    # Ex.: HTTP 400, que não diz nada sobre a saúde do serviço
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+@pytest.fixture
+def backend(monkeypatch):
+    servers = []
+
+    def build(status, body, headers=None):
+        server = FakeServer(lambda method, path, query, payload: (status, body, headers or {})).start()
+        servers.append(server)
+        monkeypatch.setenv("HUGGINGFACE_API_KEY", "test")
+        monkeypatch.setenv("HUGGINGFACE_API_URL", f"{server.base_url}/models/gpt2")
+        backend = HuggingFaceBackend()
+        backend.breaker = CircuitBreaker("teste", failure_threshold=2, reset_timeout=30)
+        return backend, server
+    yield build
+    for server in servers:
+        server.stop()
+
+REQUEST = {"text": "Oi", "history": [{"role": "user", "content": "Oi"}]}
+
+def test_unavailable_provider_is_handed_back_without_sleeping(backend):
+    llm, server = backend(503, {"error": "Model gpt2 is currently loading", "estimated_time": 20.0})
+    started = time.monotonic()
+    with pytest.raises(UpstreamUnavailable) as error:
+        llm.generate(REQUEST)
+    assert error.value.delay == 20.0
+    with pytest.raises(UpstreamUnavailable):
+        llm.generate(REQUEST)
+    # Com o circuito aberto nem chega a sair a requisição; a espera é o resto do reset_timeout
+    with pytest.raises(UpstreamUnavailable) as error:
+        llm.generate(REQUEST)
+    assert 29 < error.value.delay <= 30
+    assert server.requests == 2
+    assert time.monotonic() - started < 1.0
+
+def test_retry_after_of_a_429_is_the_suggested_wait(backend):
+    llm, _ = backend(429, {"error": "rate limited"}, {"Retry-After": "7"})
+    with pytest.raises(UpstreamUnavailable) as error:
+        llm.generate(REQUEST)
+    assert error.value.delay == 7.0
+
+def test_rejected_request_falls_back_without_tripping(backend):
+    llm, server = backend(400, {"error": "bad request"})
+    for _ in range(3):
+        assert llm.generate(REQUEST) is None
+    assert server.requests == 3
+    assert llm.breaker.state == CLOSED
@@ -0,0 +1,68 @@
+from src.conversation_cache import ConversationCache
+from src.database import db
+from src.models.conversation import Conversation, Message
+
+def unit(phone):
+    return {"from_number": phone, "user_name": "Ana"}
+
+def store(cache, phone, *turns):
+    ids = cache.get_or_create_many([unit(phone)])
+    cache.add_messages([{"conversation_id": ids[phone], "message_type": role, "content": content}
+                        for role, content in turns], {ids[phone]: phone})
+    return ids[phone]
+
+def test_conversation_is_created_once_and_cached(app):
+    phone = "5511900004444"
+    cache = ConversationCache()
+    with app.app_context():
+        first = cache.get_or_create_many([unit(phone), unit(phone)])
+        assert cache.get_or_create_many([unit(phone)]) == first
+        assert Conversation.query.filter_by(phone_number=phone).count() == 1
+
+def test_buffer_is_served_while_the_version_matches(app):
+    phone = "5511900005555"
+    cache = ConversationCache()
+    with app.app_context():
+        conversation_id = store(cache, phone, ("user", "Oi"))
+        # O buffer é montado na primeira leitura; daí em diante as gravações entram nele direto
+        cache.histories([phone])
+        cache.add_messages([{"conversation_id": conversation_id, "message_type": "assistant", "content": "Olá!"}],
+                           {conversation_id: phone})
+        assert cache.histories([phone]) == {phone: [{"role": "user", "content": "Oi"},
+                                                    {"role": "assistant", "content": "Olá!"}]}
+        assert cache.stats()["history_hits"] == 1
+        assert cache.stats()["history_misses"] == 1
+
+def test_write_from_another_process_reloads_the_buffer(app):
+    phone = "5511900006666"
+    # Duas instâncias fazem o papel de dois workers gunicorn gravando na mesma conversa
+    cache, other = ConversationCache(), ConversationCache()
+    with app.app_context():
+        store(cache, phone, ("user", "Oi"))
+        cache.histories([phone])
+        store(other, phone, ("assistant", "Olá!"))
+        assert [turn["content"] for turn in cache.histories([phone])[phone]] == ["Oi", "Olá!"]
+        assert cache.stats()["history_hits"] == 0
+        assert cache.stats()["history_misses"] == 2
+
+def test_evicted_conversation_falls_back_to_the_database(app):
+    phones = ["5511900007777", "5511900008888"]
+    cache = ConversationCache(maxsize=1)
+    with app.app_context():
+        for phone in phones:
+            store(cache, phone, ("user", f"Oi de {phone}"))
+        assert cache.stats()["evictions"] == 1
+        histories = cache.histories(phones + ["5511900009999"])
+    assert histories == {phones[0]: [{"role": "user", "content": f"Oi de {phones[0]}"}],
+                         phones[1]: [{"role": "user", "content": f"Oi de {phones[1]}"}],
+                         "5511900009999": []}
+
+def test_truncated_reply_replaces_the_stored_text(app):
+    phone = "5511900001234"
+    cache = ConversationCache()
+    with app.app_context():
+        conversation_id = store(cache, phone, ("user", "Oi"), ("assistant", "um\ndois\ntrês"))
+        reply = (db.session.query(Message.id).filter_by(conversation_id=conversation_id, message_type="assistant")
+                 .scalar())
+        cache.truncate_message(reply, "um", phone)
+        assert [turn["content"] for turn in cache.histories([phone])[phone]] == ["Oi", "um"]
@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import Future
+from src.delivery_scheduler import DeliveryScheduler
+
+PHONE = "5511922221111"
+PHONE_NUMBER_ID = "PN1"
+
+class Sender:
+    """
+    send_func do agendador: registra as bolhas e confirma o envio na hora.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, recipient_id, text, phone_number_id):
+        with self._lock:
+            self.sent.append(text)
+        future = Future()
+        future.set_result({"messages": [{"id": f"wamid.out{len(self.sent)}"}]})
+        return future
+
+def schedule(scheduler, bubbles, reply, pause=0.0):
+    return scheduler.schedule(PHONE, bubbles, PHONE_NUMBER_ID, initial_delay=0.0,
+                              pause_func=lambda: pause, reply=reply)
+
+def test_cancel_stops_a_reply_still_being_generated(wait_until):
+    sender = Sender()
+    scheduler = DeliveryScheduler(sender)
+    try:
+        reply = scheduler.begin_reply(PHONE)
+        assert schedule(scheduler, ["primeiro"], reply)
+        assert wait_until(lambda: reply.delivered == ["primeiro"] and reply.outstanding == 0)
+
+        scheduler.cancel(PHONE)
+        # O parágrafo gerado depois da mensagem nova não é agendado
+        assert reply.superseded
+        assert not schedule(scheduler, ["segundo"], reply)
+        truncated = []
+        assert scheduler.finish_reply(reply, truncated.append) == "primeiro"
+        assert truncated == []
+        assert sender.sent == ["primeiro"]
+    finally:
+        scheduler.shutdown()
+
+def test_cancel_after_finish_reports_delivered_text(wait_until):
+    sender = Sender()
+    scheduler = DeliveryScheduler(sender)
+    try:
+        reply = scheduler.begin_reply(PHONE)
+        assert schedule(scheduler, ["a", "b", "c"], reply, pause=1.0)
+        assert wait_until(lambda: reply.delivered == ["a"])
+        truncated = []
+        # Gerador terminou com bolhas ainda por enviar: a resposta inteira é gravada
+        assert scheduler.finish_reply(reply, truncated.append) is None
+
+        assert scheduler.cancel(PHONE) == 2
+        # ...e corrigida para o que de fato saiu
+        assert truncated == ["a"]
+        assert scheduler.pending_count(PHONE) == 0
+        assert sender.sent == ["a"]
+    finally:
+        scheduler.shutdown()
+
+def test_new_reply_supersedes_the_previous_one(wait_until):
+    sender = Sender()
+    scheduler = DeliveryScheduler(sender)
+    try:
+        first = scheduler.begin_reply(PHONE)
+        assert schedule(scheduler, ["antiga 1", "antiga 2"], first, pause=1.0)
+        assert wait_until(lambda: first.delivered == ["antiga 1"])
+
+        second = scheduler.begin_reply(PHONE)
+        assert first.superseded and first.truncated
+        assert schedule(scheduler, ["nova"], second)
+        assert wait_until(lambda: second.delivered == ["nova"])
+        assert scheduler.finish_reply(first, lambda text: None) == "antiga 1"
+        assert scheduler.finish_reply(second, lambda text: None) is None
+        assert sender.sent == ["antiga 1", "nova"]
+    finally:
+        scheduler.shutdown()
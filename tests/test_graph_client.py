@@ -0,0 +1,39 @@
+import pytest
+from benchmarks.fake_servers import graph_api
+from src.whatsapp_api import WhatsAppAPI
+
+MESSAGE = {"messaging_product": "whatsapp", "to": "5511900001111", "type": "text", "text": {"body": "Oi"}}
+
+@pytest.fixture
+def graph_url(monkeypatch):
+    def start(server):
+        server.start()
+        monkeypatch.setenv("WHATSAPP_GRAPH_URL", server.base_url)
+        servers.append(server)
+        return server
+    servers = []
+    yield start
+    for server in servers:
+        server.stop()
+
+def test_requests_reuse_one_keep_alive_connection(graph_url):
+    server = graph_url(graph_api())
+    api = WhatsAppAPI()
+    for _ in range(10):
+        assert api.send_request("POST", "PN1/messages", MESSAGE)["messages"]
+    assert server.requests == 10
+    assert server.connections == 1
+
+def test_send_is_not_repeated_after_a_server_error(graph_url):
+    server = graph_url(graph_api(error_rate=1.0, error_status=503))
+    api = WhatsAppAPI()
+    # O POST pode ter chegado à Meta: repetir duplicaria a bolha
+    assert api.send_request("POST", "PN1/messages", MESSAGE) is None
+    assert server.requests == 1
+
+def test_idempotent_request_is_retried_after_a_server_error(graph_url, monkeypatch):
+    monkeypatch.setenv("WHATSAPP_MAX_RETRIES", "2")
+    server = graph_url(graph_api(error_rate=1.0, error_status=503))
+    api = WhatsAppAPI()
+    assert api.send_request("GET", "PN1") is None
+    assert server.requests == 3
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+import pytest
+from src.database import db
+from src.history import load_history
+from src.models.conversation import Conversation, Message
+
+@pytest.fixture
+def conversation(app):
+    with app.app_context():
+        conversation = Conversation(phone_number="5511900003333")
+        db.session.add(conversation)
+        db.session.flush()
+        start = datetime(2026, 1, 1, 12, 0)
+        for n in range(30):
+            db.session.add(Message(conversation_id=conversation.id, message_type="user" if n % 2 == 0 else "assistant",
+                                   content=f"mensagem {n}", timestamp=start + timedelta(minutes=n)))
+        db.session.commit()
+        yield conversation.id
+        Message.query.filter_by(conversation_id=conversation.id).delete()
+        Conversation.query.filter_by(id=conversation.id).delete()
+        db.session.commit()
+
+def contents(history):
+    return [message["content"] for message in history]
+
+def test_loads_the_most_recent_window_in_order(app, conversation):
+    with app.app_context():
+        history = load_history(conversation, limit=5)
+    assert contents(history) == [f"mensagem {n}" for n in range(25, 30)]
+    assert history[-1]["role"] == "assistant"
+
+def test_token_budget_keeps_the_latest_message(app, conversation):
+    with app.app_context():
+        assert contents(load_history(conversation, limit=10, max_tokens=8)) == ["mensagem 28", "mensagem 29"]
+        assert contents(load_history(conversation, limit=10, max_tokens=1)) == ["mensagem 29"]
+
+def test_cursor_pages_backwards(app, conversation):
+    with app.app_context():
+        oldest = (Message.query.filter_by(conversation_id=conversation, content="mensagem 25").one())
+        page = load_history(conversation, limit=3, before=(oldest.timestamp, oldest.id))
+    assert contents(page) == ["mensagem 22", "mensagem 23", "mensagem 24"]
@@ -0,0 +1,68 @@
+import threading
+import pytest
+from benchmarks.fake_servers import huggingface_api
+from src.llm_backends import HuggingFaceBackend, LocalBackend, build_prompt
+from src.llm_service import CognoxLLMService
+
+HISTORY = [{"role": "user", "content": "Oi"}, {"role": "assistant", "content": "Olá!"},
+           {"role": "user", "content": "Quanto custa?"}]
+REQUEST = {"text": "Quanto custa?", "history": HISTORY}
+
+@pytest.fixture
+def huggingface(monkeypatch):
+    server = huggingface_api(paragraphs=2)
+    route = server.route
+    server.payloads = []
+
+    def recording(method, path, query, body):
+        server.payloads.append(body)
+        return route(method, path, query, body)
+
+    server.route = recording
+    server.start()
+    monkeypatch.setenv("HUGGINGFACE_API_KEY", "test")
+    monkeypatch.setenv("HUGGINGFACE_API_URL", f"{server.base_url}/models/gpt2")
+    yield server
+    server.stop()
+
+def test_generate_stream_and_batch_send_the_same_prompt(huggingface):
+    backend = HuggingFaceBackend()
+    text = backend.generate(REQUEST)
+    streamed = "".join(backend.stream(REQUEST)).strip()
+    assert backend.generate_batch([REQUEST]) == [text]
+    assert streamed.split() == text.split()
+
+    single, stream, batch = huggingface.payloads
+    # Os três caminhos gravam na mesma chave do ResponseCache
+    assert single["inputs"] == stream["inputs"] == build_prompt(REQUEST)
+    assert batch["inputs"] == [build_prompt(REQUEST)]
+    assert single["parameters"] == stream["parameters"] == batch["parameters"]
+    assert stream["stream"] and not single["stream"]
+
+def test_prompt_carries_the_history():
+    prompt = build_prompt(REQUEST)
+    assert prompt.endswith("Cliente: Oi\nSofia: Olá!\nCliente: Quanto custa?\nSofia:")
+
+def test_local_backend_streams_paragraphs():
+    backend = LocalBackend(paragraphs=3)
+    fragments = list(backend.stream(REQUEST))
+    assert fragments.count("\n") == 2
+    assert "".join(fragments).strip() == backend.generate(REQUEST)
+    assert backend.generate_batch([REQUEST, REQUEST]) == [backend.generate(REQUEST)] * 2
+
+def test_cancelled_stream_stops_and_is_not_cached():
+    service = CognoxLLMService()
+    question = "Como funciona a consultoria?"
+    history = [{"role": "user", "content": "Oi"}, {"role": "assistant", "content": "Olá!"},
+               {"role": "user", "content": question}]
+    cancelled = threading.Event()
+
+    stream = service.stream_message(question, history, cancelled=cancelled.is_set)
+    assert next(stream).startswith("Entendi")
+    cancelled.set()
+    assert list(stream) == []
+
+    key = service.response_cache.key(question, history)
+    assert service.response_cache.get(key) is None
+    # A geração interrompida liberou a chave: a próxima não espera por ela e sai inteira
+    assert len(list(service.stream_message(question, history))) == 4
@@ -0,0 +1,79 @@
+import threading
+import pytest
+from src.llm_backends import LLMBackend, LocalBackend
+from src.llm_batcher import InferenceBatcher
+
+class RecordingBackend(LLMBackend):
+    """
+    Backend que registra o tamanho de cada chamada ao provedor.
+    """
+    name = "recording"
+
+    def __init__(self, supports_batching=True, fail=False):
+        self.supports_batching = supports_batching
+        self.fail = fail
+        self.batches = []
+        self.singles = 0
+        self._lock = threading.Lock()
+
+    def generate(self, request):
+        with self._lock:
+            self.singles += 1
+        return f"resposta para {request['text']}"
+
+    def generate_batch(self, requests):
+        with self._lock:
+            self.batches.append(len(requests))
+        if self.fail:
+            raise RuntimeError("provedor fora do ar")
+        return super().generate_batch(requests)
+
+def request(n):
+    return {"text": f"pergunta {n}", "history": []}
+
+@pytest.fixture
+def batcher_for():
+    batchers = []
+
+    def build(backend, **kwargs):
+        batcher = InferenceBatcher(backend, **kwargs)
+        batchers.append(batcher)
+        return batcher
+    yield build
+    for batcher in batchers:
+        batcher.shutdown()
+
+def test_requests_in_the_window_share_one_call(batcher_for):
+    backend = RecordingBackend()
+    batcher = batcher_for(backend, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(request(n)) for n in range(6)]
+    assert [future.result(timeout=5) for future in futures] == [f"resposta para pergunta {n}" for n in range(6)]
+    assert sorted(backend.batches) == [2, 4]
+    assert batcher.metrics()["max_batch_size"] == 4
+
+def test_single_request_takes_the_batch_path(batcher_for):
+    backend = RecordingBackend()
+    batcher = batcher_for(backend, max_wait_ms=0)
+    # Sozinho na janela, o pedido usa o mesmo montador de payload de um lote
+    assert batcher.generate(request(1)) == "resposta para pergunta 1"
+    assert backend.batches == [1]
+
+def test_backend_without_batching_gets_one_call_per_request(batcher_for):
+    backend = RecordingBackend(supports_batching=False)
+    batcher = batcher_for(backend, max_batch_size=4, max_wait_ms=100)
+    futures = [batcher.submit(request(n)) for n in range(3)]
+    assert [future.result(timeout=5) for future in futures] == [f"resposta para pergunta {n}" for n in range(3)]
+    assert backend.batches == [1, 1, 1]
+
+def test_failed_batch_fails_every_caller(batcher_for):
+    batcher = batcher_for(RecordingBackend(fail=True), max_batch_size=4, max_wait_ms=100)
+    futures = [batcher.submit(request(n)) for n in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+def test_local_batch_matches_single_generation(batcher_for):
+    backend = LocalBackend(paragraphs=2)
+    batcher = batcher_for(backend, max_batch_size=8, max_wait_ms=100)
+    futures = [batcher.submit(request(n)) for n in range(3)]
+    assert [future.result(timeout=5) for future in futures] == [backend.generate(request(n)) for n in range(3)]
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import pytest
+from src.metrics import MetricsRegistry
+
+def test_thread_shards_are_summed():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(100):
+            registry.observe("llm_total", 0.5)
+            registry.count("llm_fallbacks")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registry.observe("llm_total", 0.05)
+    registry.observe("llm_total", 5.0)
+    snapshot = registry.snapshot()
+    # Buckets cumulativos: <=0.1, <=1.0, +Inf
+    assert snapshot["stages"]["llm_total"]["buckets"] == [1, 401, 402]
+    assert snapshot["stages"]["llm_total"]["count"] == 402
+    assert snapshot["stages"]["llm_total"]["sum"] == pytest.approx(205.05)
+    assert snapshot["events"] == {"llm_fallbacks": 400}
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry(buckets=(0.1, 1.0), prefix="teste")
+    with registry.timer("webhook_receive"):
+        pass
+    registry.count("duplicates_dropped", 3)
+    registry.register_gauge("inbound_queue_depth", "Itens na fila.", lambda: 7)
+    registry.register_gauge("broken", "Falha na leitura.", lambda: 1 / 0)
+    lines = registry.render_prometheus().splitlines()
+    assert "# TYPE teste_stage_duration_seconds histogram" in lines
+    assert 'teste_stage_duration_seconds_bucket{stage="webhook_receive",le="0.1"} 1' in lines
+    assert 'teste_stage_duration_seconds_bucket{stage="webhook_receive",le="+Inf"} 1' in lines
+    assert 'teste_stage_duration_seconds_count{stage="webhook_receive"} 1' in lines
+    assert 'teste_events_total{event="duplicates_dropped"} 3' in lines
+    assert "teste_inbound_queue_depth 7" in lines
+    # Um gauge que falha fica de fora, sem derrubar a coleta
+    assert not any(line.startswith("teste_broken") for line in lines)
+
+def snapshot_file(directory, pid, events, gauges):
+    with open(os.path.join(directory, f"metrics-{pid}.json"), "w", encoding="utf-8") as f:
+        json.dump({"pid": pid, "stages": {"llm_total": {"buckets": [1, 2, 2], "count": 2, "sum": 0.6}},
+                   "events": events, "gauges": gauges}, f)
+
+def test_shared_dir_merges_other_workers(tmp_path):
+    registry = MetricsRegistry(buckets=(0.1, 1.0), prefix="teste")
+    registry.share(str(tmp_path), interval=3600)
+    registry.observe("llm_total", 0.05)
+    registry.count("llm_fallbacks")
+    registry.register_gauge("inbound_queue_depth", "Itens na fila.", lambda: 1)
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    # Um worker vivo (o processo pai faz esse papel) e um que já terminou
+    snapshot_file(tmp_path, os.getppid(), {"llm_fallbacks": 2}, {"inbound_queue_depth": 4})
+    snapshot_file(tmp_path, finished.pid, {"llm_fallbacks": 5}, {"inbound_queue_depth": 100})
+    registry.flush()
+
+    lines = registry.render_prometheus().splitlines()
+    # Contadores e histogramas incluem os workers encerrados; gauges, só os vivos
+    assert 'teste_events_total{event="llm_fallbacks"} 8' in lines
+    assert 'teste_stage_duration_seconds_bucket{stage="llm_total",le="0.1"} 3' in lines
+    assert 'teste_stage_duration_seconds_count{stage="llm_total"} 5' in lines
+    assert "teste_inbound_queue_depth 5" in lines
+
+def test_metrics_route(app):
+    response = app.test_client().get("/api/whatsapp/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "# TYPE cognox_stage_duration_seconds histogram" in response.get_data(as_text=True)
@@ -0,0 +1,63 @@
+import time
+import pytest
+import requests
+from benchmarks.fake_servers import graph_api
+from src.outbound_engine import OutboundEngine, TokenBucket
+
+MESSAGE = {"messaging_product": "whatsapp", "to": "5511900002222", "type": "text", "text": {"body": "Oi"}}
+
+@pytest.fixture
+def engine_for():
+    engines, servers = [], []
+
+    def build(server, **kwargs):
+        server.start()
+        servers.append(server)
+        session = requests.Session()
+        engine = OutboundEngine(lambda method, endpoint, data: session.request(
+            method, f"{server.base_url}/{endpoint}", json=data, timeout=5), **kwargs)
+        engines.append(engine)
+        return engine
+    yield build
+    for engine in engines:
+        engine.shutdown()
+    for server in servers:
+        server.stop()
+
+def test_token_bucket_spends_the_burst_then_paces():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.02)
+
+def test_token_bucket_block_holds_every_send():
+    bucket = TokenBucket(rate=100, capacity=100)
+    bucket.block(1.0)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.02)
+    bucket.block(0.2)
+    # Um bloqueio mais curto não antecipa o anterior
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.02)
+
+def test_sends_are_paced_per_phone_number_id(engine_for):
+    server = graph_api()
+    engine = engine_for(server, rate=10, burst=1)
+    started = time.monotonic()
+    futures = [engine.submit("PN1", "PN1/messages", MESSAGE) for _ in range(4)]
+    other = engine.submit("PN2", "PN2/messages", MESSAGE)
+    assert other.result(timeout=5) is not None
+    # PN2 tem o próprio bucket e não espera pela fila de PN1
+    assert time.monotonic() - started < 0.2
+    assert all(future.result(timeout=5) is not None for future in futures)
+    assert time.monotonic() - started >= 0.28
+
+def test_429_is_retried_after_retry_after(engine_for):
+    server = graph_api(rate_limit=2)
+    engine = engine_for(server, rate=100)
+    started = time.monotonic()
+    futures = [engine.submit("PN1", "PN1/messages", MESSAGE) for _ in range(4)]
+    assert all(future.result(timeout=10) is not None for future in futures)
+    # Os envios recusados só voltam depois do Retry-After: 1 da Graph API
+    assert time.monotonic() - started >= 1.0
+    assert engine.metrics()["throttled"] >= 2
+    assert engine.metrics()["failed"] == 0
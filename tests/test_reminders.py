@@ -0,0 +1,127 @@
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+import pytest
+from src.database import db
+from src.models.conversation import Conversation, SchedulingInfo
+from src.models.reminder_job import ReminderJob
+from src.reminders import ReminderDispatcher, resolve_meeting_time
+from src.time_parser import TIMEZONE
+
+class Sender:
+    """
+    sender dos jobs: registra os lembretes e responde como a Graph API (ou falha para alguns telefones).
+    """
+
+    def __init__(self, failing=()):
+        self.sent = []
+        self.failing = set(failing)
+        self._lock = threading.Lock()
+
+    def __call__(self, phone_number, text):
+        future = Future()
+        if phone_number in self.failing:
+            future.set_result(None)
+            return future
+        with self._lock:
+            self.sent.append((phone_number, text))
+        future.set_result({"messages": [{"id": f"wamid.lembrete{len(self.sent)}"}]})
+        return future
+
+@pytest.fixture
+def meetings(app):
+    """
+    Cria reuniões confirmadas a partir de {telefone: horas até a reunião (None = sem horário)}.
+    """
+    def create(hours_by_phone, **fields):
+        now = datetime.utcnow()
+        with app.app_context():
+            for phone, hours in hours_by_phone.items():
+                conversation = Conversation(phone_number=phone)
+                db.session.add(conversation)
+                db.session.flush()
+                db.session.add(SchedulingInfo(
+                    conversation_id=conversation.id, name="Ana", preferred_time="amanhã às 10h", status="confirmed",
+                    scheduled_for=now + timedelta(hours=hours) if hours is not None else None, **fields))
+            db.session.commit()
+
+    def clean():
+        with app.app_context():
+            ReminderJob.query.delete()
+            SchedulingInfo.query.delete()
+            db.session.commit()
+    clean()
+    yield create
+    clean()
+
+def run_job(app, dispatcher, sender, wait_until):
+    with app.app_context():
+        job_id = dispatcher.start_job(app, sender)["job_id"]
+    assert wait_until(lambda: job(app, dispatcher, job_id)["status"] == "completed")
+    return job(app, dispatcher, job_id)
+
+def job(app, dispatcher, job_id):
+    with app.app_context():
+        return dispatcher.job(job_id)
+
+def test_each_meeting_in_the_window_is_reminded_once(app, meetings, wait_until):
+    meetings({"5511900010001": 2, "5511900010002": 20}, service_interest="Chatbots")
+    meetings({"5511900010003": 30, "5511900010004": -1, "5511900010005": None})
+    dispatcher = ReminderDispatcher(chunk_size=1)
+    sender = Sender()
+
+    state = run_job(app, dispatcher, sender, wait_until)
+    assert sorted(phone for phone, _ in sender.sent) == ["5511900010001", "5511900010002"]
+    assert "🎯 Assunto: Chatbots" in sender.sent[0][1]
+    assert (state["claimed"], state["sent"], state["failed"], state["unscheduled"]) == (2, 2, 0, 1)
+
+    # Um segundo job não encontra nada a lembrar
+    assert run_job(app, dispatcher, sender, wait_until)["sent"] == 0
+    assert len(sender.sent) == 2
+
+def test_concurrent_jobs_never_remind_twice(app, meetings, wait_until):
+    meetings({f"55119000200{n:02d}": 1 for n in range(30)})
+    dispatcher = ReminderDispatcher(chunk_size=4)
+    sender = Sender()
+    with app.app_context():
+        job_ids = [dispatcher.start_job(app, sender)["job_id"] for _ in range(3)]
+    assert wait_until(lambda: all(job(app, dispatcher, job_id)["status"] == "completed" for job_id in job_ids))
+    assert sorted(phone for phone, _ in sender.sent) == [f"55119000200{n:02d}" for n in range(30)]
+
+def test_failed_send_is_released_for_the_next_job(app, meetings, wait_until):
+    meetings({"5511900030001": 1, "5511900030002": 1})
+    dispatcher = ReminderDispatcher()
+    state = run_job(app, dispatcher, Sender(failing={"5511900030002"}), wait_until)
+    assert (state["sent"], state["failed"]) == (1, 1)
+
+    sender = Sender()
+    assert run_job(app, dispatcher, sender, wait_until)["sent"] == 1
+    assert [phone for phone, _ in sender.sent] == ["5511900030002"]
+
+def test_abandoned_job_is_resumed_from_its_cursor(app, meetings, wait_until):
+    meetings({"5511900040001": 1, "5511900040002": 1, "5511900040003": 1})
+    now = datetime.utcnow()
+    with app.app_context():
+        first, second, third = [row.id for row in SchedulingInfo.query.order_by(SchedulingInfo.id)]
+        # Processo morreu com o primeiro bloco concluído e o segundo reivindicado mas talvez não enviado
+        db.session.execute(db.update(SchedulingInfo).where(SchedulingInfo.id.in_([first, second]))
+                           .values(reminded_at=now))
+        db.session.add(ReminderJob(id="abandonado", status="running", window_start=now - timedelta(hours=1),
+                                   window_end=now + timedelta(hours=23), cursor=first, in_progress=f"[{second}]",
+                                   claimed=2, sent=1, started_at=now, updated_at=now - timedelta(hours=1)))
+        db.session.commit()
+
+    dispatcher = ReminderDispatcher()
+    sender = Sender()
+    assert dispatcher.resume(app, sender) == 1
+    assert wait_until(lambda: job(app, dispatcher, "abandonado")["status"] == "completed")
+    assert sorted(phone for phone, _ in sender.sent) == ["5511900040002", "5511900040003"]
+    assert job(app, dispatcher, "abandonado")["sent"] == 3
+    # Job com lease em dia continua com o processo dele
+    assert dispatcher.resume(app, sender) == 0
+
+def test_meeting_time_is_resolved_in_utc():
+    now = datetime(2026, 10, 15, 10, 0, tzinfo=TIMEZONE)
+    assert resolve_meeting_time("amanhã às 10h", now) == datetime(2026, 10, 16, 13, 0)
+    assert resolve_meeting_time("sexta à tarde", now) == datetime(2026, 10, 16, 17, 0)
+    assert resolve_meeting_time("quando der", now) is None
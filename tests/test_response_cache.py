@@ -0,0 +1,54 @@
+import threading
+import time
+import pytest
+from src.response_cache import ResponseCache
+
+HISTORY = [{"role": "assistant", "content": "Olá!"}, {"role": "user", "content": "Quanto custa?"}]
+
+def test_key_ignores_case_accents_and_punctuation():
+    cache = ResponseCache()
+    assert cache.key("Quanto custa?", HISTORY) == cache.key("  quanto CUSTA ", HISTORY)
+    assert cache.key("Você atende?", HISTORY) == cache.key("voce atende", HISTORY)
+    # O turno anterior faz parte do contexto
+    assert cache.key("Quanto custa?", HISTORY) != cache.key("Quanto custa?", [{"role": "assistant", "content": "Oi"},
+                                                                               HISTORY[-1]])
+
+def test_concurrent_calls_share_one_computation():
+    cache = ResponseCache()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "resposta"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 7:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ["resposta"] * 8
+    assert cache.get_or_compute("k", compute) == "resposta"
+    assert cache.stats()["hits"] == 1
+
+def test_failures_are_shared_but_not_stored():
+    cache = ResponseCache()
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", lambda: (_ for _ in ()).throw(RuntimeError("upstream")))
+    assert cache.get_or_compute("k", lambda: None) is None
+    # Nem a exceção nem o None ficam em cache: a próxima chamada gera de novo
+    assert cache.get_or_compute("k", lambda: "resposta") == "resposta"
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=0.1)
+    cache.put("k", "resposta", latency=1.0)
+    assert cache.get("k") == "resposta"
+    assert cache.stats()["saved_latency_seconds"] == 1.0
+    time.sleep(0.15)
+    assert cache.get("k") is None
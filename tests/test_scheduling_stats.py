@@ -0,0 +1,100 @@
+from datetime import date, datetime, timedelta
+import pytest
+from src import scheduling_stats
+from src.database import db
+from src.models.conversation import Conversation, SchedulingInfo
+from src.models.scheduling_stats import SchedulingDailyCount, SchedulingStatusCount
+
+@pytest.fixture
+def clean(app):
+    def wipe():
+        with app.app_context():
+            SchedulingInfo.query.delete()
+            SchedulingStatusCount.query.delete()
+            SchedulingDailyCount.query.delete()
+            db.session.commit()
+    wipe()
+    yield
+    wipe()
+
+def schedule(phone, status="pending", created_at=None):
+    conversation = Conversation(phone_number=phone)
+    db.session.add(conversation)
+    db.session.flush()
+    info = SchedulingInfo(conversation_id=conversation.id, name="Ana", status=status, created_at=created_at)
+    db.session.add(info)
+    return info
+
+def daily(day):
+    return {row.status: row.count for row in SchedulingDailyCount.query.filter_by(day=day)}
+
+@pytest.mark.usefixtures("clean")
+def test_counters_follow_orm_changes(app):
+    today = datetime.utcnow().date()
+    with app.app_context():
+        first = schedule("5511900050001")
+        second = schedule("5511900050002")
+        schedule("5511900050003", status="confirmed")
+        db.session.commit()
+        first.status = "confirmed"
+        second.status = "cancelled"
+        db.session.commit()
+        db.session.delete(second)
+        db.session.commit()
+
+        assert scheduling_stats.status_counts() == {"pending": 0, "confirmed": 2, "cancelled": 0}
+        assert {k: v for k, v in scheduling_stats.status_counts().items() if v} == scheduling_stats.live_status_counts()
+        assert daily(today) == {"created": 3, "pending": 2, "confirmed": 2, "cancelled": 1}
+
+@pytest.mark.usefixtures("clean")
+def test_rolled_back_changes_are_not_counted(app):
+    with app.app_context():
+        schedule("5511900050004")
+        db.session.flush()
+        db.session.rollback()
+        assert sum(scheduling_stats.status_counts().values()) == 0
+
+@pytest.mark.usefixtures("clean")
+def test_rebuild_restores_counters_and_daily_series(app):
+    monday = date(2026, 9, 7)
+    with app.app_context():
+        schedule("5511900050005", status="confirmed", created_at=datetime(2026, 9, 7, 10))
+        schedule("5511900050006", status="pending", created_at=datetime(2026, 9, 7, 15))
+        schedule("5511900050007", status="confirmed", created_at=datetime(2026, 9, 9, 11))
+        db.session.commit()
+        # Alterações em massa não passam pelos eventos do ORM
+        db.session.execute(db.update(SchedulingInfo).values(status="confirmed"))
+        SchedulingDailyCount.query.delete()
+        db.session.commit()
+
+        assert scheduling_stats.rebuild_status_counts() == {"confirmed": 3}
+        assert scheduling_stats.status_counts() == {"confirmed": 3}
+        # O status atual conta no dia da criação
+        assert daily(monday) == {"created": 2, "confirmed": 2}
+        assert daily(monday + timedelta(days=2)) == {"created": 1, "confirmed": 1}
+
+        series = scheduling_stats.conversion_series('week', days=7, today=monday + timedelta(days=6))
+        assert series == [{"start": "2026-09-07", "created": 3, "confirmed": 3, "cancelled": 0, "failed": 0,
+                           "conversion_rate": 100.0}]
+
+@pytest.mark.usefixtures("clean")
+def test_conversion_series_fills_empty_days(app):
+    today = date(2026, 9, 10)
+    with app.app_context():
+        db.session.add_all([SchedulingDailyCount(day=today, status="created", count=4),
+                            SchedulingDailyCount(day=today, status="confirmed", count=1),
+                            SchedulingDailyCount(day=today - timedelta(days=2), status="created", count=2)])
+        db.session.commit()
+        series = scheduling_stats.conversion_series('day', days=3, today=today)
+    assert [(point["start"], point["created"], point["conversion_rate"]) for point in series] == [
+        ("2026-09-08", 2, 0), ("2026-09-09", 0, 0), ("2026-09-10", 4, 25.0)]
+    with pytest.raises(ValueError):
+        scheduling_stats.conversion_series('month')
+
+def test_stats_route_validates_parameters(app):
+    client = app.test_client()
+    assert client.get("/api/scheduling/stats?days=abc").status_code == 400
+    assert client.get("/api/scheduling/stats?days=0").status_code == 400
+    assert client.get("/api/scheduling/stats?bucket=month").status_code == 400
+    response = client.get("/api/scheduling/stats?bucket=week&days=14")
+    assert response.status_code == 200
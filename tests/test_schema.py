@@ -0,0 +1,88 @@
+import sqlite3
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import inspect
+from src.database import db
+from src.models.conversation import Conversation, Message, SchedulingInfo
+from src.models.schema_migration import SchemaMigration
+from src.models.scheduling_stats import SchedulingDailyCount
+from src.schema import MIGRATIONS, migrate
+from src import scheduling_stats
+
+# Schema anterior às migrações: telefone sem unicidade, sem version/wamid nos modelos e a fila
+# do webhook ainda sem available_at nem o índice por partição
+LEGACY_SCHEMA = """
+CREATE TABLE conversations (id INTEGER PRIMARY KEY, phone_number VARCHAR(20) NOT NULL, user_name VARCHAR(100),
+    status VARCHAR(20), created_at DATETIME, updated_at DATETIME);
+CREATE INDEX ix_conversations_phone_number ON conversations (phone_number);
+CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL REFERENCES conversations (id),
+    message_type VARCHAR(10) NOT NULL, content TEXT NOT NULL, timestamp DATETIME);
+CREATE TABLE scheduling_info (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL UNIQUE REFERENCES conversations (id),
+    name VARCHAR(100), company VARCHAR(100), preferred_time VARCHAR(200), status VARCHAR(20));
+CREATE TABLE inbound_queue (id INTEGER PRIMARY KEY, partition_key VARCHAR(20), payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL, attempts INTEGER NOT NULL, received_at DATETIME NOT NULL, started_at DATETIME,
+    last_error TEXT);
+INSERT INTO conversations VALUES (1, '5511900060001', NULL, 'active', '2026-10-15 13:00:00', '2026-10-15 13:00:00');
+INSERT INTO conversations VALUES (2, '5511900060001', 'Ana', 'active', '2026-10-15 13:05:00', '2026-10-15 13:05:00');
+INSERT INTO conversations VALUES (3, '5511900060002', 'Bia', 'active', '2026-10-14 12:00:00', '2026-10-14 12:00:00');
+INSERT INTO messages VALUES (1, 1, 'user', 'Oi', '2026-10-15 13:00:00');
+INSERT INTO messages VALUES (2, 2, 'user', 'Quero agendar', '2026-10-15 13:05:00');
+INSERT INTO scheduling_info VALUES (1, 2, 'Ana', 'Cognox', 'amanhã às 10h', 'confirmed');
+INSERT INTO scheduling_info VALUES (2, 3, 'Bia', NULL, 'quando der', 'pending');
+"""
+
+def sqlite_app(path):
+    # Uma segunda aplicação sobre o mesmo db, com outro arquivo; os modelos já foram importados por src.main
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+    return app
+
+def applied(app):
+    with app.app_context():
+        return [version for (version,) in db.session.query(SchemaMigration.version).order_by(SchemaMigration.version)]
+
+def test_fresh_database_records_every_migration(app, tmp_path):
+    fresh = sqlite_app(tmp_path / "fresh.db")
+    migrate(fresh)
+    assert applied(fresh) == [migration.version for migration in MIGRATIONS] == list(range(1, 10))
+    with fresh.app_context():
+        inspector = inspect(db.engine)
+        assert {"version"} <= {column["name"] for column in inspector.get_columns("conversations")}
+        assert {"scheduled_for", "reminded_at", "service_interest", "created_at"} <= {
+            column["name"] for column in inspector.get_columns("scheduling_info")}
+        assert "available_at" in {column["name"] for column in inspector.get_columns("inbound_queue")}
+    # Rodar de novo não reaplica nada
+    migrate(fresh)
+    assert applied(fresh) == list(range(1, 10))
+
+def test_existing_database_is_brought_up_to_date(app, tmp_path):
+    path = tmp_path / "legacy.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(LEGACY_SCHEMA)
+    legacy = sqlite_app(path)
+    migrate(legacy)
+    assert applied(legacy) == list(range(1, 10))
+
+    with legacy.app_context():
+        inspector = inspect(db.engine)
+        indexes = {index["name"]: index for index in inspector.get_indexes("conversations")}
+        assert indexes["ix_conversations_phone_number"]["unique"]
+        assert "ix_inbound_queue_partition_key_id" in {index["name"] for index in inspector.get_indexes("inbound_queue")}
+        assert "ix_scheduling_info_status" in {index["name"] for index in inspector.get_indexes("scheduling_info")}
+
+        # As conversas repetidas do telefone viram a mais antiga, com as mensagens e o agendamento
+        conversation = Conversation.query.filter_by(phone_number="5511900060001").one()
+        assert conversation.id == 1 and conversation.user_name == "Ana"
+        assert [m.content for m in Message.query.filter_by(conversation_id=1).order_by(Message.id)] == [
+            "Oi", "Quero agendar"]
+        meeting = SchedulingInfo.query.filter_by(conversation_id=1).one()
+        # "amanhã às 10h" a partir da criação da conversa (15/10, 10h em Brasília)
+        assert meeting.scheduled_for == datetime(2026, 10, 16, 13, 0)
+        assert SchedulingInfo.query.filter_by(conversation_id=3).one().scheduled_for is None
+
+        assert scheduling_stats.status_counts() == {"confirmed": 1, "pending": 1}
+        # Linhas sem created_at entram na série pelo dia da conversa
+        series = {(row.day.isoformat(), row.status): row.count for row in SchedulingDailyCount.query}
+        assert series == {("2026-10-15", "created"): 1, ("2026-10-15", "confirmed"): 1,
+                          ("2026-10-14", "created"): 1, ("2026-10-14", "pending"): 1}
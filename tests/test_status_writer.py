@@ -0,0 +1,58 @@
+from datetime import datetime
+import pytest
+from src.database import db
+from src.models.message_status import MessageStatus
+from src.status_writer import StatusWriter
+
+T0 = 1767268800  # 2026-01-01 12:00:00 UTC
+
+def status(wamid, state, offset, recipient="5511900001010"):
+    return {"wamid": wamid, "status": state, "timestamp": str(T0 + offset), "recipient_id": recipient}
+
+@pytest.fixture
+def writer(app):
+    writer = StatusWriter(batch_size=2)
+    writer.app = app
+    return writer
+
+def row(app, wamid):
+    with app.app_context():
+        found = db.session.get(MessageStatus, wamid)
+        db.session.expunge_all()
+        return found
+
+def test_events_of_a_wamid_are_merged_before_the_write(app, writer):
+    # Fora de ordem e repetido, como a Meta entrega
+    writer.record_statuses([status("wamid.S1", "read", 30), status("wamid.S1", "delivered", 10),
+                            status("wamid.S1", "delivered", 20), status("wamid.S1", "sent", 5),
+                            status("wamid.S1", "deleted", 40)])
+    assert writer.metrics()["pending"] == 1
+    assert writer.flush() == 1
+    stored = row(app, "wamid.S1")
+    assert (stored.sent_at, stored.delivered_at, stored.read_at) == (
+        datetime(2026, 1, 1, 12, 0, 5), datetime(2026, 1, 1, 12, 0, 10), datetime(2026, 1, 1, 12, 0, 30))
+    assert stored.recipient_id == "5511900001010"
+
+def test_batches_upsert_and_keep_the_first_instant(app, writer):
+    writer.record_dispatch("wamid.S2", "5511900002020", at=datetime(2026, 1, 1, 12, 0, 0))
+    writer.record_statuses([status("wamid.S3", "sent", 1), status("wamid.S4", "failed", 2)])
+    writer.record_statuses([{**status("wamid.S4", "failed", 2), "error_code": "131026"}])
+    # Três wamids em lotes de dois: dois INSERT ... ON CONFLICT
+    assert writer.flush() == 3
+    writer.record_statuses([status("wamid.S2", "delivered", 8), status("wamid.S3", "sent", 50)])
+    assert writer.flush() == 2
+
+    assert row(app, "wamid.S2").dispatched_at == datetime(2026, 1, 1, 12, 0, 0)
+    assert row(app, "wamid.S2").delivered_at == datetime(2026, 1, 1, 12, 0, 8)
+    # Um callback repetido não sobrescreve o instante já gravado
+    assert row(app, "wamid.S3").sent_at == datetime(2026, 1, 1, 12, 0, 1)
+    assert row(app, "wamid.S4").error_code == 131026
+    assert writer.metrics()["written"] == 5
+
+def test_buffer_is_bounded(writer):
+    writer.max_buffer = 2
+    writer.record_statuses([status(f"wamid.B{n}", "sent", n) for n in range(3)])
+    # Eventos de um wamid já acumulado ainda entram
+    writer.record_statuses([status("wamid.B0", "delivered", 9)])
+    assert writer.metrics()["pending"] == 2
+    assert writer.metrics()["dropped"] == 1
@@ -0,0 +1,20 @@
+import json
+import os
+from datetime import datetime
+import pytest
+from src.time_parser import parse_many, parse_time_expression
+
+GOLDEN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      "benchmarks", "time_parser_golden.json")
+
+with open(GOLDEN, encoding="utf-8") as golden:
+    CORPUS = json.load(golden)
+NOW = datetime.fromisoformat(CORPUS["now"])
+
+@pytest.mark.parametrize("case", CORPUS["cases"], ids=[case["text"] for case in CORPUS["cases"]])
+def test_golden_case(case):
+    assert parse_time_expression(case["text"], NOW) == case["expected"]
+
+def test_batch_matches_one_by_one():
+    texts = [case["text"] for case in CORPUS["cases"]]
+    assert parse_many(texts, NOW) == [case["expected"] for case in CORPUS["cases"]]
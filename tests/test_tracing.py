@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.outbound_engine import OutboundEngine
+from src.tracing import TRACE_HEADER, Tracer, tracer
+
+class Response:
+    status_code = 200
+    ok = True
+
+    def json(self):
+        return {"messages": [{"id": "wamid.trace"}]}
+
+def test_ids_are_isolated_per_thread_and_restored():
+    tracer = Tracer()
+    seen = {}
+
+    def worker(name):
+        with tracer.activate([name]):
+            barrier.wait()
+            seen[name] = tracer.current_id()
+
+    barrier = threading.Barrier(3)
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ("a", "b", "c")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == {"a": "a", "b": "b", "c": "c"}
+    with tracer.activate(["x", None, "y", "x"]):
+        assert tracer.current_ids() == ("x", "y")
+    assert tracer.current_id() is None
+
+def test_run_with_carries_ids_into_an_executor():
+    tracer = Tracer()
+    with ThreadPoolExecutor(max_workers=1) as executor, tracer.activate(["t1"]):
+        # Executors não copiam o contexto: sem run_with o id se perderia
+        assert executor.submit(tracer.current_id).result() is None
+        assert executor.submit(tracer.run_with, tracer.current_ids(), tracer.current_id).result() == "t1"
+
+def test_spans_are_recorded_in_every_active_sampled_trace():
+    tracer = Tracer(sample_rate=1.0)
+    first, second = tracer.new_trace_id(), tracer.new_trace_id()
+    with tracer.activate([first, second]):
+        with tracer.span("llm_total", batch=2):
+            pass
+    for trace_id in (first, second):
+        spans = tracer.get(trace_id)["spans"]
+        assert [(span["name"], span["attributes"]) for span in spans] == [("llm_total", {"batch": 2})]
+    unsampled = Tracer(sample_rate=0.0).new_trace_id()
+    assert tracer.get(unsampled) is None
+
+def test_incoming_id_is_accepted_only_if_safe():
+    tracer = Tracer()
+    assert tracer.new_trace_id("req-123") == "req-123"
+    generated = tracer.new_trace_id("id com espaço\n")
+    assert len(generated) == 32 and generated.isalnum()
+
+def test_outbound_send_carries_the_trace_id():
+    seen = []
+    engine = OutboundEngine(lambda method, endpoint, data: seen.append(tracer.current_id()) or Response())
+    try:
+        with tracer.activate(["conversa1"]):
+            future = engine.submit("PN1", "PN1/messages", {"to": "5511900000000"})
+        assert future.result(timeout=5) == {"messages": [{"id": "wamid.trace"}]}
+    finally:
+        engine.shutdown()
+    assert seen == ["conversa1"]
+
+def test_webhook_echoes_the_request_id(app):
+    client = app.test_client()
+    body = {"object": "whatsapp_business_account", "entry": []}
+    response = client.post("/api/whatsapp/webhook", json=body, headers={TRACE_HEADER: "req-abc"})
+    assert response.status_code == 200
+    assert response.headers[TRACE_HEADER] == "req-abc"
+    generated = client.post("/api/whatsapp/webhook", json=body).headers[TRACE_HEADER]
+    assert len(generated) == 32
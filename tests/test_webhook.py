@@ -0,0 +1,82 @@
+import threading
+import time
+import pytest
+from benchmarks.load_test import text_message, webhook
+from src.database import db
+from src.dedup import wamid_filter
+from src.models.conversation import Conversation, Message
+from src.models.inbound_queue import InboundQueueItem
+from src.routes.whatsapp import inbound_pool
+
+URL = "/api/whatsapp/webhook"
+
+@pytest.fixture(scope="module")
+def workers(app):
+    inbound_pool.start(app)
+    yield inbound_pool
+    inbound_pool.shutdown()
+
+def messages(app, phone):
+    with app.app_context():
+        rows = (db.session.query(Message.message_type, Message.content)
+                .join(Conversation, Message.conversation_id == Conversation.id)
+                .filter(Conversation.phone_number == phone).order_by(Message.id).all())
+        db.session.commit()
+        return [tuple(row) for row in rows]
+
+def queued(app, phone):
+    with app.app_context():
+        count = InboundQueueItem.query.filter_by(partition_key=phone).count()
+        db.session.commit()
+        return count
+
+def post(app, phone, wamid, text):
+    return app.test_client().post(URL, json=webhook(phone, [text_message(phone, wamid, text)])).status_code
+
+def test_concurrent_replay_is_stored_and_answered_once(app, inbox, workers, wait_until):
+    phone = "5511933332222"
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(post(app, phone, "wamid.REPLAY1", "Oi")))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # A Meta só para de reenviar com o 200, inclusive nas reentregas descartadas
+    assert statuses == [200] * 8
+    assert wait_until(lambda: len(messages(app, phone)) == 2 and queued(app, phone) == 0)
+    time.sleep(0.5)
+    stored = messages(app, phone)
+    assert [kind for kind, _ in stored] == ["user", "assistant"]
+    assert inbox.texts(phone) == stored[1][1].split("\n")
+
+    # Reentrega vista por um processo que não a tem no filtro em memória: a constraint de wamid barra
+    suppressed = wamid_filter.stats()["suppressed_by_database"]
+    wamid_filter.release(["wamid.REPLAY1"])
+    assert post(app, phone, "wamid.REPLAY1", "Oi") == 200
+    assert wait_until(lambda: wamid_filter.stats()["suppressed_by_database"] == suppressed + 1
+                      and queued(app, phone) == 0)
+    assert messages(app, phone) == stored
+    assert inbox.texts(phone) == stored[1][1].split("\n")
+
+def test_new_message_cancels_the_streamed_reply(app, inbox, workers, wait_until):
+    phone = "5511911110000"
+    assert post(app, phone, "wamid.CANCEL1", "Oi") == 200
+    assert wait_until(lambda: len(messages(app, phone)) == 2)
+    # A resposta é gravada antes de as bolhas agendadas saírem
+    greeting = messages(app, phone)[1][1].split("\n")
+    assert wait_until(lambda: inbox.texts(phone) == greeting)
+
+    # A resposta sai parágrafo a parágrafo (LOCAL_LLM_PARAGRAPHS=4); a mensagem nova chega depois da primeira bolha
+    assert post(app, phone, "wamid.CANCEL2", "Quais serviços vocês oferecem?") == 200
+    assert wait_until(lambda: len(inbox.texts(phone)) > len(greeting))
+    assert post(app, phone, "wamid.CANCEL3", "E quanto custa?") == 200
+    assert wait_until(lambda: len(messages(app, phone)) == 6 and queued(app, phone) == 0, timeout=20)
+
+    stored = messages(app, phone)
+    assert [kind for kind, _ in stored] == ["user", "assistant"] * 3
+    interrupted, last = stored[3][1].split("\n"), stored[5][1].split("\n")
+    assert 1 <= len(interrupted) < 4
+    assert len(last) == 4
+    # O histórico guarda só o que o usuário recebeu
+    assert inbox.texts(phone) == greeting + interrupted + last
@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+import pytest
+from src.database import db
+from src.models.inbound_queue import InboundQueueItem
+from src.worker_pool import RetryLater, WorkerPool
+
+pytestmark = pytest.mark.usefixtures("empty_queue")
+
+class Recorder:
+    """
+    Handler do pool que registra a ordem de processamento por remetente e detecta duas
+    threads processando o mesmo remetente ao mesmo tempo.
+    """
+
+    def __init__(self, fail_times=None, delay=0.0):
+        self.seen = {}
+        self.calls = []
+        self.overlaps = 0
+        self._active = set()
+        self._lock = threading.Lock()
+        # (remetente, seq) -> quantas vezes o handler ainda falha ao receber o item
+        self._fail = dict(fail_times or {})
+        self.delay = delay
+
+    def __call__(self, app, payloads):
+        senders = {payload["sender"] for payload in payloads}
+        with self._lock:
+            if self._active & senders:
+                self.overlaps += 1
+            self._active |= senders
+            self.calls += [(payload["sender"], payload["seq"], payload["messages"][0]["attempt"]) for payload in payloads]
+        try:
+            if self.delay:
+                time.sleep(random.uniform(0, self.delay))
+            with self._lock:
+                failing = [key for key in ((payload["sender"], payload["seq"]) for payload in payloads)
+                           if self._fail.get(key, 0) > 0]
+                for key in failing:
+                    self._fail[key] -= 1
+            if failing:
+                raise RuntimeError(f"falha simulada em {failing}")
+            with self._lock:
+                for payload in payloads:
+                    self.seen.setdefault(payload["sender"], []).append(payload["seq"])
+        finally:
+            with self._lock:
+                self._active -= senders
+
+    def total(self):
+        with self._lock:
+            return sum(len(seqs) for seqs in self.seen.values())
+
+def payload(sender, seq):
+    return {"sender": sender, "seq": seq, "messages": [{"wamid": f"wamid.{sender}.{seq}"}]}
+
+def start_pool(app, handler, **kwargs):
+    pool = WorkerPool(handler, **kwargs)
+    pool.start(app)
+    return pool
+
+def remaining(app):
+    with app.app_context():
+        rows = db.session.query(InboundQueueItem.status, InboundQueueItem.attempts).all()
+        db.session.commit()
+        return rows
+
+def test_same_sender_is_processed_in_arrival_order(app, wait_until):
+    handler = Recorder(delay=0.01)
+    pool = start_pool(app, handler, size=4, batch_size=3)
+    senders = [f"55119{n:07d}" for n in range(6)]
+    try:
+        with app.app_context():
+            for seq in range(10):
+                pool.enqueue_many([(sender, payload(sender, seq)) for sender in senders])
+        assert wait_until(lambda: handler.total() == len(senders) * 10)
+    finally:
+        pool.shutdown()
+    assert handler.overlaps == 0
+    assert handler.seen == {sender: list(range(10)) for sender in senders}
+    assert remaining(app) == []
+
+def test_order_holds_across_pools_sharing_the_queue(app, wait_until):
+    # Dois pools sobre a mesma tabela fazem o papel de dois workers gunicorn
+    handler = Recorder(delay=0.01)
+    pools = [start_pool(app, handler, size=2), start_pool(app, handler, size=2)]
+    sender = "5511988887777"
+    try:
+        with app.app_context():
+            for seq in range(12):
+                pools[seq % 2].enqueue(sender, payload(sender, seq))
+        assert wait_until(lambda: handler.total() == 12)
+    finally:
+        for pool in pools:
+            pool.shutdown()
+    assert handler.overlaps == 0
+    assert handler.seen[sender] == list(range(12))
+
+def test_failed_item_is_retried_after_backoff(app, wait_until):
+    sender = "5511977776666"
+    handler = Recorder(fail_times={(sender, 0): 1})
+    pool = start_pool(app, handler, size=1)
+    pool.retry_backoff = 0.2
+    try:
+        with app.app_context():
+            pool.enqueue(sender, payload(sender, 0))
+        assert wait_until(lambda: handler.total() == 1)
+    finally:
+        pool.shutdown()
+    # A nova tentativa chega ao handler marcada, para que o pipeline saiba que é um reprocessamento
+    assert handler.calls == [(sender, 0, 1), (sender, 0, 2)]
+    assert pool.metrics()["failed"] == 1
+    assert remaining(app) == []
+
+def test_retry_keeps_later_items_of_the_sender_waiting(app, wait_until):
+    sender, other = "5511966665555", "5511955554444"
+    handler = Recorder(fail_times={(sender, 0): 1})
+    pool = start_pool(app, handler, size=2, batch_size=1)
+    pool.retry_backoff = 0.2
+    try:
+        with app.app_context():
+            pool.enqueue_many([(sender, payload(sender, 0)), (sender, payload(sender, 1)), (other, payload(other, 0))])
+        assert wait_until(lambda: handler.total() == 3)
+    finally:
+        pool.shutdown()
+    # O item 1 só é processado depois que o 0, devolvido à fila com backoff, dá certo
+    assert [(seq, attempt) for key, seq, attempt in handler.calls if key == sender] == [(0, 1), (0, 2), (1, 1)]
+    assert handler.seen == {sender: [0, 1], other: [0]}
+
+def test_item_is_failed_after_max_attempts(app, wait_until):
+    sender = "5511944443333"
+    handler = Recorder(fail_times={(sender, 0): 10})
+    pool = start_pool(app, handler, size=1, max_attempts=2)
+    pool.retry_backoff = 0.05
+    try:
+        with app.app_context():
+            pool.enqueue(sender, payload(sender, 0))
+        assert wait_until(lambda: remaining(app) == [("failed", 2)])
+    finally:
+        pool.shutdown()
+    assert handler.calls == [(sender, 0, 1), (sender, 0, 2)]
+
+def test_retry_later_waits_at_least_the_suggested_delay(app, wait_until):
+    sender = "5511933332211"
+    attempts = []
+
+    def handler(app, payloads):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            # Ex.: LLM fora do ar com Retry-After; a thread do worker não dorme, o item volta à fila
+            raise RetryLater("indisponível", delay=0.5)
+
+    pool = start_pool(app, handler, size=1)
+    pool.retry_backoff = 0.05
+    try:
+        with app.app_context():
+            pool.enqueue(sender, payload(sender, 0))
+        assert wait_until(lambda: len(attempts) == 2 and remaining(app) == [])
+    finally:
+        pool.shutdown()
+    assert attempts[1] - attempts[0] >= 0.45